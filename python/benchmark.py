@@ -0,0 +1,214 @@
+# benchmark.py
+# Reproducible throughput benchmarks of the readers and converters on synthetic .wfm files.
+# Every stage runs in a fresh (spawned) process, so the header cache, imports and peak RSS
+# of one measurement do not leak into the next one. Files are read with a warm page cache.
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import click
+from wfmwrite import write_wfm, synthetic_frames
+
+
+STAGES = ("wfm2readframe", "read_frames", "iter_frame_blocks", "wfmread", "write_to_root", "save_to_corry")
+FORMATS = {"int8": np.int8, "int16": np.int16, "int32": np.int32, "float32": np.float32}
+# the per-frame reader is timed on at most this many frames
+PER_FRAME_LIMIT = 2000
+
+
+def _peak_rss_mb():
+    # VmHWM is reset by exec, ru_maxrss keeps the peak of the parent the worker was forked from
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / 1024**2 if sys.platform == "darwin" else rss / 1024
+
+
+def _run_stage(stage, case_dir, wfm_path, n_frames):
+    """
+    Body of one measurement, executed in its own process.
+    Returns a dict with the processed frames, the elapsed time and the peak RSS of the process.
+    """
+    # every stage processes the same frames: 1..n_frames, the events the converters store
+    # (the file holds n_frames + 1 frames, the converters skip the last one)
+    frames = n_frames
+    selection = slice(1, n_frames + 1)
+    start = None
+    if stage == "wfm2readframe":
+        from wfm2readframe import wfm2readframe
+        frames = min(frames, PER_FRAME_LIMIT)
+        start = time.perf_counter()
+        for frame in range(1, frames + 1):
+            wfm2readframe(wfm_path, frame)
+    elif stage == "read_frames":
+        from wfm2readframe import read_frames
+        start = time.perf_counter()
+        y = read_frames(wfm_path, selection)[0]
+        frames = len(y)
+    elif stage == "iter_frame_blocks":
+        from wfm2readframe import iter_frame_blocks
+        start = time.perf_counter()
+        frames = sum(len(block) for block, _ in iter_frame_blocks(wfm_path, selection))
+    elif stage == "wfmread":
+        from wfmread import wfmread
+        start = time.perf_counter()
+        # frames is lazy: decode them all, as the eager reader did
+        frames = len(np.asarray(wfmread(wfm_path).frames[:n_frames]))
+    elif stage == "write_to_root":
+        import write_to_root
+        start = time.perf_counter()
+        write_to_root.main(["-i", case_dir, "-o", case_dir, "-c", "1", "--condor"], standalone_mode=False)
+    elif stage == "save_to_corry":
+        import save_to_corry
+        root_path = os.path.join(case_dir, "more_waveforms_ch1.root")
+        if not os.path.exists(root_path):
+            raise FileNotFoundError(f"{root_path} (run the write_to_root stage first)")
+        start = time.perf_counter()
+        save_to_corry.main(["-i", root_path, "-o", os.path.join(case_dir, "corry.root")], standalone_mode=False)
+    else:
+        raise ValueError(f"Unknown stage {stage}")
+    elapsed = time.perf_counter() - start
+    return {"frames": int(frames), "seconds": elapsed, "peak_rss_mb": _peak_rss_mb()}
+
+
+def run_isolated(stage, case_dir, wfm_path, n_frames):
+    """Run one stage in a fresh spawned process. Returns its result dict, or status 'skipped'/'error'."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        try:
+            result = pool.submit(_run_stage, stage, case_dir, wfm_path, n_frames).result()
+        except ImportError as e:
+            return {"status": "skipped", "reason": f"{type(e).__name__}: {e}"}
+        except Exception as e:
+            return {"status": "error", "reason": f"{type(e).__name__}: {e}"}
+    result["status"] = "ok"
+    return result
+
+
+def build_cases(suite, nop, max_frames):
+    """
+    Benchmark cases (name, version, format, frames), where frames is the number of events every stage processes:
+      - "formats": every version (1-3) and sample format at 1000 frames (int8 only exists in version 3)
+      - "frames": version 3 int16 from 1 to 100k frames
+    """
+    cases = []
+    if suite in ("formats", "all"):
+        for version in (1, 2, 3):
+            for fmt in FORMATS:
+                if fmt == "int8" and version < 3:
+                    continue
+                cases.append((f"v{version}_{fmt}_1000", version, fmt, 1000))
+    if suite in ("frames", "all"):
+        for n_frames in (1, 100, 10_000, 100_000):
+            cases.append((f"v3_int16_{n_frames}", 3, "int16", n_frames))
+    return [case for case in cases if case[3] <= max_frames]
+
+
+def environment():
+    """Description of the machine and code under test, stored with the results."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, baseline_path):
+    """Print the frames/s ratio of every (case, stage) also present in the baseline results."""
+    with open(baseline_path) as f:
+        baseline = {(r["case"], r["stage"]): r for r in json.load(f)["results"] if r.get("status") == "ok"}
+    print(f"\nComparison with {baseline_path} (frames/s ratio, > 1 is faster):")
+    for r in results:
+        old = baseline.get((r["case"], r["stage"]))
+        if r.get("status") != "ok" or old is None or not old["frames_per_s"]:
+            continue
+        ratio = r["frames_per_s"] / old["frames_per_s"]
+        flag = "  <-- regression" if ratio < 0.9 else ""
+        print(f"{r['case']:>18} {r['stage']:>18}: {ratio:6.2f}x{flag}")
+
+
+@click.command()
+@click.option('-o', '--output', type=click.Path(), default="benchmark_results.json", show_default=True,
+              help="JSON file with the results")
+@click.option('--suite', type=click.Choice(["formats", "frames", "all"]), default="all", show_default=True)
+@click.option('--stages', default=",".join(STAGES), show_default=True, help="Comma separated stages to time")
+@click.option('--nop', type=int, default=1000, show_default=True, help="Samples per frame")
+@click.option('--max-frames', type=int, default=100_000, show_default=True, help="Skip cases with more frames")
+@click.option('--workdir', type=click.Path(), default=None, help="Where to write the synthetic files (default: temporary)")
+@click.option('--keep', is_flag=True, help="Keep the synthetic files and outputs")
+@click.option('--compare', 'baseline', type=click.Path(exists=True), default=None,
+              help="Previous results JSON to compare against")
+def main(output, suite, stages, nop, max_frames, workdir, keep, baseline):
+    """
+    Generate synthetic .wfm files and time the readers and converters on them:
+    frames/s, MB/s (of .wfm input) and peak RSS of every stage, saved as JSON.
+    Stages that need a missing dependency (e.g. ROOT) are reported as skipped.
+    """
+    stages = [s.strip() for s in stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise click.BadParameter(f"Unknown stages {sorted(unknown)}, available: {', '.join(STAGES)}")
+    root = workdir or tempfile.mkdtemp(prefix="wfm_bench_")
+    results = []
+    try:
+        for name, version, fmt, n_frames in build_cases(suite, nop, max_frames):
+            # run_<n> in the path: write_to_root takes the run number from the folder name
+            case_dir = os.path.join(root, "run_0", name)
+            os.makedirs(case_dir, exist_ok=True)
+            wfm_path = os.path.join(case_dir, "cycle_0001_ch1.wfm")
+            # n_frames events: frames 1..n_frames of a file of n_frames + 1 frames
+            samples, y_scale, y_offset = synthetic_frames(n_frames + 1, nop, FORMATS[fmt], seed=n_frames)
+            write_wfm(wfm_path, samples, version=version, y_scale=y_scale, y_offset=y_offset,
+                      t_scale=1e-11, precharge=16, postcharge=16, timestamps=1.7e9 + 1e-3 * np.arange(n_frames + 1))
+            del samples
+            size = os.path.getsize(wfm_path)
+            frame_mb = size / (n_frames + 1) / 1024**2
+
+            for stage in stages:
+                r = run_isolated(stage, case_dir, wfm_path, n_frames)
+                r.update({"case": name, "stage": stage, "version": version, "format": fmt,
+                          "n_frames": n_frames, "nop": nop, "file_bytes": size})
+                if r["status"] == "ok":
+                    r["frames_per_s"] = r["frames"] / r["seconds"] if r["seconds"] > 0 else None
+                    r["mb_per_s"] = r["frames"] * frame_mb / r["seconds"] if r["seconds"] > 0 else None
+                    print(f"{name:>18} {stage:>18}: {r['frames']:>7} frames in {r['seconds']:8.3f} s, "
+                          f"{r['frames_per_s'] or 0:12.1f} frames/s, {r['mb_per_s'] or 0:9.1f} MB/s, "
+                          f"peak RSS {r['peak_rss_mb']:8.1f} MB")
+                else:
+                    print(f"{name:>18} {stage:>18}: {r['status']} ({r['reason']})")
+                results.append(r)
+    finally:
+        if not keep and workdir is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    with open(output, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+    print(f"Results written to {output}")
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
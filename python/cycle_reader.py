@@ -0,0 +1,132 @@
+# cycle_reader.py
+# Synchronized reader for the cycle_XXXX_chN.wfm files written by the scope for each acquisition cycle
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from wfm2readframe import WfmFile, WfmReadError, DEFAULT_BLOCK_BYTES
+
+
+class CycleReader:
+    """
+    Opens all the channel files of one cycle (prefix_ch1.wfm, prefix_ch2.wfm, ...) once
+    and yields aligned (channels, samples) events or (channels, frames, samples) blocks.
+
+    All channels must agree on number of frames, record length and sample rate.
+    The channels of each block are read and decoded concurrently on a thread pool
+    (file reads and NumPy conversions release the GIL).
+    """
+    def __init__(self, prefix, channels=(1, 2, 3, 4), max_workers=None):
+        self.prefix = os.fspath(prefix)
+        self.channels = tuple(int(ch) for ch in channels)
+        if not self.channels:
+            raise ValueError("At least one channel is needed.")
+        self.files = {}
+        try:
+            for ch in self.channels:
+                self.files[ch] = WfmFile(f"{self.prefix}_ch{ch}.wfm")
+            self._check_consistency()
+        except Exception:
+            self.close()
+            raise
+
+        first = self.files[self.channels[0]]
+        self.n_frames = first.n_frames
+        self.nop = first.nop
+        self.time = first.time
+        self.samplingrate = first.info['samplingrate']
+        self.calibration = {ch: wfm.calibration for ch, wfm in self.files.items()}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or len(self.channels))
+
+    def _check_consistency(self):
+        ref_ch = self.channels[0]
+        ref = self.files[ref_ch]
+        for ch in self.channels[1:]:
+            wfm = self.files[ch]
+            if wfm.n_frames != ref.n_frames:
+                raise WfmReadError(f"{wfm.filename} has {wfm.n_frames} frames but ch{ref_ch} has {ref.n_frames}")
+            if wfm.nop != ref.nop:
+                raise WfmReadError(f"{wfm.filename} has {wfm.nop} samples per frame but ch{ref_ch} has {ref.nop}")
+            if wfm.info['samplingrate'] != ref.info['samplingrate']:
+                raise WfmReadError(f"{wfm.filename} sample rate {wfm.info['samplingrate']} differs from "
+                                   f"ch{ref_ch} ({ref.info['samplingrate']})")
+
+    def _out_dtype(self, raw):
+        if not raw:
+            return np.float64
+        dtypes = {wfm.dtype.newbyteorder('=') for wfm in self.files.values()}
+        if len(dtypes) != 1:
+            raise WfmReadError(f"raw=True needs the same sample format in all channels, found {sorted(map(str, dtypes))}")
+        return dtypes.pop()
+
+    def __len__(self):
+        return self.n_frames
+
+    def read(self, frames=None, raw=False):
+        """
+        Read the selected frames (1-based frame numbers, as in read_frames) of all channels.
+        Returns: data (channels, n_sel, samples), time
+        """
+        results = list(self._pool.map(lambda wfm: wfm.read(frames, raw=raw)[0], self.files.values()))
+        return np.stack(results), self.time
+
+    def iter_blocks(self, frames=None, block_frames=None, max_bytes=DEFAULT_BLOCK_BYTES, raw=False):
+        """
+        Generator of aligned blocks with bounded memory.
+        Yields: block (channels, k, samples), frame numbers (k,)
+        max_bytes is the budget for all channels together.
+        """
+        ref = self.files[self.channels[0]]
+        rows = ref._frame_rows(frames if frames is not None else slice(None))
+        if not isinstance(rows, slice):
+            raise ValueError("iter_blocks only accepts a contiguous slice of frames.")
+        start, stop, stride = rows.indices(self.n_frames)
+        if stride != 1:
+            raise ValueError("iter_blocks only accepts slices with step 1.")
+
+        out_dtype = np.dtype(self._out_dtype(raw))
+        if block_frames is None:
+            per_frame = sum(max(wfm.frame_bytes, wfm.nop * wfm.dtype.itemsize) + wfm.nop * out_dtype.itemsize
+                            for wfm in self.files.values())
+            block_frames = max(1, int(max_bytes // max(per_frame, 1)))
+        block_frames = int(block_frames)
+        if block_frames < 1:
+            raise ValueError("block_frames must be a positive integer.")
+
+        handles = [open(wfm.filename, 'rb') for wfm in self.files.values()]
+        try:
+            buffers = [bytearray((min(block_frames, max(stop - start, 1)) - 1) * wfm.frame_bytes + wfm.nop * wfm.dtype.itemsize)
+                       for wfm in self.files.values()]
+            for first in range(start, stop, block_frames):
+                k = min(block_frames, stop - first)
+                block = np.empty((len(self.channels), k, self.nop), dtype=out_dtype)
+                jobs = [self._pool.submit(wfm._read_block, f, first, k, buf, block[i], raw)
+                        for i, (wfm, f, buf) in enumerate(zip(self.files.values(), handles, buffers))]
+                for job in jobs:
+                    job.result()
+                yield block, np.arange(first + 1, first + k + 1)
+        finally:
+            for f in handles:
+                f.close()
+
+    def iter_events(self, frames=None, block_frames=None, max_bytes=DEFAULT_BLOCK_BYTES, raw=False):
+        """
+        Generator of aligned events.
+        Yields: frame number, event (channels, samples)
+        """
+        for block, frame_numbers in self.iter_blocks(frames, block_frames, max_bytes, raw):
+            for i, frame in enumerate(frame_numbers):
+                yield int(frame), block[:, i, :]
+
+    def close(self):
+        pool = getattr(self, '_pool', None)
+        if pool is not None:
+            pool.shutdown(wait=True)
+            self._pool = None
+        for wfm in self.files.values():
+            wfm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,147 @@
+# decimate.py
+# Decimation for plotting: pixel-resolution min/max (or LTTB) envelopes of long records computed in a
+# streaming pass over the memory-mapped samples, and per-event extrema computed block by block,
+# so the quick-look plots take bounded memory whatever the record length or number of frames.
+import numpy as np
+from wfm2readframe import WfmFile, calibrate, calibrated_extrema, DEFAULT_BLOCK_BYTES
+
+# points per plotted trace, about the width of a figure in pixels
+DEFAULT_BINS = 2000
+# samples read from the memory map at a time by the streaming envelopes
+ENVELOPE_CHUNK_SAMPLES = 1 << 22
+
+
+def _bin_edges(n, n_bins):
+    """Sample indices of the edges of min(n_bins, n) bins of (almost) equal size over n samples."""
+    return np.linspace(0, n, min(int(n_bins), n) + 1).astype(np.int64)
+
+
+def minmax_envelope(y, n_bins=DEFAULT_BINS):
+    """
+    Min and max of the last axis of y in n_bins bins (a plot of both is pixel-exact when
+    n_bins is about the plot width). Bins are never empty, records shorter than n_bins are kept.
+    Returns: lo, hi (..., n_bins) and the bin edges (n_bins + 1,) as sample indices.
+    """
+    y = np.asarray(y)
+    edges = _bin_edges(y.shape[-1], n_bins)
+    if len(edges) < 2:
+        empty = y[..., :0]
+        return empty, empty, edges
+    lo = np.minimum.reduceat(y, edges[:-1], axis=-1)
+    hi = np.maximum.reduceat(y, edges[:-1], axis=-1)
+    return lo, hi, edges
+
+
+def lttb(x, y, n_out=DEFAULT_BINS):
+    """
+    Largest-Triangle-Three-Buckets downsampling of the points (x, y) to n_out points.
+    Keeps the first and the last point, and in every bucket the point forming the largest triangle
+    with the previously kept point and the mean of the next bucket.
+    Returns: the indices of the kept points.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # n_out - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        mean_x = x[stop:next_stop].mean()
+        mean_y = y[stop:next_stop].mean()
+        # twice the triangle area, up to the sign
+        area = np.abs((x[a] - mean_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (mean_y - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def _chunks(edges, chunk_samples):
+    """Groups of whole bins [b0, b1) of at most chunk_samples samples (at least one bin each)."""
+    b0, n_bins = 0, len(edges) - 1
+    while b0 < n_bins:
+        b1 = int(np.searchsorted(edges, edges[b0] + chunk_samples, side='right')) - 1
+        b1 = min(max(b1, b0 + 1), n_bins)
+        yield b0, b1
+        b0 = b1
+
+
+def _frame_row(wfm, frame):
+    """Raw samples of one frame (1-based, as in wfm2readframe) of a WfmFile."""
+    if not 1 <= frame <= wfm.n_frames:
+        raise ValueError(f"Frame number {frame} does not exist in file {wfm.filename} (frames 1 to {wfm.n_frames})")
+    return wfm.raw[frame - 1]
+
+
+def frame_envelope(wfm, frame, n_bins=DEFAULT_BINS, chunk_samples=ENVELOPE_CHUNK_SAMPLES):
+    """
+    Calibrated min/max envelope of one frame (1-based, as in wfm2readframe) of a WfmFile.
+    The record is reduced on the raw samples in chunks of chunk_samples straight from the memory map,
+    so memory does not depend on the record length.
+    Returns: t (n_bins,) start time of every bin, lo, hi (n_bins,)
+    """
+    row = _frame_row(wfm, frame)
+    edges = _bin_edges(len(row), n_bins)
+    lo = np.empty(len(edges) - 1, dtype=row.dtype)
+    hi = np.empty(len(edges) - 1, dtype=row.dtype)
+    for b0, b1 in _chunks(edges, chunk_samples):
+        chunk = row[edges[b0]:edges[b1]]
+        lo[b0:b1] = np.minimum.reduceat(chunk, edges[b0:b1] - edges[b0])
+        hi[b0:b1] = np.maximum.reduceat(chunk, edges[b0:b1] - edges[b0])
+    lo, hi = calibrate(lo, wfm.calibration), calibrate(hi, wfm.calibration)
+    if wfm.calibration[0] < 0:
+        lo, hi = hi, lo
+    return wfm.time[edges[:-1]], lo, hi
+
+
+def frame_lttb(wfm, frame, n_out=DEFAULT_BINS, chunk_samples=ENVELOPE_CHUNK_SAMPLES):
+    """
+    LTTB downsampling of one frame (1-based) of a WfmFile to about n_out points, chunk by chunk
+    (each chunk gets its share of the points, so only one chunk is calibrated at a time).
+    Returns: t, y of the kept points
+    """
+    row = _frame_row(wfm, frame)
+    n = len(row)
+    t_out, y_out = [], []
+    for start in range(0, n, chunk_samples):
+        stop = min(start + chunk_samples, n)
+        y = calibrate(row[start:stop], wfm.calibration)
+        t = wfm.time[start:stop]
+        kept = lttb(t, y, max(3, round(n_out * (stop - start) / n)))
+        t_out.append(t[kept])
+        y_out.append(y[kept])
+    if not t_out:
+        return np.empty(0), np.empty(0)
+    return np.concatenate(t_out), np.concatenate(y_out)
+
+
+def event_extrema(reader, frames=None, max_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Calibrated min and max of every selected frame, computed block by block on the raw samples
+    (memory bounded by max_bytes). reader is a WfmFile or a cycle_reader.CycleReader;
+    frames a contiguous slice of frame numbers, as in iter_blocks.
+    Returns: frame numbers, ymin, ymax ((frames,) for a WfmFile, (channels, frames) for a CycleReader)
+    """
+    single = isinstance(reader, WfmFile)
+    numbers, ymin, ymax = [], [], []
+    for block, rows in reader.iter_blocks(frames, max_bytes=max_bytes, raw=True):
+        if single:
+            numbers.append(rows['frame'])
+            lo, hi, _, _ = calibrated_extrema(block, reader.calibration, axis=1)
+        else:
+            numbers.append(rows)
+            extrema = [calibrated_extrema(block[i], reader.calibration[ch], axis=1)
+                       for i, ch in enumerate(reader.channels)]
+            lo = np.stack([e[0] for e in extrema])
+            hi = np.stack([e[1] for e in extrema])
+        ymin.append(lo)
+        ymax.append(hi)
+    if not numbers:
+        shape = (0,) if single else (len(reader.channels), 0)
+        return np.empty(0, dtype=np.int64), np.empty(shape), np.empty(shape)
+    return np.concatenate(numbers), np.concatenate(ymin, axis=-1), np.concatenate(ymax, axis=-1)
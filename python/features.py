@@ -0,0 +1,115 @@
+# features.py
+# Vectorized per-event features computed over a whole (k, samples) block of waveforms in one NumPy pass
+import numpy as np
+from wfm2readframe import calibrated_extrema, to_raw
+
+
+# feature name -> dtype of its scalar branch
+FEATURE_DTYPES = {
+    "min_voltage": np.float32,         # minimum of the waveform
+    "min_time": np.float32,            # time of the minimum
+    "argmin": np.int32,                # sample index of the minimum
+    "max_voltage": np.float32,         # maximum of the waveform
+    "max_time": np.float32,            # time of the maximum
+    "argmax": np.int32,                # sample index of the maximum
+    "pedestal": np.float32,            # mean in the pedestal window
+    "pedestal_rms": np.float32,        # standard deviation in the pedestal window
+    "integral": np.float32,            # pedestal-subtracted integral (V*s) over the integral window
+    "threshold_crossing": np.int32,    # first sample beyond the threshold (-1 if none)
+}
+
+DEFAULT_FEATURES = ("min_voltage", "min_time")
+
+
+def parse_features(text):
+    """
+    Parse a comma separated list of feature names ("all" selects every feature).
+    """
+    if text is None or text.strip() == "":
+        return DEFAULT_FEATURES
+    if text.strip() == "all":
+        return tuple(FEATURE_DTYPES)
+    names = tuple(name.strip() for name in text.split(",") if name.strip())
+    unknown = [name for name in names if name not in FEATURE_DTYPES]
+    if unknown:
+        raise ValueError(f"Unknown features {unknown}, available: {list(FEATURE_DTYPES)}")
+    return names
+
+
+def parse_window(text):
+    """
+    Parse a sample window "start:stop" (stop may be empty for the end of the record).
+    """
+    if text is None:
+        return None
+    start, _, stop = text.partition(":")
+    return int(start or 0), (int(stop) if stop else None)
+
+
+def compute_features(block, time, features=DEFAULT_FEATURES, calibration=None,
+                     pedestal_window=(0, 100), integral_window=None, threshold=None, polarity="negative"):
+    """
+    Compute per-event features of a block of waveforms.
+
+    block: (k, samples) calibrated float waveforms, or raw ADC integers if calibration=(scale, offset)
+           is given (reductions then run on the integers and only the results are scaled)
+    time: time axis of the samples
+    pedestal_window, integral_window: (start, stop) sample ranges (stop None = end of record)
+    threshold: threshold in physical units for "threshold_crossing"; polarity "negative" looks
+               for the first sample <= threshold, "positive" for the first sample >= threshold
+    Returns: dict feature name -> (k,) array with the dtype of FEATURE_DTYPES
+    """
+    features = tuple(features)
+    block = np.asarray(block)
+    k = block.shape[0]
+    scale, offset = calibration if calibration is not None else (1.0, 0.0)
+    out = {}
+
+    if any(name in features for name in ("min_voltage", "min_time", "argmin", "max_voltage", "max_time", "argmax")):
+        if calibration is not None:
+            ymin, ymax, argmin, argmax = calibrated_extrema(block, calibration, axis=1)
+        else:
+            argmin = np.argmin(block, axis=1)
+            argmax = np.argmax(block, axis=1)
+            ymin = block[np.arange(k), argmin]
+            ymax = block[np.arange(k), argmax]
+        out["min_voltage"] = ymin
+        out["min_time"] = time[argmin]
+        out["argmin"] = argmin
+        out["max_voltage"] = ymax
+        out["max_time"] = time[argmax]
+        out["argmax"] = argmax
+
+    if any(name in features for name in ("pedestal", "pedestal_rms", "integral")):
+        start, stop = pedestal_window if pedestal_window is not None else (0, None)
+        window = block[:, start:stop]
+        if window.shape[1] == 0:
+            raise ValueError(f"Empty pedestal window {pedestal_window}")
+        pedestal_raw = window.mean(axis=1, dtype=np.float64)
+        out["pedestal"] = offset + scale * pedestal_raw
+        out["pedestal_rms"] = abs(scale) * window.std(axis=1, dtype=np.float64)
+
+        if "integral" in features:
+            start, stop = integral_window if integral_window is not None else (0, None)
+            region = block[:, start:stop]
+            dt = float(time[1] - time[0]) if len(time) > 1 else 0.0
+            # sum(y - pedestal) * dt; the offset cancels out
+            total = region.sum(axis=1, dtype=np.float64) - region.shape[1] * pedestal_raw
+            out["integral"] = scale * total * dt
+
+    if "threshold_crossing" in features:
+        if threshold is None:
+            raise ValueError("threshold_crossing needs a threshold")
+        below = polarity == "negative"
+        raw_threshold = threshold
+        if calibration is not None:
+            raw_threshold = to_raw(threshold, calibration)
+            # a negative scale flips the comparison in ADC units
+            if scale < 0:
+                below = not below
+        mask = block <= raw_threshold if below else block >= raw_threshold
+        crossing = mask.argmax(axis=1)
+        crossing[~mask.any(axis=1)] = -1
+        out["threshold_crossing"] = crossing
+
+    return {name: np.asarray(out[name]).astype(FEATURE_DTYPES[name]) for name in features}
@@ -0,0 +1,115 @@
+# manifest.py
+# Processed-files manifest kept next to a converted ROOT file (more_waveforms_chN.root.manifest.json),
+# used by write_to_root --resume to convert only the new cycle files.
+import os
+import json
+import tempfile
+
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(out_path):
+    return f"{out_path}.manifest.json"
+
+
+def file_stamp(path):
+    """(size, mtime_ns) used to detect changed files."""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _normalize(value):
+    """JSON round trip, so tuples and lists (and NumPy scalars) compare equal."""
+    return json.loads(json.dumps(value, default=lambda v: v.item() if hasattr(v, "item") else str(v)))
+
+
+class Manifest:
+    """
+    Ordered list of the converted source files with their size, mtime, frame count and event range.
+    settings holds the options the output was booked with (channel, layout, features, ...);
+    appending with different settings is refused.
+    A file is recorded once: its events cannot be replaced in the output, so a recorded file
+    that changed afterwards (changed_files) makes the output stale.
+    """
+    def __init__(self, path, settings):
+        self.path = path
+        self.settings = _normalize(settings)
+        self.entries = []
+
+    @classmethod
+    def load(cls, path):
+        """The manifest at path, or None if it does not exist."""
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version {data.get('version')} in {path}")
+        manifest = cls(path, data["settings"])
+        manifest.entries = data["files"]
+        return manifest
+
+    def check_settings(self, settings):
+        settings = _normalize(settings)
+        differences = sorted(key for key in set(settings) | set(self.settings)
+                             if settings.get(key) != self.settings.get(key))
+        if differences:
+            details = ", ".join(f"{key}: {self.settings.get(key)!r} -> {settings.get(key)!r}" for key in differences)
+            raise ValueError(f"Options differ from the ones in {self.path} ({details})")
+
+    def _entry(self, name):
+        for entry in self.entries:
+            if entry["file"] == name:
+                return entry
+        return None
+
+    def is_recorded(self, input_file):
+        """True if input_file was converted (whether or not it changed since)."""
+        return self._entry(os.path.basename(input_file)) is not None
+
+    def is_current(self, input_file):
+        """True if input_file was converted and has not changed since."""
+        entry = self._entry(os.path.basename(input_file))
+        if entry is None:
+            return False
+        return (entry["size"], entry["mtime_ns"]) == file_stamp(input_file)
+
+    def changed_files(self, input_files):
+        """The input_files that were converted but whose size or mtime differs from the recorded one."""
+        return [input_file for input_file in input_files
+                if self.is_recorded(input_file) and not self.is_current(input_file)]
+
+    @property
+    def n_events(self):
+        """Events in the output (event numbers are continuous, so also the next event number)."""
+        return sum(entry["n_events"] for entry in self.entries)
+
+    def add(self, input_file, n_frames, first_event, n_events):
+        name = os.path.basename(input_file)
+        if self._entry(name) is not None:
+            raise ValueError(f"{name} is already in {self.path}, its events would be duplicated")
+        size, mtime_ns = file_stamp(input_file)
+        self.entries.append({
+            "file": name,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "n_frames": int(n_frames),
+            "first_event": int(first_event),
+            "n_events": int(n_events),
+        })
+
+    def save(self):
+        """Atomic write: a crash leaves either the old or the new manifest, never a partial one."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix=".manifest_", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": MANIFEST_VERSION, "settings": self.settings, "files": self.entries}, f, indent=1)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
@@ -2,97 +2,74 @@
 # Joaquim Pinol - 17/7/2025
 # Timing analysis of SPS data acquired with Tektronix MSO64B
 
-import numpy as np
-from wfm2readframe import wfm2readframe
+from cycle_reader import CycleReader
+from decimate import DEFAULT_BINS, minmax_envelope, frame_envelope, frame_lttb, event_extrema
 import matplotlib.pyplot as plt
 import click
 
 
 def extract_waveforms(input_file):
 
-	ch1 = input_file + "_ch1.wfm"
-	ch2 = input_file + "_ch2.wfm"
-	ch3 = input_file + "_ch3.wfm"
-	ch4 = input_file + "_ch4.wfm"
+	# Raw ADC samples (native int8/int16) are kept, scaling is only applied to what gets plotted
+	# All four channel files are opened once and read concurrently
+	# Loads every frame of every channel: the plots of main() use the decimated envelopes instead
+	with CycleReader(input_file, channels=(1, 2, 3, 4)) as cycle:
+		print(f"Found {cycle.n_frames} frames, each with {cycle.nop} samples.")
+		# --- Read frames 1..N of all channels in one pass (as before) ---
+		data, time = cycle.read(slice(None, -1), raw=True)
+		Osci_Data = {f"ch{ch}": data[i] for i, ch in enumerate(cycle.channels)}
+		Calibration = {f"ch{ch}": cycle.calibration[ch] for ch in cycle.channels}
 
-	# --- Read the first frame just to get waveform length and number of events ---
-	waveform, time, info, _, _ = wfm2readframe(ch1, 1)
-	
-	Events_Found = info["N"]
-	Nsamples = len(waveform)
-	
-	print(f"Found {Events_Found} events, each with {Nsamples} samples.")
-	
-	# --- Prepare data containers ---
-	Osci_Data = {
-		"ch1": np.zeros((Events_Found, Nsamples), dtype=float),
-		"ch2": np.zeros((Events_Found, Nsamples), dtype=float),
-		"ch3": np.zeros((Events_Found, Nsamples), dtype=float),
-		"ch4": np.zeros((Events_Found, Nsamples), dtype=float),
-	}
-	# --- Iterate over all events (frames) ---
-	for WaveForm_Index in range(1, Events_Found + 1):
-		# ch1
-		current_waveform, _, _, _, _ = wfm2readframe(ch1, WaveForm_Index)
-		Osci_Data["ch1"][WaveForm_Index - 1, :] = current_waveform
-
-		# ch2
-		current_waveform, _, _, _, _ = wfm2readframe(ch2, WaveForm_Index)
-		Osci_Data["ch2"][WaveForm_Index - 1, :] = current_waveform
-
-		# ch3
-		current_waveform, _, _, _, _ = wfm2readframe(ch3, WaveForm_Index)
-		Osci_Data["ch3"][WaveForm_Index - 1, :] = current_waveform
+	print("All waveforms loaded successfully.")
+	return Osci_Data, Calibration, time
 
-		# ch4
-		current_waveform, _, _, _, _ = wfm2readframe(ch4, WaveForm_Index)
-		Osci_Data["ch4"][WaveForm_Index - 1, :] = current_waveform
 
-		print(f"Frame {WaveForm_Index}/{Events_Found} read.")
-	
-	print("All waveforms loaded successfully.")
-	return Osci_Data, time
 @click.command()
 @click.option('-i', 'input_file', type=click.Path(), help="Input file path without channel and extension")
-def main(input_file):
-
-	Osci_Data, time = extract_waveforms(input_file)
-
-	for ch in range(1, 5):
-		print(f"Channel {ch} data shape: {Osci_Data[f'ch{ch}'].shape}")
-		# Draw waveform for one event as example
-		event = 1
-		plt.figure()
-		plt.plot(time, Osci_Data[f'ch{ch}'][event, :])
-		plt.title(f'Channel {ch} - Event {event}')
-		plt.xlabel('Time (s)')
-		plt.ylabel('Amplitude (V)')
-		plt.grid()
-		plt.show()
-
-		# Draw the min (ch 1-3)/ max (ch 4) value of each waveform
-		if ch == 4:
-			max_values = Osci_Data[f'ch{ch}'].max(axis=1)
+@click.option('--event', type=int, default=1, help="Event index to draw (0-based, event i is frame i + 1)")
+@click.option('--bins', type=int, default=DEFAULT_BINS, help="Points per plotted trace (about the plot width in pixels)")
+@click.option('--method', type=click.Choice(["minmax", "lttb"]), default="minmax",
+			  help="Decimation of the event: min/max envelope or LTTB")
+def main(input_file, event, bins, method):
+
+	# Nothing is loaded as a whole: the event is decimated straight from the memory map and the
+	# min/max per event are computed block by block, so memory does not depend on the record length
+	with CycleReader(input_file, channels=(1, 2, 3, 4)) as cycle:
+		print(f"Found {cycle.n_frames} frames, each with {cycle.nop} samples.")
+		# frames 1..N of all channels, as before
+		frames, min_values, max_values = event_extrema(cycle, slice(None, -1))
+		events = frames - 1
+
+		for i, ch in enumerate(cycle.channels):
+			wfm = cycle.files[ch]
+			# Draw waveform for one event as example
 			plt.figure()
-			plt.plot(max_values, 'o-')
-			plt.title(f'Channel {ch} - Max Values per Event')
-			plt.xlabel('Event Index')
-			plt.ylabel('Max Amplitude (V)')
+			if method == "lttb":
+				t, y = frame_lttb(wfm, event + 1, bins)
+				plt.plot(t, y)
+			else:
+				t, lo, hi = frame_envelope(wfm, event + 1, bins)
+				plt.fill_between(t, lo, hi, step='post', linewidth=0.5)
+			plt.title(f'Channel {ch} - Event {event}')
+			plt.xlabel('Time (s)')
+			plt.ylabel('Amplitude (V)')
 			plt.grid()
 			plt.show()
-		else:
-			# Draw the min value of each waveform	
-			min_values = Osci_Data[f'ch{ch}'].min(axis=1)
+
+			# Draw the min (ch 1-3)/ max (ch 4) value of each waveform, as a min/max envelope over events
+			values, label = (max_values[i], 'Max') if ch == 4 else (min_values[i], 'Min')
 			plt.figure()
-			plt.plot(min_values, 'o-')
-			plt.title(f'Channel {ch} - Min Values per Event')
+			if len(values) > bins:
+				lo, hi, edges = minmax_envelope(values, bins)
+				plt.fill_between(events[edges[:-1]], lo, hi, step='post', linewidth=0.5)
+			else:
+				plt.plot(events, values, 'o-')
+			plt.title(f'Channel {ch} - {label} Values per Event')
 			plt.xlabel('Event Index')
-			plt.ylabel('Min Amplitude (V)')
+			plt.ylabel(f'{label} Amplitude (V)')
 			plt.grid()
 			plt.show()
 
 
 if __name__ == "__main__":
 	main()
-
-
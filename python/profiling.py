@@ -0,0 +1,123 @@
+# profiling.py
+# Lightweight timers and counters for the readers and converters.
+# Disabled by default (a timer is then a no-op), enabled with --profile in the CLI scripts.
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+class Profiler:
+    """
+    Accumulates per-stage wall time (seconds, calls) and counters (bytes read, frames, ...).
+    Thread safe, so the thread pools of CycleReader can report into the same profiler.
+
+    with PROFILER.timer("decode"):
+        ...
+    PROFILER.count("bytes_read", n)
+    """
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.timers = {}     # name -> [seconds, calls]
+            self.counters = {}   # name -> value
+            self._start = time.perf_counter()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        self.reset()
+
+    @contextmanager
+    def timer(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        """Add a measured interval to a timer (for code that cannot be wrapped in a with block)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self.timers.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        """Plain dict with the timers, counters and elapsed wall time (JSON / pickle friendly)."""
+        with self._lock:
+            return {
+                "wall_seconds": time.perf_counter() - self._start,
+                "timers": {name: {"seconds": s, "calls": n} for name, (s, n) in self.timers.items()},
+                "counters": dict(self.counters),
+            }
+
+    def merge(self, snapshot):
+        """Add the timers and counters of a snapshot taken in another process (e.g. a --jobs worker)."""
+        with self._lock:
+            for name, entry in snapshot["timers"].items():
+                total = self.timers.setdefault(name, [0.0, 0])
+                total[0] += entry["seconds"]
+                total[1] += entry["calls"]
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        """Snapshot plus derived rates (frames/s, events/s, MB/s of bytes read) over the wall time."""
+        data = self.snapshot()
+        wall = data["wall_seconds"]
+        counters = data["counters"]
+        rates = {}
+        if wall > 0:
+            for name in ("frames", "events"):
+                if name in counters:
+                    rates[f"{name}_per_s"] = counters[name] / wall
+            if "bytes_read" in counters:
+                rates["read_MB_per_s"] = counters["bytes_read"] / 1024**2 / wall
+        data["rates"] = rates
+        return data
+
+    def print_report(self):
+        data = self.report()
+        wall = data["wall_seconds"]
+        print(f"\nProfile ({wall:.3f} s wall time):")
+        # stages in worker processes can add up to more than the wall time
+        for name, entry in sorted(data["timers"].items(), key=lambda item: -item[1]["seconds"]):
+            share = 100 * entry["seconds"] / wall if wall > 0 else 0
+            print(f"  {name:>20}: {entry['seconds']:10.3f} s {share:6.1f} %  ({entry['calls']} calls)")
+        for name, value in sorted(data["counters"].items()):
+            print(f"  {name:>20}: {value}")
+        for name, value in data["rates"].items():
+            print(f"  {name:>20}: {value:.1f}")
+
+    def dump_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+# process wide profiler used by the readers and the CLI scripts
+PROFILER = Profiler()
+
+
+def report_profile(path=None):
+    """Print the PROFILER report (if profiling is enabled) and dump it as JSON to path if given."""
+    if not PROFILER.enabled:
+        return
+    PROFILER.print_report()
+    if path:
+        PROFILER.dump_json(path)
+        print(f"Profile written to {path}")
@@ -0,0 +1,269 @@
+# pulse_analysis.py
+# Vectorized pulse parameters (baseline, noise, amplitude, SNR, start time, rise time, integral) computed over
+# whole (k, samples) blocks of waveforms, following the definitions of M. Senger signals.PeakSignal
+import warnings
+import numpy as np
+
+
+# parameter name -> dtype of its output array
+PULSE_DTYPES = {
+    "baseline": np.float64,          # mean of the samples before the peak start
+    "noise": np.float64,             # standard deviation of the samples before the peak start
+    "amplitude": np.float64,         # peak value - baseline (signed, negative for negative pulses)
+    "SNR": np.float64,               # amplitude / noise
+    "peak_index": np.int64,          # sample index of the peak
+    "peak_time": np.float64,         # time of the peak
+    "peak_start_index": np.int64,    # last sample before the peak inside the noise band (-1 if none)
+    "peak_start_time": np.float64,   # time of the peak start sample
+    "rise_time": np.float64,         # time between the 10 % and 90 % crossings of the rising edge
+    "peak_integral": np.float64,     # integral of (samples - baseline) from the peak start to the peak end (V*s)
+}
+
+# Default hit selection: |SNR| above the threshold, start time and rise time inside their (exclusive) ranges
+SNR_THRESHOLD = 0.0
+START_TIME_RANGE = (0.0, np.inf)
+RISE_TIME_RANGE = (0.0, np.inf)
+
+# median absolute deviation -> standard deviation of a gaussian
+MAD_TO_STD = 1.4826
+
+
+def _noise_band(flipped, peak_index):
+    """
+    Upper edge of the noise band of each row (positive polarity): median + 1.4826 * MAD of the samples
+    before the peak, as PeakSignal uses to find where the peak starts and ends. NaN if the peak is the first sample.
+    """
+    before = np.where(np.arange(flipped.shape[1]) < peak_index[:, np.newaxis], flipped, np.nan)
+    median = np.nanmedian(before, axis=1)
+    mad = np.nanmedian(np.abs(before - median[:, np.newaxis]), axis=1)
+    return median + MAD_TO_STD * mad
+
+
+def _last_index(mask):
+    """Index of the last True of each row of mask, -1 if none."""
+    n = mask.shape[1]
+    return np.where(mask.any(axis=1), n - 1 - np.argmax(mask[:, ::-1], axis=1), -1)
+
+
+def _rising_crossing(y, time, level, start_index, peak_index):
+    """
+    Linear-interpolated time at which each row of y (positive polarity) crosses `level` upwards on its
+    rising edge: after the last sample below the level between the peak start and the peak.
+    Returns NaN for rows without crossing.
+    """
+    k, n = y.shape
+    idx = np.arange(n)
+    below = ((y < level[:, np.newaxis]) & (idx >= start_index[:, np.newaxis])
+             & (idx < peak_index[:, np.newaxis]))
+    i = _last_index(below)
+    found = i >= 0
+    i = np.where(found, i, 0)
+    j = np.minimum(i + 1, n - 1)
+    rows = np.arange(k)
+    y0, y1 = y[rows, i], y[rows, j]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac = (level - y0) / (y1 - y0)
+    t = time[i] + frac * (time[j] - time[i])
+    return np.where(found, t, np.nan)
+
+
+def analyse_pulses(block, time, polarity="negative", baseline_window=None, rise_fractions=(0.1, 0.9)):
+    """
+    Pulse parameters of every waveform of a block, with the definitions of signals.PeakSignal:
+    the peak starts at the last sample before the peak inside the noise band (median + 1.4826 * MAD of
+    the samples before the peak) and ends at the first sample after the peak back inside it; baseline
+    and noise are the mean and standard deviation of the samples before the peak start; the integral
+    of (samples - baseline) runs from the peak start to the peak end, or to the end of the record if the
+    peak does not end inside it (trapezoidal, i.e. over the linear interpolation of the samples).
+
+    block: (k, samples) calibrated waveforms (a single waveform is also accepted)
+    time: time axis of the samples
+    polarity: "negative" or "positive", direction of the peak
+    baseline_window: (start, stop) sample range for baseline and noise instead of the samples before the peak start
+    rise_fractions: fractions of the amplitude between which rise_time is measured
+    Returns: dict parameter name -> (k,) array with the dtype of PULSE_DTYPES. Parameters that
+             cannot be computed (e.g. no sample before the peak inside the noise band) are NaN.
+
+    Not validated against PeakSignal yet (compare_with_peaksignal), so the Corryvreckan exporters use
+    peaksignal_pulses by default. Points that may differ and must be checked when it is:
+    - a sample exactly on the noise band edge counts as inside the band (<=)
+    - a peak that does not return to the band is integrated up to the last sample
+    - baseline and noise use every sample before the peak start
+    - a peak at the first sample has no noise band: every parameter but amplitude and peak time is NaN
+    """
+    if polarity not in ("negative", "positive"):
+        raise ValueError(f"polarity must be 'negative' or 'positive', not {polarity!r}")
+    block = np.asarray(block, dtype=np.float64)
+    if block.ndim == 1:
+        block = block[np.newaxis, :]
+    time = np.asarray(time, dtype=np.float64)
+    k, n = block.shape
+    if len(time) != n:
+        raise ValueError(f"Time axis has {len(time)} points but the waveforms have {n} samples")
+    sign = -1.0 if polarity == "negative" else 1.0
+    rows = np.arange(k)
+    idx = np.arange(n)
+
+    # positive polarity copy, so the peak is always a maximum
+    flipped = block * sign
+    peak_index = np.argmax(flipped, axis=1)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)   # all-NaN rows (peak at the first sample)
+        band = _noise_band(flipped, peak_index)
+        inside = flipped <= band[:, np.newaxis]
+        start_index = _last_index(inside & (idx < peak_index[:, np.newaxis]))
+        after = inside & (idx > peak_index[:, np.newaxis])
+        # a peak still outside the band at the end of the record is integrated up to the last sample
+        end_index = np.where(after.any(axis=1), np.argmax(after, axis=1), n - 1)
+        if baseline_window is None:
+            region = np.where(idx < start_index[:, np.newaxis], flipped, np.nan)
+            baseline = np.nanmean(region, axis=1)
+            noise = np.nanstd(region, axis=1)
+        else:
+            start, stop = baseline_window
+            region = flipped[:, start:stop]
+            if region.shape[1] == 0:
+                raise ValueError(f"Empty baseline window {baseline_window}")
+            baseline = np.mean(region, axis=1)
+            noise = np.std(region, axis=1)
+
+    has_start = start_index >= 0
+    y = flipped - baseline[:, np.newaxis]
+    amplitude = y[rows, peak_index]
+
+    start_time = np.where(has_start, time[np.maximum(start_index, 0)], np.nan)
+    t_low = _rising_crossing(y, time, rise_fractions[0] * amplitude, start_index, peak_index)
+    t_high = _rising_crossing(y, time, rise_fractions[1] * amplitude, start_index, peak_index)
+
+    # trapezoidal integral of the samples from the peak start to the peak end
+    trapezoids = 0.5 * (y[:, 1:] + y[:, :-1]) * np.diff(time)
+    cumulative = np.concatenate([np.zeros((k, 1)), np.cumsum(trapezoids, axis=1)], axis=1)
+    integral = np.where(has_start, cumulative[rows, end_index] - cumulative[rows, np.maximum(start_index, 0)], np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        snr = amplitude / noise
+
+    out = {
+        "baseline": sign * baseline,
+        "noise": noise,
+        "amplitude": sign * amplitude,
+        "SNR": sign * snr,
+        "peak_index": peak_index,
+        "peak_time": time[peak_index],
+        "peak_start_index": start_index,
+        "peak_start_time": start_time,
+        "rise_time": t_high - t_low,
+        "peak_integral": sign * integral,
+    }
+    return {name: np.asarray(value).astype(PULSE_DTYPES[name]) for name, value in out.items()}
+
+
+def hit_mask(params, snr_threshold=SNR_THRESHOLD, start_time_range=START_TIME_RANGE, rise_time_range=RISE_TIME_RANGE):
+    """
+    Hit selection of a block: True where |SNR| > snr_threshold and start time and rise time lie inside
+    their (exclusive) ranges. NaN parameters never pass.
+    """
+    snr = np.asarray(params["SNR"])
+    start = np.asarray(params["peak_start_time"])
+    rise = np.asarray(params["rise_time"])
+    with np.errstate(invalid='ignore'):
+        return ((np.abs(snr) > snr_threshold)
+                & (start > start_time_range[0]) & (start < start_time_range[1])
+                & (rise > rise_time_range[0]) & (rise < rise_time_range[1]))
+
+
+# parameter name -> PeakSignal attribute
+PEAKSIGNAL_ATTRIBUTES = {
+    "baseline": "baseline",
+    "noise": "noise",
+    "amplitude": "amplitude",
+    "SNR": "SNR",
+    "peak_start_time": "peak_start_time",
+    "rise_time": "rise_time",
+    "peak_integral": "peak_integral",
+}
+
+
+def peaksignal_pulses(block, time, polarity="negative"):
+    """
+    Pulse parameters of every waveform of a block computed with one signals.PeakSignal per waveform
+    (needs the signals package). Slow, but the reference the Corryvreckan export was defined with.
+    Returns: dict parameter name -> (k,) float64 array for the parameters of PEAKSIGNAL_ATTRIBUTES
+             (None from PeakSignal becomes NaN)
+    """
+    try:
+        from signals.PeakSignal import PeakSignal
+    except ImportError as e:
+        raise ImportError("peaksignal_pulses needs the signals package (https://github.com/SengerM/signals)") from e
+
+    block = np.atleast_2d(np.asarray(block, dtype=np.float64))
+    time = np.asarray(time, dtype=np.float64)
+    params = {name: np.empty(len(block)) for name in PEAKSIGNAL_ATTRIBUTES}
+    for i, samples in enumerate(block):
+        pulse = PeakSignal(time=time, samples=samples, peak_polarity=polarity)
+        for name, attribute in PEAKSIGNAL_ATTRIBUTES.items():
+            value = getattr(pulse, attribute)
+            params[name][i] = np.nan if value is None else value
+    return params
+
+
+# --engine of the Corryvreckan exporters -> function(block, time, polarity) returning the pulse parameters
+PULSE_ENGINES = {
+    "peaksignal": peaksignal_pulses,
+    "vectorized": analyse_pulses,
+}
+
+
+def compare_with_peaksignal(block, time, polarity="negative", **kwargs):
+    """
+    Validate analyse_pulses against signals.PeakSignal on the same waveforms (needs the signals package).
+    Amplitude, SNR and integral are compared in absolute value, as PeakSignal reports them in the peak polarity.
+    Returns: dict parameter name -> (max absolute difference, max relative difference, rows where only one is NaN)
+    """
+    block = np.atleast_2d(np.asarray(block, dtype=np.float64))
+    reference = peaksignal_pulses(block, time, polarity=polarity)
+    params = analyse_pulses(block, time, polarity=polarity, **kwargs)
+
+    report = {}
+    for name in PEAKSIGNAL_ATTRIBUTES:
+        ours, theirs = params[name], reference[name]
+        if name in ("amplitude", "SNR", "peak_integral"):
+            ours, theirs = np.abs(ours), np.abs(theirs)
+        both = ~np.isnan(ours) & ~np.isnan(theirs)
+        diff = np.abs(ours[both] - theirs[both])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rel = diff / np.abs(theirs[both])
+        report[name] = (float(diff.max()) if diff.size else 0.0,
+                        float(np.nanmax(rel)) if rel.size else 0.0,
+                        int(np.count_nonzero(np.isnan(ours) != np.isnan(theirs))))
+    return report
+
+
+if __name__ == "__main__":
+    import click
+    from wfm2readframe import read_frames
+    from wfmwrite import synthetic_frames
+
+    @click.command()
+    @click.option('-i', '--input_file', type=click.Path(exists=True), help="WFM file with sample pulses")
+    @click.option('-n', '--n_frames', default=1000, type=int, show_default=True, help="Number of frames to compare")
+    @click.option('--polarity', default="negative", type=click.Choice(["negative", "positive"]), show_default=True)
+    def main(input_file, n_frames, polarity):
+        """
+        Compare the vectorized pulse parameters with signals.PeakSignal on the first frames of a WFM file,
+        or on wfmwrite.synthetic_frames pulses (negative) if no file is given.
+        """
+        if input_file:
+            y, t, info, _, _ = read_frames(input_file, slice(1, n_frames + 1))
+            source = input_file
+        else:
+            y, _, _ = synthetic_frames(n_frames, 1000, dtype=np.float64)
+            t = np.arange(y.shape[1]) * 1e-11
+            source = "synthetic pulses"
+        report = compare_with_peaksignal(y, t, polarity=polarity)
+        print(f"{len(y)} frames of {source}")
+        for name, (abs_diff, rel_diff, nan_mismatch) in report.items():
+            print(f"{name:>16}: max |diff| = {abs_diff:.3e}, max rel diff = {rel_diff:.3e}, NaN mismatches = {nan_mismatch}")
+
+    main()
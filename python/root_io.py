@@ -0,0 +1,325 @@
+# root_io.py
+# Columnar (block) I/O between NumPy arrays and ROOT TTrees.
+# The per-entry loop runs in a small compiled helper, so Python only does one call per block.
+import numpy as np
+import ROOT
+
+
+ROOT.gInterpreter.Declare(r'''
+#include <cstring>
+#include <vector>
+#include <algorithm>
+#include "TTree.h"
+#include "TTreeReader.h"
+#include "TTreeReaderArray.h"
+#include "TTreeReaderValue.h"
+#include "ROOT/RVec.hxx"
+
+namespace wfm_root_io {
+
+// Fill k entries of a tree. For entry i:
+//  - fixed-size columns (scalars and C arrays): copy size[j] bytes from src[j] + i*size[j] to the branch buffer dst[j]
+//  - RVec<double> columns: assign vec_len[j] doubles starting at vec_src[j] + i*vec_len[j]
+// All pointers are passed as integers (NumPy / array addresses).
+inline Long64_t FillBlock(TTree &tree, Long64_t k,
+                          const std::vector<Long64_t> &dst, const std::vector<Long64_t> &src,
+                          const std::vector<Long64_t> &size,
+                          const std::vector<Long64_t> &vecs, const std::vector<Long64_t> &vec_src,
+                          const std::vector<Long64_t> &vec_len)
+{
+   Long64_t nbytes = 0;
+   for (Long64_t i = 0; i < k; ++i) {
+      for (std::size_t j = 0; j < dst.size(); ++j)
+         std::memcpy(reinterpret_cast<void *>(dst[j]), reinterpret_cast<const char *>(src[j]) + i * size[j], size[j]);
+      for (std::size_t j = 0; j < vecs.size(); ++j) {
+         const double *row = reinterpret_cast<const double *>(vec_src[j]) + i * vec_len[j];
+         reinterpret_cast<ROOT::RVec<double> *>(vecs[j])->assign(row, row + vec_len[j]);
+      }
+      nbytes += tree.Fill();
+   }
+   return nbytes;
+}
+
+// Sequential block reader: one TTreeReader event loop over [begin, end) that copies the
+// samples of up to k entries per call into a (k x n) row-major buffer (rows padded with 0)
+// and their event numbers into evt.
+template <typename T>
+class BlockReader {
+public:
+   BlockReader(TTree *tree, const char *branch, Long64_t begin, Long64_t end)
+      : fReader(tree), fSamples(fReader, branch), fEvent(fReader, "event_number")
+   {
+      fReader.SetEntriesRange(begin, end);
+   }
+
+   Long64_t Next(Long64_t k, Long64_t n, T *out, Int_t *evt)
+   {
+      Long64_t i = 0;
+      while (i < k && fReader.Next()) {
+         const Long64_t m = std::min<Long64_t>(fSamples.GetSize(), n);
+         T *row = out + i * n;
+         for (Long64_t j = 0; j < m; ++j)
+            row[j] = fSamples[j];
+         std::fill(row + m, row + n, T(0));
+         evt[i] = *fEvent;
+         ++i;
+      }
+      return i;
+   }
+
+private:
+   TTreeReader fReader;
+   TTreeReaderArray<T> fSamples;
+   TTreeReaderValue<Int_t> fEvent;
+};
+
+} // namespace wfm_root_io
+''')
+
+
+# NumPy dtype -> ROOT leaf type code
+LEAF_CODES = {
+    np.dtype(np.int8): 'B',
+    np.dtype(np.uint8): 'b',
+    np.dtype(np.int16): 'S',
+    np.dtype(np.uint16): 's',
+    np.dtype(np.int32): 'I',
+    np.dtype(np.uint32): 'i',
+    np.dtype(np.int64): 'L',
+    np.dtype(np.uint64): 'l',
+    np.dtype(np.float32): 'F',
+    np.dtype(np.float64): 'D',
+    np.dtype(np.bool_): 'O',
+}
+
+
+def _long_vector(values):
+    vec = ROOT.std.vector['Long64_t']()
+    vec.reserve(len(values))
+    for v in values:
+        vec.push_back(int(v))
+    return vec
+
+
+def bind_branch(tree, name, buf, leaflist=None):
+    """
+    Create the branch, or bind buf to it if the tree already has it
+    (a tree read back from a file opened in UPDATE mode, to append entries).
+    """
+    if tree.GetBranch(name):
+        tree.SetBranchAddress(name, buf)
+    elif leaflist is None:
+        tree.Branch(name, buf)
+    else:
+        tree.Branch(name, buf, leaflist)
+
+
+class BlockWriter:
+    """
+    Binds NumPy buffers to the branches of a TTree and fills whole blocks of entries
+    with a single compiled call (no per-entry Python objects or list conversions).
+
+    writer = BlockWriter(tree)
+    writer.add_scalar("event_number", np.int32)
+    writer.add_vector("voltage")
+    writer.fill({"event_number": numbers, "voltage": block})   # block: (k, samples)
+
+    Branches that already exist in the tree are bound to the buffers instead of created (see bind_branch).
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        self._buffers = {}   # name -> NumPy buffer bound to a scalar / fixed-size array branch
+        self._vectors = {}   # name -> RVec<double> bound to a vector branch
+
+    def add_scalar(self, name, dtype):
+        dtype = np.dtype(dtype).newbyteorder('=')
+        buf = np.zeros(1, dtype=dtype)
+        bind_branch(self.tree, name, buf, f"{name}/{LEAF_CODES[dtype]}")
+        self._buffers[name] = buf
+        return buf
+
+    def add_array(self, name, dtype, length):
+        """Fixed-size array branch name[length] (one row of `length` values per entry)."""
+        dtype = np.dtype(dtype).newbyteorder('=')
+        buf = np.zeros(int(length), dtype=dtype)
+        bind_branch(self.tree, name, buf, f"{name}[{int(length)}]/{LEAF_CODES[dtype]}")
+        self._buffers[name] = buf
+        return buf
+
+    def add_vector(self, name):
+        """Variable-size RVec<double> branch, as written by the per-event code."""
+        vec = ROOT.VecOps.RVec('double')()
+        bind_branch(self.tree, name, vec)
+        self._vectors[name] = vec
+        return vec
+
+    @property
+    def columns(self):
+        return list(self._buffers) + list(self._vectors)
+
+    def fill(self, columns):
+        """
+        Fill one entry per row of the given columns (dict name -> array with k rows).
+        Every bound branch must be given. Returns the number of bytes written by Fill.
+        """
+        missing = set(self.columns) - set(columns)
+        if missing:
+            raise KeyError(f"Missing columns for block fill: {sorted(missing)}")
+        k = None
+        keep = []   # keep the contiguous copies alive during the C++ call
+        dst, src, size = [], [], []
+        vecs, vec_src, vec_len = [], [], []
+
+        for name, buf in self._buffers.items():
+            col = np.ascontiguousarray(columns[name], dtype=buf.dtype).reshape(-1, buf.size)
+            k = col.shape[0] if k is None else k
+            if col.shape[0] != k:
+                raise ValueError(f"Column {name} has {col.shape[0]} rows, expected {k}")
+            keep.append(col)
+            dst.append(buf.ctypes.data)
+            src.append(col.ctypes.data)
+            size.append(buf.nbytes)
+
+        for name, vec in self._vectors.items():
+            col = np.ascontiguousarray(columns[name], dtype=np.float64)
+            col = col.reshape(col.shape[0], -1)
+            k = col.shape[0] if k is None else k
+            if col.shape[0] != k:
+                raise ValueError(f"Column {name} has {col.shape[0]} rows, expected {k}")
+            keep.append(col)
+            vecs.append(ROOT.addressof(vec))
+            vec_src.append(col.ctypes.data)
+            vec_len.append(col.shape[1])
+
+        if not k:
+            return 0
+        return ROOT.wfm_root_io.FillBlock(self.tree, k,
+                                          _long_vector(dst), _long_vector(src), _long_vector(size),
+                                          _long_vector(vecs), _long_vector(vec_src), _long_vector(vec_len))
+
+
+CALIBRATION_COLUMNS = ["first_event", "n_events", "y_scale", "y_offset", "t_scale", "t_offset"]
+
+
+def read_calibration(path):
+    """
+    Read the per source file "calibration" tree written by write_to_root.
+    Returns a dict of NumPy arrays sorted by first_event.
+    """
+    data = ROOT.RDataFrame("calibration", path).AsNumpy(CALIBRATION_COLUMNS)
+    order = np.argsort(data["first_event"], kind="stable")
+    return {name: np.asarray(data[name])[order] for name in CALIBRATION_COLUMNS}
+
+
+def apply_calibration(adc, event_numbers, calibration):
+    """
+    Calibrated view of raw-layout samples: voltage = y_offset + y_scale * adc,
+    using for each event the calibration entry of the source file it came from.
+    adc: (k, samples) integers, event_numbers: (k,), calibration: from read_calibration.
+    """
+    event_numbers = np.asarray(event_numbers)
+    idx = np.searchsorted(calibration["first_event"], event_numbers, side="right") - 1
+    if np.any(idx < 0):
+        raise ValueError("Event numbers before the first calibration entry")
+    voltage = np.asarray(adc, dtype=np.float64) * calibration["y_scale"][idx, np.newaxis]
+    voltage += calibration["y_offset"][idx, np.newaxis]
+    return voltage
+
+
+# ROOT leaf type name -> (C++ type for the reader template, NumPy dtype)
+READER_TYPES = {
+    "Char_t": ("Char_t", np.int8),
+    "UChar_t": ("UChar_t", np.uint8),
+    "Short_t": ("Short_t", np.int16),
+    "UShort_t": ("UShort_t", np.uint16),
+    "Int_t": ("Int_t", np.int32),
+    "UInt_t": ("UInt_t", np.uint32),
+    "Float_t": ("Float_t", np.float32),
+    "Double_t": ("Double_t", np.float64),
+}
+
+
+def read_time_axis(path):
+    """
+    Time axis stored once in the "metadata" tree by write_to_root.
+    """
+    data = ROOT.RDataFrame("metadata", path).AsNumpy(["time"])
+    if len(data["time"]) == 0:
+        raise ValueError(f"No time axis in the metadata tree of {path}")
+    return np.asarray(data["time"][0], dtype=np.float64)
+
+
+class TreeBlockReader:
+    """
+    Streams the "waveforms" tree written by write_to_root in large contiguous blocks
+    with a single event loop (a compiled TTreeReader loop fills each block).
+    Works with both layouts: "voltage" (vector<double>) and "raw" (adc[N] + calibration tree).
+    The time axis is read once from the "metadata" tree.
+
+    reader = TreeBlockReader("more_waveforms_ch1.root")
+    for event_numbers, voltages in reader.iter_blocks(10000):   # voltages: (k, samples)
+        ...
+    """
+    def __init__(self, path, tree_name="waveforms", begin=0, end=None):
+        self.path = path
+        self._file = ROOT.TFile.Open(path)
+        if not self._file or self._file.IsZombie():
+            raise OSError(f"Could not open file {path}")
+        self.tree = self._file.Get(tree_name)
+        if not self.tree:
+            raise KeyError(f"No tree {tree_name} in {path}")
+        self.n_entries = int(self.tree.GetEntries())
+        self.begin = int(begin)
+        self.end = self.n_entries if end is None else min(int(end), self.n_entries)
+
+        self.time = read_time_axis(path)
+        self.nop = len(self.time)
+        if self.tree.GetBranch("voltage"):
+            self.layout = "voltage"
+            self.branch = "voltage"
+            self.cpp_type, self.dtype = "double", np.dtype(np.float64)
+            self.calibration = None
+        elif self.tree.GetBranch("adc"):
+            self.layout = "raw"
+            self.branch = "adc"
+            leaf_type = self.tree.GetBranch("adc").GetLeaf("adc").GetTypeName()
+            self.cpp_type, dtype = READER_TYPES[str(leaf_type)]
+            self.dtype = np.dtype(dtype)
+            self.calibration = read_calibration(path)
+        else:
+            raise KeyError(f"Tree {tree_name} in {path} has neither a voltage nor an adc branch")
+
+    def __len__(self):
+        return max(0, self.end - self.begin)
+
+    def iter_blocks(self, block_size=10000, raw=False):
+        """
+        Yields (event_numbers, samples) blocks of up to block_size entries.
+        samples are calibrated float64 voltages, or the stored adc integers if raw=True (raw layout).
+        """
+        reader = ROOT.wfm_root_io.BlockReader[self.cpp_type](self.tree, self.branch, self.begin, self.end)
+        samples = np.empty((block_size, self.nop), dtype=self.dtype)
+        event_numbers = np.empty(block_size, dtype=np.int32)
+        while True:
+            k = int(reader.Next(block_size, self.nop, samples, event_numbers))
+            if k == 0:
+                break
+            # copies: the buffers are reused for the next block
+            block_events = event_numbers[:k].copy()
+            block = samples[:k].copy()
+            if self.layout == "raw" and not raw:
+                block = apply_calibration(block, block_events, self.calibration)
+            yield block_events, block
+            if k < block_size:
+                break
+
+    def close(self):
+        if self._file:
+            self._file.Close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
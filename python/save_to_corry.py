@@ -1,52 +1,122 @@
-from signals.PeakSignal import PeakSignal, draw_in_plotly
 import click
 import ROOT
 import numpy as np
-from array import array
 import os
+from root_io import TreeBlockReader, BlockWriter
+from profiling import PROFILER, report_profile
+from pulse_analysis import PULSE_ENGINES, hit_mask
+from write_to_root import process_pool
 
-# Use M. Senger signal library to extract needed information to implement them into corryvreckan
+# Use M. Senger signal library (signals.PeakSignal) to extract needed information to implement them into
+# corryvreckan, block by block; --engine vectorized uses the NumPy version of pulse_analysis instead
 
-def is_hit(SNR, StartTime, RiseTime):
+# TTree branch -> pulse_analysis parameter
+TREE_COLUMNS = {
+    "snr": "SNR",
+    "amplitude": "amplitude",
+    "toa": "peak_start_time",
+    "integral": "peak_integral",
+    "rise_time": "rise_time",
+}
+
+
+def iter_pulse_blocks(input_file, begin=0, end=None, block_size=10000, engine="peaksignal"):
+    """
+    Stream the events [begin, end) of the waveforms tree and analyse them block by block
+    with the pulse_analysis engine `engine` ("peaksignal" or "vectorized").
+    Yields: event_numbers, pulse parameters (dict), hit mask
+    """
+    pulse_parameters = PULSE_ENGINES[engine]
+    with TreeBlockReader(input_file, begin=begin, end=end) as reader:
+        blocks = reader.iter_blocks(block_size)
+        while True:
+            with PROFILER.timer("tree_read"):
+                block = next(blocks, None)
+            if block is None:
+                break
+            event_numbers, voltages = block
+            with PROFILER.timer("pulse_analysis"):
+                pulses = pulse_parameters(voltages, reader.time, polarity="negative")
+                hits = hit_mask(pulses)
+            PROFILER.count("events", len(event_numbers))
+            PROFILER.count("hits", int(np.count_nonzero(hits)))
+            yield event_numbers, pulses, hits
+
+
+def analyse_range(input_file, begin, end, block_size, engine, profile=False):
+    """
+    Worker for --jobs: analyse the events [begin, end) and return the concatenated results
+    (event_numbers, pulse parameters, hit mask) so the parent writes them in order,
+    plus the profiler snapshot of the worker (None if profile is False).
+    """
+    if profile:
+        PROFILER.enable()
+    events, params, hits = [], {name: [] for name in TREE_COLUMNS.values()}, []
+    for event_numbers, pulses, mask in iter_pulse_blocks(input_file, begin, end, block_size, engine):
+        events.append(event_numbers)
+        hits.append(mask)
+        for name in params:
+            params[name].append(pulses[name])
+    snapshot = PROFILER.snapshot() if profile else None
+    if not events:
+        return np.empty(0, dtype=np.int32), {name: np.empty(0) for name in params}, np.empty(0, dtype=bool), snapshot
+    return (np.concatenate(events), {name: np.concatenate(v) for name, v in params.items()}, np.concatenate(hits),
+            snapshot)
+
+
+def iter_pulse_ranges(input_file, n_events, jobs, block_size, engine, profile=False):
+    """
+    Split [0, n_events) into contiguous ranges analysed on `jobs` worker processes.
+    Yields the results of each range in event order, so the output is identical to the serial one.
+    With profile=True the worker timers are added to PROFILER.
+    """
+    n_ranges = min(n_events, 4 * jobs)   # a few ranges per worker to balance the load
+    bounds = np.linspace(0, n_events, n_ranges + 1).astype(int)
+    with process_pool(jobs) as pool:
+        futures = [pool.submit(analyse_range, input_file, int(begin), int(end), block_size, engine, profile)
+                   for begin, end in zip(bounds[:-1], bounds[1:])]
+        for future in futures:
+            event_numbers, pulses, hits, snapshot = future.result()
+            if snapshot is not None:
+                PROFILER.merge(snapshot)
+            yield event_numbers, pulses, hits
+
+
+def write_pulses(f, writer, event_numbers, pulses, hits, detector_name=""):
     """
-    Simple hit finding logic based on SNR, StartTime, and RiseTime thresholds.
-    Adjust the thresholds as needed for your specific application.
-    
-    Args:
-        SNR (float): Signal-to-noise ratio of the pulse.
-        StartTime (float): Start time of the pulse.
-        RiseTime (float): Rise time of the pulse.
+    Write the hits of a block to the Corryvreckan text file and every event to the tree.
     """
-    # if any variable is None or NaN, return False
-    if SNR is None or StartTime is None or RiseTime is None:
-        return False
-    if isinstance(SNR, float) and (SNR != SNR):
-        return False
-    if isinstance(StartTime, float) and (StartTime != StartTime):
-        return False
-    if isinstance(RiseTime, float) and (RiseTime != RiseTime):
-        return False
-    
-    SNR_threshold = 0.0      # Example threshold for SNR
-    StartTime_lowerthreshold = 0.0 # Example threshold for StartTime
-    StartTime_upperthreshold = np.inf # Example threshold for StartTime
-    RiseTime_lowerthreshold = 0.0 # Example threshold for RiseTime
-    RiseTime_upperthreshold = np.inf # Example threshold for RiseTime
-
-    if abs(SNR) > SNR_threshold and \
-        StartTime > StartTime_lowerthreshold and StartTime < StartTime_upperthreshold and \
-        RiseTime > RiseTime_lowerthreshold and RiseTime < RiseTime_upperthreshold:
-        return True
-    return False
+    charge = pulses["peak_integral"]
+    time_of_arrival = pulses["peak_start_time"]
+    with PROFILER.timer("text_write"):
+        f.writelines(f"{event_numbers[i]}, {detector_name}, {float(charge[i])}, {float(time_of_arrival[i])}\n"
+                     for i in np.flatnonzero(hits))
+    columns = {"event_number": event_numbers, "hit": hits}
+    for branch, name in TREE_COLUMNS.items():
+        columns[branch] = pulses[name]
+    with PROFILER.timer("tree_fill"):
+        writer.fill(columns)
+
 
 @click.command()
 @click.option('-i', '--input_file', type=click.Path(), help="Input file path without channel and extension")
 @click.option('-o', '--output_file', default="output.root", type=click.Path(), help="Output file to store the variables in ROOT format")
-def main(input_file, output_file):
-    # Open the input file
-    df = ROOT.RDataFrame("waveforms", input_file)
-    if not df:
-        print(f"Error: Could not open file {input_file}")
+@click.option('--block-size', default=10000, type=int, show_default=True, help="Number of events read from the waveforms tree per chunk")
+@click.option('-j', '--jobs', type=int, default=1, show_default=True, help="Number of worker processes (contiguous event ranges per task)")
+@click.option('--engine', type=click.Choice(list(PULSE_ENGINES)), default="peaksignal", show_default=True,
+              help="Pulse parameters from signals.PeakSignal, or from the vectorized pulse_analysis (not validated yet)")
+@click.option('--profile', is_flag=True, help="Print a per-stage time breakdown at the end")
+@click.option('--profile-json', type=click.Path(), default=None, help="Also dump the profile as JSON to this file")
+def main(input_file, output_file, block_size, jobs, engine, profile, profile_json):
+    if profile or profile_json is not None:
+        PROFILER.enable()
+    # Open the input file: the waveforms tree is streamed in contiguous chunks with a single event loop
+    # (voltage or raw adc layout), the time axis is read once from the metadata tree
+    try:
+        with TreeBlockReader(input_file) as reader:
+            n_events = len(reader)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Error: Could not open file {input_file}: {e}")
         return
     if not output_file.endswith(".root"):
         output_file += ".root"
@@ -61,6 +131,7 @@ def main(input_file, output_file):
     # event_number = data["event_number"][0]
     # time_vec = np.array(data["time"][0])
     # voltage_vec = np.array(data["voltage"][0])
+    # from signals.PeakSignal import PeakSignal, draw_in_plotly
     # pulse = PeakSignal(time = time_vec, samples = voltage_vec, peak_polarity="negative")
     # fig = draw_in_plotly(pulse)
     # fig.update_layout(
@@ -71,51 +142,33 @@ def main(input_file, output_file):
     # fig.show()
 
     # input("Press Enter to continue...")
-    # Store interesting histograms in a root file
+    # Store interesting histograms in a root file, one entry per event
     root_file = ROOT.TFile(output_file, "RECREATE")
     tree = ROOT.TTree("tree", "tree")
-    # Variables to store in the tree
-    snr = array('f', [0])
-    amplitude = array('f', [0])
-    toa = array('f', [0])
-    integral = array('f', [0])
-    rise_time = array('f', [0])
-
-    tree.Branch("snr", snr, "snr/F")
-    tree.Branch("amplitude", amplitude, "amplitude/F")
-    tree.Branch("toa", toa, "toa/F")
-    tree.Branch("integral", integral, "integral/F")
-    tree.Branch("rise_time", rise_time, "rise_time/F")
+    writer = BlockWriter(tree)
+    writer.add_scalar("event_number", np.int32)
+    writer.add_scalar("hit", np.bool_)
+    for branch in TREE_COLUMNS:
+        writer.add_scalar(branch, np.float32)
+
+    # TODO, Define with an if hardcoded for each run
+    detector_name = ""
+
+    if jobs > 1 and n_events > 0:
+        results = iter_pulse_ranges(input_file, n_events, jobs, block_size, engine, PROFILER.enabled)
+    else:
+        results = iter_pulse_blocks(input_file, block_size=block_size, engine=engine)
 
     # Write interesting variables into a .txt file for corryvreckan
-    with open(f"{output_path}/signal_data.txt", "w") as f:
+    with open(os.path.join(output_path, "signal_data.txt"), "w") as f:
         f.write("Event_Number, Detector, Charge, ToA\n")
-        for _ in range(df.Count().GetValue()):
-            data = df.Range(_, _+1).AsNumpy(["event_number", "time", "voltage"])
-            event_number = data["event_number"][0]
-            time_vec = np.array(data["time"][0])
-            voltage_vec = np.array(data["voltage"][0])
-
-            pulse = PeakSignal(time = time_vec, samples = voltage_vec, peak_polarity="negative")
-
-            if is_hit(pulse.SNR, pulse.peak_start_time, pulse.rise_time):
-                # TODO, Define with an if hardcoded for each run
-                detector_name = ""  
-                
-                charge = pulse.peak_integral
-                time_of_arrival = pulse.peak_start_time
-                f.write(f"{event_number}, {detector_name}, {charge}, {time_of_arrival}\n")
-
-                snr[0] = pulse.SNR
-                amplitude[0] = pulse.amplitude
-                toa[0] = time_of_arrival
-                integral[0] = charge
-                rise_time[0] = pulse.rise_time
-
-            tree.Fill()
-    root_file.Write()
-    root_file.Close()
-                
+        for event_numbers, pulses, hits in results:
+            write_pulses(f, writer, event_numbers, pulses, hits, detector_name)
+    with PROFILER.timer("tree_write"):
+        root_file.Write()
+        root_file.Close()
+    report_profile(profile_json)
+
 
 if __name__ == "__main__":
     main()
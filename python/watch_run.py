@@ -0,0 +1,264 @@
+# watch_run.py
+# Live conversion during data taking: the run folder is polled for finished cycle_XXXX_chN.wfm files
+# (file size == 15 + num_bytes_to_EOF of the header, so half-written files are never read) and every
+# finished cycle is converted and summarised on a bounded pool of worker processes while the scope
+# keeps writing. When the watch stops the per-cycle files are merged into the write_to_root output.
+import os
+import re
+import json
+import time
+import signal
+import asyncio
+import numpy as np
+import click
+import ROOT
+from wfm2readframe import WfmFile, is_complete
+from features import DEFAULT_FEATURES, FEATURE_DTYPES, parse_features, parse_window
+from manifest import Manifest, manifest_path
+from wfm_to_corry import iter_file_pulses
+from write_to_root import (list_cycle_files, count_events, sample_layout, book_trees, fill_block, fill_calibration,
+                           write_and_close, checkpoint, append_partial, record_file, resume_manifest, process_pool)
+
+
+def _ignore_sigint():
+    # Ctrl-C stops the watcher, which lets the workers finish the cycles they are converting
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def process_cycle(input_file, part_path, channel, run_number, first_event, tree_options):
+    """
+    Worker: convert one finished cycle file into part_path (the write_to_root trees, event numbers
+    starting at first_event) and summarise it in the same pass (pulse_analysis + hit selection).
+    Returns the summary dict.
+    """
+    start = time.perf_counter()
+    raw = tree_options["layout"] == "raw"
+    root_file = ROOT.TFile(part_path, "RECREATE")
+    root_file.SetCompressionLevel(1)
+    output = book_trees(channel, run_number, **tree_options)
+    n_events, n_hits = 0, 0
+    amplitudes, noise, snr = [], [], []
+    # the summary is a quick data quality check: the vectorized engine keeps up with the acquisition
+    blocks = iter_file_pulses(input_file, first_event, raw=raw, engine="vectorized")
+    for event_numbers, pulses, hits, waveforms, time_axis, calibration in blocks:
+        fill_block(output, waveforms, time_axis, int(event_numbers[0]), calibration)
+        n_events += len(event_numbers)
+        n_hits += int(np.count_nonzero(hits))
+        amplitudes.append(pulses["amplitude"][hits])
+        snr.append(pulses["SNR"][hits])
+        noise.append(pulses["noise"])
+    with WfmFile(input_file) as wfm:
+        fill_calibration(output, input_file, wfm, first_event, n_events)
+    write_and_close(root_file)
+
+    def median(values):
+        values = np.concatenate(values) if values else np.empty(0)
+        return float(np.nanmedian(values)) if values.size else None
+
+    return {
+        "file": os.path.basename(input_file),
+        "first_event": int(first_event),
+        "n_events": n_events,
+        "n_hits": n_hits,
+        "hit_fraction": n_hits / n_events if n_events else None,
+        "median_hit_amplitude": median(amplitudes),
+        "median_hit_snr": median(snr),
+        "median_noise": median(noise),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+async def watch(input_folder, output_folder, channel, run_number, tree_options, jobs, interval, idle_timeout,
+                summary_path, first_event=0, skip=()):
+    """
+    Poll input_folder every `interval` seconds and hand each finished cycle file, in cycle order, to one
+    of `jobs` worker processes (at most `jobs` cycles in flight, the rest wait on disk).
+    Event numbers start at first_event and continue from one cycle to the next as in write_to_root,
+    so a cycle is only started once all the earlier ones are complete. The files in skip (already
+    in the output) are ignored.
+    Stops on Ctrl-C / SIGTERM, or after idle_timeout seconds without new files (if given), once the
+    running conversions have finished.
+    A cycle whose conversion fails stops the watch (its events would be missing from the run).
+    Returns the list of (input_file, part_path, summary) in cycle order and the list of failed files.
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    part_dir = os.path.join(output_folder, f"cycles_ch{channel}")
+    os.makedirs(part_dir, exist_ok=True)
+    done = []             # (input_file, part_path, summary)
+    failed = []
+    running = {}          # future -> (input_file, part_path)
+    dispatched = set(skip)
+    next_event = first_event
+    last_new = time.monotonic()
+
+    with process_pool(jobs, initializer=_ignore_sigint) as pool:
+        while True:
+            if not stop.is_set():
+                for input_file in list_cycle_files(input_folder, channel):
+                    if len(running) >= jobs:
+                        break
+                    if input_file in dispatched:
+                        continue
+                    if not is_complete(input_file):
+                        # still being written, and the later cycles need its event count
+                        break
+                    if tree_options["layout"] == "raw" and "nop" not in tree_options:
+                        tree_options["nop"], tree_options["sample_dtype"] = sample_layout(input_file)
+                    part_path = os.path.join(part_dir, os.path.basename(input_file)[:-len(".wfm")] + ".root")
+                    future = loop.run_in_executor(pool, process_cycle, input_file, part_path, channel, run_number,
+                                                  next_event, tree_options)
+                    running[future] = (input_file, part_path)
+                    dispatched.add(input_file)
+                    next_event += count_events(input_file)
+                    last_new = time.monotonic()
+
+            if running:
+                finished, _ = await asyncio.wait(list(running), timeout=interval, return_when=asyncio.FIRST_COMPLETED)
+                for future in finished:
+                    input_file, part_path = running.pop(future)
+                    try:
+                        summary = future.result()
+                    except Exception as e:
+                        print(f"Conversion of {input_file} failed: {type(e).__name__}: {e}")
+                        failed.append(input_file)
+                        stop.set()
+                        continue
+                    done.append((input_file, part_path, summary))
+                    print_summary(summary, len(running))
+                    if summary_path:
+                        with open(summary_path, "a") as f:
+                            f.write(json.dumps(summary) + "\n")
+                continue
+            if stop.is_set():
+                break
+            if idle_timeout is not None and time.monotonic() - last_new > idle_timeout:
+                print(f"No new cycle for {idle_timeout} s, stopping")
+                break
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+    done.sort(key=lambda item: item[2]["first_event"])
+    return done, failed
+
+
+def print_summary(summary, running):
+    hit_fraction = summary["hit_fraction"] or 0
+    amplitude = summary["median_hit_amplitude"]
+    noise = summary["median_noise"]
+    print(f"{summary['file']}: events {summary['first_event']}-{summary['first_event'] + summary['n_events'] - 1}, "
+          f"hits {summary['n_hits']} ({100 * hit_fraction:.1f} %), "
+          f"amplitude {amplitude * 1e3 if amplitude is not None else float('nan'):.1f} mV, "
+          f"noise {noise * 1e3 if noise is not None else float('nan'):.2f} mV, "
+          f"{summary['seconds']:.1f} s ({running} running)")
+
+
+@click.command()
+@click.option('-i', 'input_folder', required=True, help="Run folder the scope writes the .wfm files to")
+@click.option('-o', 'output_folder', type=click.Path(), default=".", help="Output folder")
+@click.option('-c', 'channel', type=int, default=1, help="Channel number to process")
+@click.option('-j', '--jobs', type=int, default=2, show_default=True, help="Worker processes (cycles converted at once)")
+@click.option('--interval', type=float, default=2.0, show_default=True, help="Polling interval (s)")
+@click.option('--idle-timeout', type=float, default=None, help="Stop after this many seconds without a new cycle")
+@click.option('--layout', type=click.Choice(["voltage", "raw"]), default="voltage", help="Layout (see write_to_root)")
+@click.option('--features', 'feature_names', default=",".join(DEFAULT_FEATURES),
+              help=f"Per-event features (see write_to_root): {', '.join(FEATURE_DTYPES)}")
+@click.option('--pedestal-window', default="0:100", help="Sample window start:stop for pedestal and pedestal_rms")
+@click.option('--integral-window', default=None, help="Sample window start:stop for the integral (default: whole record)")
+@click.option('--threshold', type=float, default=None, help="Threshold (V) for threshold_crossing")
+@click.option('--polarity', type=click.Choice(["negative", "positive"]), default="negative",
+              help="Pulse polarity for threshold_crossing")
+@click.option('--no-merge', is_flag=True, help="Keep the per-cycle ROOT files, do not merge them at the end")
+def main(input_folder, output_folder, channel, jobs, interval, idle_timeout, layout, feature_names, pedestal_window,
+         integral_window, threshold, polarity, no_merge):
+    """
+    Watch a run folder during data taking and convert each cycle_XXXX_chN.wfm file as soon as the
+    scope has finished writing it. For every cycle a data quality line (events, hit fraction, median
+    hit amplitude and noise) is printed and appended to watch_summary_ch{channel}.jsonl, and the cycle is
+    written to cycles_ch{channel}/cycle_XXXX_chN.root with its final event numbers.
+    When the watch stops (Ctrl-C, or --idle-timeout), the cycle files are appended to
+    more_waveforms_ch{channel}.root and recorded in its manifest, the same output as write_to_root
+    with the same options (which can later append more cycles with --resume).
+    If that output already exists, the watch continues it as write_to_root --resume does: the cycles
+    in its manifest are skipped and the event numbers continue from its last event. An output that
+    cannot be continued (no manifest, other options, changed cycle files) is refused at the start.
+    """
+    channel = int(channel)
+    input_folder = os.fspath(input_folder)
+    output_folder = os.fspath(output_folder)
+    os.makedirs(output_folder, exist_ok=True)
+    print(f"Watching {input_folder} (channel {channel}, every {interval} s, {jobs} workers)")
+    run_number = None
+    match = re.search(r'run_(\d+)', input_folder)
+    if match:
+        run_number = int(match.group(1))
+        print(f"Detected run number: {run_number}")
+    # the write_to_root options, so the output can be continued with write_to_root --resume
+    tree_options = {
+        "layout": layout,
+        "features": parse_features(feature_names),
+        "feature_options": {
+            "pedestal_window": parse_window(pedestal_window),
+            "integral_window": parse_window(integral_window),
+            "threshold": threshold,
+            "polarity": polarity,
+        },
+    }
+    if "threshold_crossing" in tree_options["features"] and threshold is None:
+        raise click.BadParameter("threshold_crossing needs --threshold")
+    summary_path = os.path.join(output_folder, f"watch_summary_ch{channel}.jsonl")
+
+    # continue an existing output instead of overwriting it
+    out_path = os.path.join(output_folder, f"more_waveforms_ch{channel}.root")
+    manifest = None
+    if os.path.exists(out_path):
+        previous = Manifest.load(manifest_path(out_path))
+        if layout == "raw" and previous is not None and "nop" in previous.settings:
+            # the adc branch of the output was booked with the sample layout of its first file
+            tree_options["nop"] = previous.settings["nop"]
+            tree_options["sample_dtype"] = previous.settings["sample_dtype"]
+        try:
+            manifest = resume_manifest(out_path, dict(tree_options, channel=channel, run_number=run_number),
+                                       list_cycle_files(input_folder, channel))
+        except click.ClickException as e:
+            raise click.ClickException(f"{e.message} (or watch into another output folder with -o)")
+    append = manifest is not None
+    first_event = manifest.n_events if append else 0
+    skip = [os.path.join(input_folder, entry["file"]) for entry in manifest.entries] if append else []
+    if append:
+        print(f"Continuing {out_path}: {len(skip)} cycles already converted, next event {first_event}")
+
+    done, failed = asyncio.run(watch(input_folder, output_folder, channel, run_number, tree_options, jobs, interval,
+                                     idle_timeout, summary_path, first_event=first_event, skip=skip))
+    n_events = sum(summary["n_events"] for _, _, summary in done)
+    print(f"Converted {len(done)} cycles, {n_events} events")
+    if failed:
+        raise click.ClickException(f"Failed cycles: {', '.join(failed)} (the converted cycles are kept, not merged)")
+    if no_merge or not done:
+        return
+
+    print(f"{'Appending' if append else 'Merging'} {len(done)} cycle files into {out_path}")
+    root_file = ROOT.TFile(out_path, "UPDATE" if append else "RECREATE")
+    root_file.SetCompressionLevel(1)
+    output = book_trees(channel, run_number, existing=append, **tree_options)
+    if not append:
+        manifest = Manifest(manifest_path(out_path), dict(tree_options, channel=channel, run_number=run_number))
+        manifest.save()
+    for input_file, part_path, summary in done:
+        # trees first: a manifest entry is only written for events that are safely in the file
+        append_partial(output, part_path)
+        checkpoint(output)
+        record_file(manifest, input_file, summary["first_event"], summary["n_events"])
+        os.remove(part_path)
+    write_and_close(root_file)
+
+
+if __name__ == "__main__":
+    main()
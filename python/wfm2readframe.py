@@ -1,48 +1,295 @@
 # wfm2readframe.py
 import os
+import math
 import struct
-import re
+import threading
 import warnings
+from collections import OrderedDict, namedtuple
 import numpy as np
+from profiling import PROFILER
+from wfm_header import WfmReadError, read_header
 
 
-class WfmReadError(Exception):
-    pass
+def _normalize_filename(filename):
+    """Añade la extensión .wfm si falta y comprueba que el fichero existe."""
+    # normalizar nombre fichero
+    base_p, base_n = os.path.split(filename)
+    if base_p == '':
+        base_p = '.'
+    name_noext, ext = os.path.splitext(base_n)
+    if ext.lower() != '.wfm':
+        filename = os.path.join(base_p, name_noext + '.wfm')
+    else:
+        filename = os.path.join(base_p, base_n)
 
+    if not os.path.isfile(filename):
+        raise FileNotFoundError(f"Invalid file name: {filename}")
+    return filename, name_noext
+
+
+def _data_dtype(ed1, endian, wfm_version, filename):
+    """Devuelve el np.dtype de las muestras de la curva según ed1.format(1)."""
+    # decidir formato de datos según ed1.format(1)
+    fmt_code = ed1['format'][0]  # primer elemento
+    # mapa de formatos basado en el .m
+    if fmt_code == 0:
+        np_fmt = 'i2'  # int16
+    elif fmt_code == 1:
+        np_fmt = 'i4'  # int32
+    elif fmt_code == 2:
+        np_fmt = 'u4'  # uint32
+    elif fmt_code == 3:
+        np_fmt = 'u8'  # uint64
+    elif fmt_code == 4:
+        np_fmt = 'f4'  # float32
+    elif fmt_code == 5:
+        np_fmt = 'f8'  # float64
+    elif fmt_code == 6:
+        if wfm_version >= 3:
+            np_fmt = 'u1'  # uint8
+        else:
+            raise WfmReadError(f"invalid data format or error in file {filename}")
+    elif fmt_code == 7:
+        if wfm_version >= 3:
+            np_fmt = 'i1'  # int8
+        else:
+            raise WfmReadError(f"invalid data format or error in file {filename}")
+    else:
+        raise WfmReadError(f"invalid data format or error in file {filename}")
+    return np.dtype(endian + np_fmt)
+
+
+def _resolve_nop(nop_all, datapoints, step, startind, name_noext):
+    """Número de puntos a devolver según datapoints, step y startind (como en el .m)."""
+    # nop: disponible desde startind hasta postcharge
+    nop = nop_all - startind + 1
+
+    # gestión de parametros datapoints, step, startind
+    if datapoints is not None:
+        # comprobar datapoints válido
+        if datapoints < 1 or int(datapoints) != datapoints:
+            # MATLAB: set to max number of datapoints and advertir
+            datapoints = int(np.floor(nop / step))
+            warnings.warn(f'"datapoints" input parameter must be a positive integer. Setting datapoints= {datapoints}.', UserWarning)
+        nop_possible = int(np.floor(nop / step))
+        if datapoints > nop_possible:
+            warnings.warn(('The requested combination of input parameters datapoints, step and startind would require at least '
+                           f'{datapoints*step + startind - 1} data points in {name_noext}. The actual number of data points in the trace is only {nop_all}. '
+                           f'The number of data points returned is thus only {nop_possible} instead of {datapoints}.'), UserWarning)
+            nop = nop_possible
+        else:
+            nop = int(datapoints)
+    else:
+        # si datapoints no especificado, tomar el máximo usando step
+        nop = int(np.floor(nop / step))
+    return nop
 
-def _read_struct(f, fmt):
-    size = struct.calcsize(fmt)
-    data = f.read(size)
-    if len(data) != size:
-        raise WfmReadError("Lectura incompleta: se esperaban {} bytes, leídos {}".format(size, len(data)))
-    return struct.unpack(fmt, data)
 
+def _read_header(f):
+    """
+    Lee la cabecera completa (static file info, waveform header, dimensiones y time bases)
+    con el parser precompilado de wfm_header (una sola lectura y un solo unpack).
+    Deja el fichero posicionado al inicio de la primera update spec.
+    Devuelve: info, endian, wfm_version, pos_before_updatespec
+    """
+    header = read_header(f)
+    # pos_before_updatespec: en MATLAB comentan que vale 768 para wfm002
+    return header.to_info(), header.endian, header.version, header.size
 
-def _read_fmt(f, endian, base_fmt, count=1):
-    fmt = endian + base_fmt
-    if count == 1:
-        return _read_struct(f, fmt)[0]
-    else:
-        size = struct.calcsize(fmt) * count
-        data = f.read(size)
-        if len(data) != size:
-            raise WfmReadError("Lectura incompleta (array).")
-        return struct.unpack(fmt * count, data)
-
-
-def _read_chars_until_null(bytes_block):
-    # devuelve string hasta el primer \x00
-    idx = bytes_block.find(b'\x00')
-    if idx == -1:
-        return bytes_block.decode(errors='ignore')
-    else:
-        return bytes_block[:idx].decode(errors='ignore')
 
+# --- caché LRU de cabeceras ---
+# clave: realpath; cada entrada guarda (size, mtime_ns) del fichero y se invalida sola
+# si el osciloscopio reescribe el fichero (p.ej. un cycle_XXXX que se sobrescribe)
+HeaderCacheInfo = namedtuple('HeaderCacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
 
-def wfm2readframe(filename, frame, datapoints=None, step=1, startind=1):
+_header_cache = OrderedDict()
+_header_cache_lock = threading.Lock()
+_header_cache_maxsize = 128
+_header_cache_hits = 0
+_header_cache_misses = 0
+
+
+def _copy_info(info):
+    # copia de info y de sus sub-dicts (ed1, ed2, id1, id2) para no tocar la caché
+    return {k: (dict(v) if isinstance(v, dict) else v) for k, v in info.items()}
+
+
+def _cached_header(filename):
+    """
+    Igual que _read_header pero pasando por la caché LRU.
+    Devuelve: info (copia), endian, wfm_version, pos_before_updatespec
+    """
+    global _header_cache_hits, _header_cache_misses
+    st = os.stat(filename)
+    key = os.path.realpath(filename)
+    stamp = (st.st_size, st.st_mtime_ns)
+
+    with _header_cache_lock:
+        entry = _header_cache.get(key)
+        if entry is not None and entry[0] == stamp:
+            _header_cache_hits += 1
+            _header_cache.move_to_end(key)
+            info, endian, wfm_version, pos_before_updatespec = entry[1]
+            return _copy_info(info), endian, wfm_version, pos_before_updatespec
+        _header_cache_misses += 1
+
+    with PROFILER.timer("header_parse"), open(filename, 'rb') as f:
+        header = _read_header(f)
+    PROFILER.count("header_parses")
+
+    with _header_cache_lock:
+        if _header_cache_maxsize > 0:
+            _header_cache[key] = (stamp, header)
+            _header_cache.move_to_end(key)
+            while len(_header_cache) > _header_cache_maxsize:
+                _header_cache.popitem(last=False)
+    info, endian, wfm_version, pos_before_updatespec = header
+    return _copy_info(info), endian, wfm_version, pos_before_updatespec
+
+
+def header_cache_info():
+    """Estadísticas de la caché de cabeceras (hits, misses, maxsize, currsize)."""
+    with _header_cache_lock:
+        return HeaderCacheInfo(_header_cache_hits, _header_cache_misses, _header_cache_maxsize, len(_header_cache))
+
+
+def header_cache_clear():
+    """Vacía la caché de cabeceras y pone a cero los contadores."""
+    global _header_cache_hits, _header_cache_misses
+    with _header_cache_lock:
+        _header_cache.clear()
+        _header_cache_hits = 0
+        _header_cache_misses = 0
+
+
+def set_header_cache_size(maxsize):
+    """Cambia el número máximo de cabeceras en caché (0 la desactiva)."""
+    global _header_cache_maxsize
+    if maxsize < 0 or int(maxsize) != maxsize:
+        raise ValueError("maxsize debe ser un entero >= 0.")
+    with _header_cache_lock:
+        _header_cache_maxsize = int(maxsize)
+        while len(_header_cache) > _header_cache_maxsize:
+            _header_cache.popitem(last=False)
+
+
+def _read_spec(f, dtype, info):
+    """Lee una spec con su structured dtype y guarda sus campos en info (como tipos de Python)."""
+    buf = f.read(dtype.itemsize)
+    if len(buf) != dtype.itemsize:
+        raise WfmReadError("Lectura incompleta de la update/curve spec.")
+    record = np.frombuffer(buf, dtype=dtype)[0]
+    for name in dtype.names:
+        value = record[name].tolist()
+        info[name] = tuple(value) if isinstance(value, list) else value
+
+
+def _read_frame_specs(f, info, endian, pos_before_updatespec, frame):
+    """Lee la update spec y la curve spec del frame pedido y las guarda en info."""
+    update_spec, curve_spec = _spec_dtypes(endian)
+    # si frame>1, mover al bloque de actualización específico
+    if frame > 1:
+        # desplazamiento: pos_before_updatespec + 54 + (frame-2)*24
+        f.seek(pos_before_updatespec + 54 + (frame - 2) * update_spec.itemsize, os.SEEK_SET)
+    else:
+        f.seek(pos_before_updatespec, os.SEEK_SET)
+
+    # wfm update specification (para frame solicitado)
+    _read_spec(f, update_spec, info)
+
+    if frame > 1:
+        f.seek(pos_before_updatespec + 54 + info['N'] * update_spec.itemsize + (frame - 2) * curve_spec.itemsize,
+               os.SEEK_SET)
+
+    # wfm curve information
+    _read_spec(f, curve_spec, info)
+
+
+def _spec_dtypes(endian):
+    """Structured dtypes de la wfm update spec (24 bytes) y de la wfm curve spec (30 bytes)."""
+    update_spec = np.dtype([
+        ('real_point_offset', endian + 'u4'),
+        ('tt_offset', endian + 'f8'),
+        ('frac_sec', endian + 'f8'),
+        ('GMT_sec', endian + 'i4'),
+    ])
+    curve_spec = np.dtype([
+        ('state_flags', endian + 'u4'),
+        ('type_of_checksum', 'i1', (4,)),
+        ('checksum', endian + 'i2'),
+        ('precharge_start_offset', endian + 'u4'),
+        ('data_start_offset', endian + 'u4'),
+        ('postcharge_start_offset', endian + 'u4'),
+        ('postcharge_stop_offset', endian + 'u4'),
+        ('end_of_curve_buffer_offset', endian + 'u4'),
+    ])
+    return update_spec, curve_spec
+
+
+FRAME_TABLE_DTYPE = np.dtype([
+    ('frame', 'i8'),                      # número de frame (1-based, como en wfm2readframe)
+    ('GMT_sec', 'i8'),                    # segundos enteros desde 1970 (valor exacto del fichero)
+    ('frac_sec', 'f8'),                   # fracción de segundo (valor exacto del fichero)
+    ('timestamp', 'f8'),                  # GMT_sec + frac_sec, solo por comodidad (ver read_frame_table)
+    ('tt_offset', 'f8'),                  # offset del trigger en fracción de muestra
+    ('real_point_offset', 'u4'),
+    ('state_flags', 'u4'),
+    ('checksum', 'i2'),
+    ('precharge_start_offset', 'u4'),
+    ('data_start_offset', 'u4'),
+    ('postcharge_start_offset', 'u4'),
+    ('postcharge_stop_offset', 'u4'),
+    ('end_of_curve_buffer_offset', 'u4'),
+    ('byte_offset', 'i8'),                # posición absoluta en el fichero de la primera muestra
+])
+
+
+def _read_frame_table(f, info, endian, pos_before_updatespec):
+    """
+    Decodifica de una vez las update specs y curve specs de todos los frames.
+    El frame 1 está justo en pos_before_updatespec (24 + 30 bytes); los N restantes vienen
+    después como dos arrays contiguos (N update specs y luego N curve specs).
+    """
+    n_extra = int(info['N'])
+    update_spec, curve_spec = _spec_dtypes(endian)
+    nbytes = (n_extra + 1) * (update_spec.itemsize + curve_spec.itemsize)
+    f.seek(pos_before_updatespec, os.SEEK_SET)
+    buf = f.read(nbytes)
+    if len(buf) != nbytes:
+        raise WfmReadError("Lectura incompleta de las update/curve specs.")
+
+    first_len = update_spec.itemsize + curve_spec.itemsize
+    updates = np.concatenate([
+        np.frombuffer(buf, dtype=update_spec, count=1, offset=0),
+        np.frombuffer(buf, dtype=update_spec, count=n_extra, offset=first_len),
+    ])
+    curves = np.concatenate([
+        np.frombuffer(buf, dtype=curve_spec, count=1, offset=update_spec.itemsize),
+        np.frombuffer(buf, dtype=curve_spec, count=n_extra, offset=first_len + n_extra * update_spec.itemsize),
+    ])
+
+    table = np.zeros(n_extra + 1, dtype=FRAME_TABLE_DTYPE)
+    table['frame'] = np.arange(1, n_extra + 2)
+    for name in update_spec.names:
+        table[name] = updates[name]
+    for name in curve_spec.names:
+        if name != 'type_of_checksum':
+            table[name] = curves[name]
+    # comodidad con resolución de float64 (~0.2 µs hoy); el valor exacto queda en GMT_sec y frac_sec
+    table['timestamp'] = table['GMT_sec'] + table['frac_sec']
+    # mismo cálculo de offset que wfm2readframe (geometría del frame 1 para todos)
+    curve_offset = pos_before_updatespec + (n_extra + 1) * 54
+    frame_bytes = int(curves['end_of_curve_buffer_offset'][0]) - int(curves['precharge_start_offset'][0])
+    table['byte_offset'] = curve_offset + frame_bytes * np.arange(n_extra + 1) + table['data_start_offset']
+    return table
+
+
+def wfm2readframe(filename, frame, datapoints=None, step=1, startind=1, raw=False):
     """
     Traducción fiel a Python del wfm2readframe.m de Erik Benkler.
     Devuelve: y, t, info, ind_over, ind_under
+    Con raw=True, y son las muestras crudas en su dtype nativo (int8/int16/...) sin escalar;
+    el par (scale, offset) está siempre en info['calibration'] (ver calibrate()).
     """
 
     # --- comprobaciones iniciales de argumentos ---
@@ -53,204 +300,14 @@ def wfm2readframe(filename, frame, datapoints=None, step=1, startind=1):
     if datapoints is not None and (datapoints < 1 or int(datapoints) != datapoints):
         raise ValueError("datapoints debe ser entero positivo si se especifica.")
 
-    # normalizar nombre fichero
-    base_p, base_n = os.path.split(filename)
-    if base_p == '':
-        base_p = '.'
-    name_noext, ext = os.path.splitext(base_n)
-    if ext.lower() != '.wfm':
-        filename = os.path.join(base_p, name_noext + '.wfm')
-    else:
-        filename = os.path.join(base_p, base_n)
+    filename, name_noext = _normalize_filename(filename)
 
-    if not os.path.isfile(filename):
-        raise FileNotFoundError(f"Invalid file name: {filename}")
-
-    info = {}
+    # la cabecera sale de la caché; sólo se abre el fichero para las specs del frame y los datos
+    info, endian, wfm_version, pos_before_updatespec = _cached_header(filename)
 
     with open(filename, 'rb') as f:
-        # byte order verification (uint16)
-        b = f.read(2)
-        if len(b) < 2:
-            raise WfmReadError("Archivo demasiado corto.")
-        # leer como little endian primero para comparar con 0x0F0F
-        v_le = struct.unpack('<H', b)[0]
-        if v_le == 0x0F0F:
-            endian = '<'  # little-endian
-            info['byte_order_verification'] = format(v_le, '04X')
-        else:
-            # si no coincide, asumimos big-endian
-            v_be = struct.unpack('>H', b)[0]
-            endian = '>'
-            info['byte_order_verification'] = format(v_be, '04X')
-
-        # versioning_number: 8 bytes string
-        ver_bytes = f.read(8)
-        info['versioning_number'] = ver_bytes.decode(errors='ignore')
-        # intentar parsear WFM#n
-        m = re.search(r':?WFM#\s*?(\d{1,3})', info['versioning_number'])
-        if m:
-            wfm_version = int(m.group(1))
-        else:
-            # fallback: coger dígitos finales si existen
-            digits = re.findall(r'\d+', info['versioning_number'])
-            wfm_version = int(digits[-1]) if digits else 1
-        if wfm_version > 3:
-            warnings.warn("WFM2read:HigherVersionNumber - wfm2read has only been tested with WFM file versions <= 3")
-
-        # ahora seguir lectura tal como en MATLAB: varios campos con el endianness detectado
-        # num_digits_in_byte_count : uint8
-        info['num_digits_in_byte_count'] = _read_fmt(f, endian, 'B')
-        info['num_bytes_to_EOF'] = _read_fmt(f, endian, 'i')  # int32
-        info['num_bytes_per_point'] = _read_fmt(f, endian, 'B')  # uint8
-        info['byte_offset_to_beginning_of_curve_buffer'] = _read_fmt(f, endian, 'I')  # uint32
-        info['horizontal_zoom_scale_factor'] = _read_fmt(f, endian, 'i')  # int32
-        info['horizontal_zoom_position'] = _read_fmt(f, endian, 'f')  # float32
-        info['vertical_zoom_scale_factor'] = _read_fmt(f, endian, 'd')  # double
-        info['vertical_zoom_position'] = _read_fmt(f, endian, 'f')  # float32
-
-        dummy = f.read(32)
-        info['waveform_label'] = _read_chars_until_null(dummy)
-
-        info['N'] = _read_fmt(f, endian, 'I')  # uint32
-        info['size_of_waveform_header'] = _read_fmt(f, endian, 'H')  # uint16
-
-        # --- waveform header ---
-        # setType: 4 * int8
-        info['setType'] = struct.unpack(endian + '4b', f.read(4))
-        info['wfmCnt'] = _read_fmt(f, endian, 'I')
-        f.read(24)  # skip bytes 86..109 (not used)
-        info['wfm_update_spec_count'] = _read_fmt(f, endian, 'I')
-        info['imp_dim_ref_count'] = _read_fmt(f, endian, 'I')
-        info['exp_dim_ref_count'] = _read_fmt(f, endian, 'I')
-        # data_type: 4 * int8
-        info['data_type'] = struct.unpack(endian + '4b', f.read(4))
-        f.read(16)  # skip bytes 126..141
-        info['curve_ref_count'] = _read_fmt(f, endian, 'I')
-        info['num_req_fast_frames'] = _read_fmt(f, endian, 'I')
-        info['num_acq_fast_frames'] = _read_fmt(f, endian, 'I')
-
-        if wfm_version >= 2:
-            info['summary_frame_type'] = _read_fmt(f, endian, 'H')
-
-        # pixmap stuff
-        info['pixmap_display_format'] = struct.unpack(endian + '4b', f.read(4))
-        # uint64 (cuidado con plataformas) -> leer como unsigned long long
-        info['pixmap_max_value'] = _read_fmt(f, endian, 'Q')
-
-        # --- explicit dimension 1 (ed1) ---
-        ed1 = {}
-        ed1['dim_scale'] = _read_fmt(f, endian, 'd')
-        ed1['dim_offset'] = _read_fmt(f, endian, 'd')
-        ed1['dim_size'] = _read_fmt(f, endian, 'I')
-        dummy = f.read(20)
-        ed1['units'] = _read_chars_until_null(dummy)
-        ed1['dim_extent_min'] = _read_fmt(f, endian, 'd')
-        ed1['dim_extent_max'] = _read_fmt(f, endian, 'd')
-        ed1['dim_resolution'] = _read_fmt(f, endian, 'd')
-        ed1['dim_ref_point'] = _read_fmt(f, endian, 'd')
-        ed1['format'] = struct.unpack(endian + '4b', f.read(4))
-        ed1['storage_type'] = struct.unpack(endian + '4b', f.read(4))
-        ed1['n_value'] = _read_fmt(f, endian, 'i')
-        ed1['over_range'] = _read_fmt(f, endian, 'i')
-        ed1['under_range'] = _read_fmt(f, endian, 'i')
-        ed1['high_range'] = _read_fmt(f, endian, 'i')
-        ed1['low_range'] = _read_fmt(f, endian, 'i')
-        ed1['user_scale'] = _read_fmt(f, endian, 'd')
-        # user_units: 20 bytes then trim at NULL
-        ed1['user_units'] = _read_chars_until_null(f.read(20))
-        # user_offset variable name in MATLAB seems mal nombrado (ed1.user_offset)
-        ed1['user_offset'] = _read_fmt(f, endian, 'd')
-
-        if wfm_version >= 3:
-            ed1['point_density'] = _read_fmt(f, endian, 'd')
-        else:
-            ed1['point_density'] = _read_fmt(f, endian, 'I')
-
-        ed1['href'] = _read_fmt(f, endian, 'd')
-        ed1['trig_delay'] = _read_fmt(f, endian, 'd')
-
-        # --- explicit dimension 2 (ed2) ---
-        ed2 = {}
-        ed2['dim_scale'] = _read_fmt(f, endian, 'd')
-        ed2['dim_offset'] = _read_fmt(f, endian, 'd')
-        ed2['dim_size'] = _read_fmt(f, endian, 'I')
-        dummy = f.read(20)
-        ed2['units'] = _read_chars_until_null(dummy)
-        ed2['dim_extent_min'] = _read_fmt(f, endian, 'd')
-        ed2['dim_extent_max'] = _read_fmt(f, endian, 'd')
-        ed2['dim_resolution'] = _read_fmt(f, endian, 'd')
-        ed2['dim_ref_point'] = _read_fmt(f, endian, 'd')
-        ed2['format'] = struct.unpack(endian + '4b', f.read(4))
-        ed2['storage_type'] = struct.unpack(endian + '4b', f.read(4))
-        ed2['n_value'] = _read_fmt(f, endian, 'i')
-        ed2['over_range'] = _read_fmt(f, endian, 'i')
-        ed2['under_range'] = _read_fmt(f, endian, 'i')
-        ed2['high_range'] = _read_fmt(f, endian, 'i')
-        ed2['low_range'] = _read_fmt(f, endian, 'i')
-        ed2['user_scale'] = _read_fmt(f, endian, 'd')
-        ed2['user_units'] = _read_chars_until_null(f.read(20))
-        ed2['user_offset'] = _read_fmt(f, endian, 'd')
-        if wfm_version >= 3:
-            ed2['point_density'] = _read_fmt(f, endian, 'd')
-        else:
-            ed2['point_density'] = _read_fmt(f, endian, 'I')
-        ed2['href'] = _read_fmt(f, endian, 'd')
-        ed2['trig_delay'] = _read_fmt(f, endian, 'd')
-
-        # --- implicit dimension 1 (id1) ---
-        id1 = {}
-        id1['dim_scale'] = _read_fmt(f, endian, 'd')
-        id1['dim_offset'] = _read_fmt(f, endian, 'd')
-        id1['dim_size'] = _read_fmt(f, endian, 'I')
-        id1['user_units'] = _read_chars_until_null(f.read(20))
-        # note: in MATLAB they call this info.id1.units earlier; preserve key naming
-        id1['units'] = id1['user_units']
-        id1['dim_extent_min'] = _read_fmt(f, endian, 'd')
-        id1['dim_extent_max'] = _read_fmt(f, endian, 'd')
-        id1['dim_resolution'] = _read_fmt(f, endian, 'd')
-        id1['dim_ref_point'] = _read_fmt(f, endian, 'd')
-        id1['spacing'] = _read_fmt(f, endian, 'I')
-        id1['user_scale'] = _read_fmt(f, endian, 'd')
-        id1['user_units'] = _read_chars_until_null(f.read(20))
-        id1['user_offset'] = _read_fmt(f, endian, 'd')
-        if wfm_version >= 3:
-            id1['point_density'] = _read_fmt(f, endian, 'd')
-        else:
-            id1['point_density'] = _read_fmt(f, endian, 'I')
-        id1['href'] = _read_fmt(f, endian, 'd')
-        id1['trig_delay'] = _read_fmt(f, endian, 'd')
-
-        # --- implicit dimension 2 (id2) ---
-        id2 = {}
-        id2['dim_scale'] = _read_fmt(f, endian, 'd')
-        id2['dim_offset'] = _read_fmt(f, endian, 'd')
-        id2['dim_size'] = _read_fmt(f, endian, 'I')
-        id2['units'] = _read_chars_until_null(f.read(20))
-        id2['dim_extent_min'] = _read_fmt(f, endian, 'd')
-        id2['dim_extent_max'] = _read_fmt(f, endian, 'd')
-        id2['dim_resolution'] = _read_fmt(f, endian, 'd')
-        id2['dim_ref_point'] = _read_fmt(f, endian, 'd')
-        id2['spacing'] = _read_fmt(f, endian, 'I')
-        id2['user_scale'] = _read_fmt(f, endian, 'd')
-        id2['user_units'] = _read_chars_until_null(f.read(20))
-        id2['user_offset'] = _read_fmt(f, endian, 'd')
-        if wfm_version >= 3:
-            id2['point_density'] = _read_fmt(f, endian, 'd')
-        else:
-            id2['point_density'] = _read_fmt(f, endian, 'I')
-        id2['href'] = _read_fmt(f, endian, 'd')
-        id2['trig_delay'] = _read_fmt(f, endian, 'd')
-
-        # time base 1
-        info['tb1_real_point_spacing'] = _read_fmt(f, endian, 'I')
-        info['tb1_sweep'] = struct.unpack(endian + '4b', f.read(4))
-        info['tb1_type_of_base'] = struct.unpack(endian + '4b', f.read(4))
-
-        # time base 2
-        info['tb2_real_point_spacing'] = _read_fmt(f, endian, 'I')
-        info['tb2_sweep'] = struct.unpack(endian + '4b', f.read(4))
-        info['tb2_type_of_base'] = struct.unpack(endian + '4b', f.read(4))
+        ed1 = info['ed1']
+        id1 = info['id1']
 
         # --- comprobar existencia del frame pedido ---
         # MATLAB uses (~isa(frame,'integer') && ((frame>(info.N+1)) || (frame<=0))) - we check integer-ness
@@ -259,60 +316,9 @@ def wfm2readframe(filename, frame, datapoints=None, step=1, startind=1):
         if (frame > (info['N'] + 1)) or (frame <= 0):
             raise ValueError(f"Frame number {frame} provided in call to wfm2readframe does not exist in file {filename}")
 
-        # guardamos posición antes de la update spec (equivalente ftell)
-        pos_before_updatespec = f.tell()  # en MATLAB comentan que vale 768 para wfm002
-
-        # si frame>1, mover al bloque de actualización específico
-        if frame > 1:
-            # desplazamiento: pos_before_updatespec + 54 + (frame-2)*24
-            f.seek(pos_before_updatespec + 54 + (frame - 2) * 24, os.SEEK_SET)
-
-        # wfm update specification (para frame solicitado)
-        info['real_point_offset'] = _read_fmt(f, endian, 'I')
-        info['tt_offset'] = _read_fmt(f, endian, 'd')
-        info['frac_sec'] = _read_fmt(f, endian, 'd')
-        info['GMT_sec'] = _read_fmt(f, endian, 'i')
-
-        if frame > 1:
-            f.seek(pos_before_updatespec + 54 + info['N'] * 24 + (frame - 2) * 30, os.SEEK_SET)
-
-        # wfm curve information
-        info['state_flags'] = _read_fmt(f, endian, 'I')
-        info['type_of_checksum'] = struct.unpack(endian + '4b', f.read(4))
-        info['checksum'] = _read_fmt(f, endian, 'h')  # int16
-        info['precharge_start_offset'] = _read_fmt(f, endian, 'I')
-        info['data_start_offset'] = _read_fmt(f, endian, 'I')
-        info['postcharge_start_offset'] = _read_fmt(f, endian, 'I')
-        info['postcharge_stop_offset'] = _read_fmt(f, endian, 'I')
-        info['end_of_curve_buffer_offset'] = _read_fmt(f, endian, 'I')
-
-        # decidir formato de datos según ed1.format(1)
-        fmt_code = ed1['format'][0]  # primer elemento
-        # mapa de formatos basado en el .m
-        if fmt_code == 0:
-            np_fmt = 'i2'  # int16
-        elif fmt_code == 1:
-            np_fmt = 'i4'  # int32
-        elif fmt_code == 2:
-            np_fmt = 'u4'  # uint32
-        elif fmt_code == 3:
-            np_fmt = 'u8'  # uint64
-        elif fmt_code == 4:
-            np_fmt = 'f4'  # float32
-        elif fmt_code == 5:
-            np_fmt = 'f8'  # float64
-        elif fmt_code == 6:
-            if wfm_version >= 3:
-                np_fmt = 'u1'  # uint8
-            else:
-                raise WfmReadError(f"invalid data format or error in file {filename}")
-        elif fmt_code == 7:
-            if wfm_version >= 3:
-                np_fmt = 'i1'  # int8
-            else:
-                raise WfmReadError(f"invalid data format or error in file {filename}")
-        else:
-            raise WfmReadError(f"invalid data format or error in file {filename}")
+        _read_frame_specs(f, info, endian, pos_before_updatespec, frame)
+
+        np_dtype = _data_dtype(ed1, endian, wfm_version, filename)
 
         # --- leer datos de la curva del frame seleccionado ---
         # offset tal como en MATLAB:
@@ -322,37 +328,17 @@ def wfm2readframe(filename, frame, datapoints=None, step=1, startind=1):
         # número total de puntos almacenados en archivo (en la porción de "data")
         nop_all = int((info['postcharge_start_offset'] - info['data_start_offset']) / info['num_bytes_per_point'])
 
-        # nop: disponible desde startind hasta postcharge
-        nop = nop_all - startind + 1
-
-        # gestión de parametros datapoints, step, startind
-        if datapoints is not None:
-            # comprobar datapoints válido
-            if datapoints < 1 or int(datapoints) != datapoints:
-                # MATLAB: set to max number of datapoints and advertir
-                datapoints = int(np.floor(nop / step))
-                warnings.warn(f'"datapoints" input parameter must be a positive integer. Setting datapoints= {datapoints}.', UserWarning)
-            nop_possible = int(np.floor(nop / step))
-            if datapoints > nop_possible:
-                warnings.warn(('The requested combination of input parameters datapoints, step and startind would require at least '
-                               f'{datapoints*step + startind - 1} data points in {name_noext}. The actual number of data points in the trace is only {nop_all}. '
-                               f'The number of data points returned is thus only {nop_possible} instead of {datapoints}.'), UserWarning)
-                nop = nop_possible
-            else:
-                nop = int(datapoints)
-        else:
-            # si datapoints no especificado, tomar el máximo usando step
-            nop = int(np.floor(nop / step))
-
-        # ahora leer la porción de bytes que contiene nop_all puntos (desde startind), y luego sustituir/seleccionar
-        # cuántos bytes necesitamos leer: (nop * step) * num_bytes_per_point   ??? No: necesitamos leer nop*step valores.
-        # Mejor leer todos los nop_all valores completos disponibles y luego tomar el slice.
-        # Para eso calculamos el número de bytes desde offset hasta postcharge_start_offset
-        bytes_to_read = int((info['postcharge_start_offset'] - info['data_start_offset']) - (startind - 1) * info['num_bytes_per_point'])
+        nop = _resolve_nop(nop_all, datapoints, step, startind, name_noext)
+
+        # leer sólo los bytes que cubren los nop puntos pedidos (del primero al último con paso step),
+        # no todo el registro hasta el postcharge
+        bytes_to_read = ((nop - 1) * step + 1) * int(info['num_bytes_per_point']) if nop > 0 else 0
         f.seek(offset, os.SEEK_SET)
-        data_bytes = f.read(bytes_to_read)
-        # interpretar el bloque con numpy según np_fmt y endianness
-        np_dtype = np.dtype(endian + np_fmt)
+        with PROFILER.timer("disk_read"):
+            data_bytes = f.read(bytes_to_read)
+        PROFILER.count("bytes_read", len(data_bytes))
+        PROFILER.count("frames")
+        # interpretar el bloque con numpy según dtype y endianness
         # si la longitud no es múltiplo del tamaño del dtype, recortamos
         itemsize = np_dtype.itemsize
         n_items = len(data_bytes) // itemsize
@@ -363,7 +349,7 @@ def wfm2readframe(filename, frame, datapoints=None, step=1, startind=1):
         # ahora seleccionar los valores: arr[0 : nop*step : step]
         # pero en MATLAB values = fread(fid, nop, format, info.num_bytes_per_point*(step-1), byteorder)
         # equivalencia: tomar el primer elemento, luego cada 'step'
-        values = arr[0:(nop * step):step].astype(np.float64)  # convertir a float64 para seguridad
+        values = arr[0:(nop * step):step]
 
         # eje temporal t y escala y
         # t = info.id1.dim_offset + info.id1.dim_scale * (startind+(1:step:(nop*step))'-1);
@@ -372,7 +358,11 @@ def wfm2readframe(filename, frame, datapoints=None, step=1, startind=1):
         t = id1['dim_offset'] + id1['dim_scale'] * (indices - 1)
 
         # y = info.ed1.dim_offset + info.ed1.dim_scale * values;
-        y = ed1['dim_offset'] + ed1['dim_scale'] * values
+        with PROFILER.timer("decode"):
+            if raw:
+                y = values.copy()
+            else:
+                y = ed1['dim_offset'] + ed1['dim_scale'] * values.astype(np.float64)
 
         # over/under range: MATLAB usa
         # ind_over=find(values==info.ed1.over_range);
@@ -381,6 +371,7 @@ def wfm2readframe(filename, frame, datapoints=None, step=1, startind=1):
         ind_under = np.where(values <= -ed1['over_range'])[0]
 
         # rellenar info final
+        info['calibration'] = (ed1['dim_scale'], ed1['dim_offset'])
         info['yunit'] = ed1['units']
         info['tunit'] = id1['units']
         info['yres'] = ed1['dim_resolution']
@@ -396,16 +387,409 @@ def wfm2readframe(filename, frame, datapoints=None, step=1, startind=1):
         info['n_over'] = int(len(ind_over))
         info['n_under'] = int(len(ind_under))
 
-        # empaquetar los sub-structs en info para devolver
-        info['ed1'] = ed1
-        info['ed2'] = ed2
-        info['id1'] = id1
-        info['id2'] = id2
-
     # devolver arrays en forma numpy
     return y, t, info, ind_over, ind_under
 
 
+# presupuesto de memoria por defecto para iter_frame_blocks
+DEFAULT_BLOCK_BYTES = 256 * 1024**2
+
+
+class WfmFile:
+    """
+    Acceso a todos los frames FastFrame de un fichero .wfm sin copias.
+
+    La cabecera se lee una única vez y el curve buffer se mapea en memoria (np.memmap),
+    así que sólo se leen del disco las páginas que realmente se usan.
+    Atributos principales:
+      raw   : vista (n_frames, nop) sobre las muestras crudas (dtype nativo, sólo lectura).
+              El precharge/postcharge de cada frame se salta con np.lib.stride_tricks.
+      time  : eje temporal común a todos los frames.
+      info  : cabecera, igual que la que devuelve wfm2readframe para el frame 1.
+    Los índices de raw y de wfm[...] empiezan en 0 (frame k de wfm2readframe -> fila k-1).
+    """
+
+    def __init__(self, filename):
+        self.filename, self.name = _normalize_filename(filename)
+
+        info, endian, wfm_version, pos_before_updatespec = _cached_header(self.filename)
+        with open(self.filename, 'rb') as f:
+            # los offsets de la curve spec del frame 1 son los mismos para todos los frames
+            _read_frame_specs(f, info, endian, pos_before_updatespec, 1)
+
+        ed1 = info['ed1']
+        id1 = info['id1']
+        self.info = info
+        self.endian = endian
+        self.version = wfm_version
+        self.dtype = _data_dtype(ed1, endian, wfm_version, self.filename)
+        self.scale = ed1['dim_scale']
+        self.offset = ed1['dim_offset']
+        self.calibration = (self.scale, self.offset)
+
+        # geometría del curve buffer, igual que en wfm2readframe
+        self._pos_before_updatespec = pos_before_updatespec
+        self._frame_table = None
+        self.curve_offset = int(pos_before_updatespec + (info['N'] + 1) * 54)
+        self.frame_bytes = int(info['end_of_curve_buffer_offset'] - info['precharge_start_offset'])
+        self.nop = int((info['postcharge_start_offset'] - info['data_start_offset']) / info['num_bytes_per_point'])
+        data_offset = self.curve_offset + int(info['data_start_offset'])
+
+        n_frames = int(info['N']) + 1
+        file_size = os.path.getsize(self.filename)
+        row_bytes = self.nop * self.dtype.itemsize
+        # un fichero cortado (p.ej. todavía escribiéndose) sólo expone los frames completos
+        if n_frames > 0 and data_offset + (n_frames - 1) * self.frame_bytes + row_bytes > file_size:
+            complete = max(0, (file_size - data_offset - row_bytes) // self.frame_bytes + 1) if self.frame_bytes > 0 else 0
+            warnings.warn(f"{self.filename} is truncated: only {complete} of {n_frames} frames are complete.", UserWarning)
+            n_frames = int(complete)
+        self.n_frames = n_frames
+
+        if n_frames > 0:
+            self._mm = np.memmap(self.filename, dtype=np.uint8, mode='r')
+            first = np.frombuffer(self._mm, dtype=self.dtype, count=self.nop, offset=data_offset)
+            self.raw = np.lib.stride_tricks.as_strided(first, shape=(n_frames, self.nop),
+                                                       strides=(self.frame_bytes, self.dtype.itemsize),
+                                                       writeable=False)
+        else:
+            # ningún frame completo (p.ej. sólo la cabecera): el fichero puede acabar antes de data_offset
+            self._mm = None
+            self.raw = np.empty((0, self.nop), dtype=self.dtype)
+            self.raw.flags.writeable = False
+
+        self.time = id1['dim_offset'] + id1['dim_scale'] * np.arange(self.nop)
+
+        info['yunit'] = ed1['units']
+        info['tunit'] = id1['units']
+        info['yres'] = ed1['dim_resolution']
+        if id1['dim_scale'] != 0:
+            info['samplingrate'] = 1.0 / id1['dim_scale']
+        else:
+            info['samplingrate'] = np.nan
+        info['nop'] = self.nop
+        info['calibration'] = self.calibration
+
+    def __len__(self):
+        return self.n_frames
+
+    def __getitem__(self, key):
+        """Frames escalados a float64 (y = ed1.dim_offset + ed1.dim_scale * raw)."""
+        values = self.raw[key].astype(np.float64)
+        values *= self.scale
+        values += self.offset
+        return values
+
+    @property
+    def frame_table(self):
+        """Tabla de metadatos por frame (FRAME_TABLE_DTYPE); no toca los datos de la curva."""
+        if self._frame_table is None:
+            if self.n_frames == 0:
+                # sin frames completos el fichero puede acabar antes del final de las specs
+                self._frame_table = np.zeros(0, dtype=FRAME_TABLE_DTYPE)
+                return self._frame_table
+            with open(self.filename, 'rb') as f:
+                table = _read_frame_table(f, self.info, self.endian, self._pos_before_updatespec)
+            self._frame_table = table[:self.n_frames]
+        return self._frame_table
+
+    def _frame_rows(self, frames):
+        """
+        Convierte una selección de frames (números 1-based, como en wfm2readframe) en filas de raw.
+        frames puede ser None (todos), un entero, un slice sobre los números de frame
+        o una lista/ndarray de números de frame (entre 1 y n_frames).
+        En un slice el stop es exclusivo y los límites negativos cuentan desde el final como en Python:
+        -1 es el último frame, así que slice(2, None) = frames 2..n_frames y slice(None, -1) = todos
+        menos el último. 0 no es un número de frame y se rechaza.
+        """
+        if frames is None:
+            return slice(None)
+        if isinstance(frames, slice):
+            start, stop = frames.start, frames.stop
+            if start == 0 or stop == 0:
+                raise ValueError(f"Frame numbers start at 1, got slice({start}, {stop}) for file {self.filename}")
+            # número de frame k > 0 -> fila k - 1; un límite negativo -k ya es la fila -k (frame n_frames + 1 - k)
+            if start is not None and start > 0:
+                start -= 1
+            if stop is not None and stop > 0:
+                stop -= 1
+            return slice(start, stop, frames.step)
+        rows = np.asarray(frames)
+        if rows.dtype.kind not in 'iu':
+            raise ValueError("Los números de frame deben ser enteros.")
+        rows = rows.astype(np.intp) - 1
+        if rows.size and (rows.min() < 0 or rows.max() >= self.n_frames):
+            raise ValueError(f"Frame numbers must be between 1 and {self.n_frames} in file {self.filename}")
+        return rows
+
+    def read(self, frames=None, datapoints=None, step=1, startind=1, raw=False):
+        """
+        Lee varios frames de una vez, con la misma semántica de datapoints/step/startind que wfm2readframe.
+        Devuelve: y (n_sel, nop) escalado, t común, info, ind_over, ind_under
+        ind_over/ind_under son tuplas (filas, muestras) como las de np.nonzero.
+        Con raw=True, y son las muestras crudas en dtype nativo (una vista de sólo lectura
+        sobre el mmap si frames es un slice) y info['calibration'] = (scale, offset).
+        """
+        if step is None:
+            step = 1
+        if startind is None:
+            startind = 1
+        if datapoints is not None and (datapoints < 1 or int(datapoints) != datapoints):
+            raise ValueError("datapoints debe ser entero positivo si se especifica.")
+
+        rows = self._frame_rows(frames)
+        nop = _resolve_nop(self.nop, datapoints, step, startind, self.name)
+        first = startind - 1
+        # con un slice es una vista; con una lista sólo se copian los frames pedidos
+        values = self.raw[rows, first:first + nop * step:step]
+        if values.ndim == 1:
+            values = values[np.newaxis, :]
+
+        # con el mmap la lectura del disco ocurre al decodificar (fallos de página)
+        with PROFILER.timer("decode"):
+            if raw:
+                y = values
+            else:
+                y = values.astype(np.float64)
+                y *= self.scale
+                y += self.offset
+        PROFILER.count("bytes_read", values.size * self.dtype.itemsize)
+        PROFILER.count("frames", len(values))
+
+        indices = startind + np.arange(0, nop * step, step)
+        id1 = self.info['id1']
+        t = id1['dim_offset'] + id1['dim_scale'] * (indices - 1)
+
+        over_range = self.info['ed1']['over_range']
+        ind_over = np.nonzero(values == over_range)
+        ind_under = np.nonzero(values <= -over_range)
+
+        info = dict(self.info)
+        info['frames'] = np.arange(1, self.n_frames + 1)[rows]
+        info['nop'] = int(nop)
+        info['n_over'] = int(len(ind_over[0]))
+        info['n_under'] = int(len(ind_under[0]))
+        return y, t, info, ind_over, ind_under
+
+    def sample_window(self, time_window):
+        """
+        Convierte una ventana temporal (t0, t1) en segundos (None = extremo abierto) en el rango de
+        muestras [start, stop) (0-based) cuyos tiempos id1.dim_offset + id1.dim_scale * i están en [t0, t1].
+        """
+        t0, t1 = time_window
+        id1 = self.info['id1']
+        start = 0 if t0 is None else max(0, math.ceil((t0 - id1['dim_offset']) / id1['dim_scale'] - 1e-9))
+        stop = self.nop if t1 is None else min(self.nop, math.floor((t1 - id1['dim_offset']) / id1['dim_scale'] + 1e-9) + 1)
+        return start, max(start, stop)
+
+    def roi(self, frames=None, sample_window=None, time_window=None, raw=False):
+        """
+        Región de interés: las muestras [start, stop) (0-based) de sample_window, o las de la ventana
+        temporal time_window (t0, t1) en segundos, para todos los frames o los seleccionados
+        (números 1-based como en read). Se lee directamente del mmap, así que sólo se tocan las
+        páginas que contienen esas muestras y no el registro entero.
+        Con raw=True y frames None o slice es una vista de sólo lectura (sin copia).
+        Devuelve: y (n_sel, stop - start) escalado (o crudo si raw=True), t (stop - start,)
+        """
+        if sample_window is not None and time_window is not None:
+            raise ValueError("Da sample_window o time_window, no ambos.")
+        if time_window is not None:
+            sample_window = self.sample_window(time_window)
+        start, stop = sample_window if sample_window is not None else (0, None)
+        start, stop, _ = slice(start, stop).indices(self.nop)
+        stop = max(start, stop)
+
+        values = self.raw[self._frame_rows(frames), start:stop]
+        if values.ndim == 1:
+            values = values[np.newaxis, :]
+        with PROFILER.timer("decode"):
+            if raw:
+                y = values
+            else:
+                y = values.astype(np.float64)
+                y *= self.scale
+                y += self.offset
+        PROFILER.count("bytes_read", values.size * self.dtype.itemsize)
+        PROFILER.count("frames", len(values))
+        return y, self.time[start:stop]
+
+    def iter_blocks(self, frames=None, block_frames=None, max_bytes=DEFAULT_BLOCK_BYTES, raw=False):
+        """
+        Recorre los frames en bloques contiguos (k, nop) con memoria acotada.
+        Cada bloque se lee con una sola lectura (readinto sobre un buffer reutilizado),
+        así que el uso de memoria no depende del tamaño del fichero.
+        frames: None o slice de números de frame (1-based, paso 1).
+        block_frames: frames por bloque; si es None se calcula para no pasar de max_bytes
+        (buffer de lectura + bloque devuelto).
+        Devuelve (generador): bloque (float64 escalado o crudo si raw=True), filas de frame_table
+        """
+        rows = self._frame_rows(frames if frames is not None else slice(None))
+        if not isinstance(rows, slice):
+            raise ValueError("iter_blocks sólo admite un slice contiguo de frames.")
+        start, stop, stride = rows.indices(self.n_frames)
+        if stride != 1:
+            raise ValueError("iter_blocks sólo admite slices con paso 1.")
+
+        itemsize = self.dtype.itemsize
+        row_bytes = self.nop * itemsize
+        if block_frames is None:
+            out_itemsize = itemsize if raw else np.dtype(np.float64).itemsize
+            per_frame = max(self.frame_bytes, row_bytes) + self.nop * out_itemsize
+            block_frames = max(1, int(max_bytes // max(per_frame, 1)))
+        block_frames = int(block_frames)
+        if block_frames < 1:
+            raise ValueError("block_frames debe ser un entero positivo.")
+
+        table = self.frame_table
+        buf = bytearray((min(block_frames, max(stop - start, 1)) - 1) * self.frame_bytes + row_bytes)
+        with open(self.filename, 'rb') as f:
+            for first in range(start, stop, block_frames):
+                k = min(block_frames, stop - first)
+                yield self._read_block(f, first, k, buf, raw=raw), table[first:first + k]
+
+    def _read_block(self, f, first, k, buf, out=None, raw=False):
+        """
+        Lee las filas first..first+k-1 de raw con una sola lectura sobre buf (bytearray reutilizable)
+        y las decodifica en out (k, nop) si se da, o en un array nuevo.
+        """
+        itemsize = self.dtype.itemsize
+        nbytes = (k - 1) * self.frame_bytes + self.nop * itemsize
+        chunk = memoryview(buf)[:nbytes]
+        f.seek(self.curve_offset + int(self.info['data_start_offset']) + first * self.frame_bytes, os.SEEK_SET)
+        with PROFILER.timer("disk_read"):
+            n_read = f.readinto(chunk)
+        PROFILER.count("bytes_read", n_read)
+        if n_read != nbytes:
+            raise WfmReadError(f"Lectura incompleta del bloque de frames {first + 1}-{first + k} en {self.filename}")
+        first_row = np.frombuffer(chunk, dtype=self.dtype, count=self.nop)
+        view = np.lib.stride_tricks.as_strided(first_row, shape=(k, self.nop),
+                                               strides=(self.frame_bytes, itemsize),
+                                               writeable=False)
+        # siempre se copia: buf se reutiliza en el siguiente bloque
+        with PROFILER.timer("decode"):
+            if out is None:
+                out = np.empty((k, self.nop), dtype=self.dtype if raw else np.float64)
+            out[...] = view
+            if not raw:
+                out *= self.scale
+                out += self.offset
+        PROFILER.count("frames", k)
+        return out
+
+    def close(self):
+        # el mmap se libera cuando no quedan vistas que lo referencien
+        self.raw = None
+        self._mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_frames(filename, frames=None, datapoints=None, step=1, startind=1, raw=False):
+    """
+    Versión por lotes de wfm2readframe: lee todos los frames seleccionados en una sola pasada.
+    frames: None (todos), slice, lista o ndarray de números de frame (1-based).
+    Devuelve: y (n_sel, nop), t, info, ind_over, ind_under
+    """
+    with WfmFile(filename) as wfm:
+        return wfm.read(frames, datapoints, step, startind, raw)
+
+
+def read_roi(filename, frames=None, sample_window=None, time_window=None, raw=False):
+    """
+    Ventana de muestras (sample_window 0-based [start, stop) o time_window (t0, t1) en segundos)
+    de todos los frames o los seleccionados, leída del mmap (ver WfmFile.roi).
+    Devuelve: y (n_sel, muestras), t
+    """
+    with WfmFile(filename) as wfm:
+        y, t = wfm.roi(frames, sample_window, time_window, raw)
+        # la vista cruda apunta al mmap: se copia para poder cerrar el fichero
+        return (np.array(y) if raw else y), t
+
+
+def iter_frame_blocks(filename, frames=None, block_frames=None, max_bytes=DEFAULT_BLOCK_BYTES, raw=False):
+    """
+    Generador de bloques contiguos (k, nop) de frames y sus filas de frame_table,
+    con memoria acotada por max_bytes (ver WfmFile.iter_blocks).
+    """
+    with WfmFile(filename) as wfm:
+        yield from wfm.iter_blocks(frames, block_frames, max_bytes, raw)
+
+
+def calibrate(values, calibration):
+    """Escala muestras crudas a unidades físicas: offset + scale * values (float64)."""
+    scale, offset = calibration
+    y = np.asarray(values, dtype=np.float64) * scale
+    y += offset
+    return y
+
+
+def to_raw(y, calibration):
+    """Inversa de calibrate: pasa un valor físico (p.ej. un umbral en V) a unidades de ADC."""
+    scale, offset = calibration
+    return (np.asarray(y, dtype=np.float64) - offset) / scale
+
+
+def calibrated_extrema(values, calibration, axis=-1):
+    """
+    min/max y argmin/argmax en unidades físicas calculados sobre las muestras crudas
+    (las reducciones se hacen con enteros y sólo se escala el resultado).
+    Si scale < 0 el mínimo físico corresponde al máximo crudo.
+    Devuelve: ymin, ymax, argmin, argmax
+    """
+    scale, _ = calibration
+    values = np.asarray(values)
+    if scale >= 0:
+        argmin = np.argmin(values, axis=axis)
+        argmax = np.argmax(values, axis=axis)
+    else:
+        argmin = np.argmax(values, axis=axis)
+        argmax = np.argmin(values, axis=axis)
+    ymin = calibrate(np.take_along_axis(values, np.expand_dims(argmin, axis), axis=axis).squeeze(axis), calibration)
+    ymax = calibrate(np.take_along_axis(values, np.expand_dims(argmax, axis), axis=axis).squeeze(axis), calibration)
+    return ymin, ymax, argmin, argmax
+
+
+def read_frame_table(filename):
+    """
+    Metadatos de todos los frames (timestamps de trigger, tt_offset, offsets del curve buffer)
+    como array estructurado, sin leer los datos de la curva.
+    El tiempo de trigger está en GMT_sec y frac_sec tal y como vienen en el fichero. La columna
+    timestamp (GMT_sec + frac_sec en float64) es solo una comodidad: con ~1.7e9 s su resolución
+    es de unos 0.2 µs, así que las diferencias de tiempo entre frames más finas se calculan como
+    (GMT_sec[j] - GMT_sec[i]) + (frac_sec[j] - frac_sec[i]).
+    """
+    filename, _ = _normalize_filename(filename)
+    info, endian, _, pos_before_updatespec = _cached_header(filename)
+    with open(filename, 'rb') as f:
+        return _read_frame_table(f, info, endian, pos_before_updatespec)
+
+
+# byte order (2) + versioning number (8) + num_digits_in_byte_count (1) + num_bytes_to_EOF (4)
+_EOF_FIELD_END = 15
+
+
+def is_complete(filename):
+    """
+    True si el fichero está escrito entero: tamaño == 15 + num_bytes_to_EOF de la cabecera.
+    Solo lee los primeros 15 bytes, así que sirve para ficheros que el osciloscopio aún está escribiendo
+    (un fichero a medio escribir, o sin cabecera todavía, devuelve False).
+    """
+    try:
+        with open(filename, 'rb') as f:
+            b = f.read(_EOF_FIELD_END)
+            size = os.fstat(f.fileno()).st_size
+    except OSError:
+        return False
+    if len(b) < _EOF_FIELD_END:
+        return False
+    endian = '<' if struct.unpack('<H', b[:2])[0] == 0x0F0F else '>'
+    num_bytes_to_EOF = struct.unpack(endian + 'i', b[11:_EOF_FIELD_END])[0]
+    return size == _EOF_FIELD_END + num_bytes_to_EOF
+
+
 # Si quieres ejecutar como script de prueba:
 if __name__ == '__main__':
     import sys
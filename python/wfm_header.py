@@ -0,0 +1,269 @@
+# wfm_header.py
+# Single parser of the fixed-size part of the .wfm header (static file info, waveform header, the four
+# dimensions and both time bases), shared by wfm2readframe and wfmread.
+# The layout depends only on the byte order and the file version, so it is compiled once per
+# (endianness, version) into a struct.Struct and a header is decoded from one read with one unpack.
+import re
+import struct
+import warnings
+from typing import NamedTuple, Optional
+
+
+class WfmReadError(Exception):
+    pass
+
+
+# byte order verification value, read in the file byte order
+BYTE_ORDER_MARK = 0x0F0F
+
+
+class ExplicitDimension(NamedTuple):
+    dim_scale: float
+    dim_offset: float
+    dim_size: int
+    units: str
+    dim_extent_min: float
+    dim_extent_max: float
+    dim_resolution: float
+    dim_ref_point: float
+    format: tuple
+    storage_type: tuple
+    n_value: int
+    over_range: int
+    under_range: int
+    high_range: int
+    low_range: int
+    user_scale: float
+    user_units: str
+    user_offset: float
+    point_density: float
+    href: float
+    trig_delay: float
+
+
+class ImplicitDimension(NamedTuple):
+    dim_scale: float
+    dim_offset: float
+    dim_size: int
+    units: str
+    dim_extent_min: float
+    dim_extent_max: float
+    dim_resolution: float
+    dim_ref_point: float
+    spacing: int
+    user_scale: float
+    user_units: str
+    user_offset: float
+    point_density: float
+    href: float
+    trig_delay: float
+
+
+class WfmHeader(NamedTuple):
+    """
+    Decoded fixed-size header. Field names are the keys of the wfm2readframe info dict;
+    endian ('<' or '>'), version (1, 2, 3, ...) and size (bytes up to the first update spec) describe the layout.
+    """
+    byte_order_verification: int
+    versioning_number: str
+    num_digits_in_byte_count: int
+    num_bytes_to_EOF: int
+    num_bytes_per_point: int
+    byte_offset_to_beginning_of_curve_buffer: int
+    horizontal_zoom_scale_factor: int
+    horizontal_zoom_position: float
+    vertical_zoom_scale_factor: float
+    vertical_zoom_position: float
+    waveform_label: str
+    N: int
+    size_of_waveform_header: int
+    setType: tuple
+    wfmCnt: int
+    wfm_update_spec_count: int
+    imp_dim_ref_count: int
+    exp_dim_ref_count: int
+    data_type: tuple
+    curve_ref_count: int
+    num_req_fast_frames: int
+    num_acq_fast_frames: int
+    summary_frame_type: Optional[int]   # version >= 2 only
+    pixmap_display_format: tuple
+    pixmap_max_value: int
+    ed1: ExplicitDimension
+    ed2: ExplicitDimension
+    id1: ImplicitDimension
+    id2: ImplicitDimension
+    tb1_real_point_spacing: int
+    tb1_sweep: tuple
+    tb1_type_of_base: tuple
+    tb2_real_point_spacing: int
+    tb2_sweep: tuple
+    tb2_type_of_base: tuple
+    endian: str
+    version: int
+    size: int
+
+    def to_info(self):
+        """The header as the info dict of wfm2readframe (ed1/ed2/id1/id2 as sub-dicts, in that dict's key order)."""
+        info = dict(zip(_TOP_FIELDS, self[:_N_TOP]))
+        info['byte_order_verification'] = format(self.byte_order_verification, '04X')
+        if self.summary_frame_type is None:
+            del info['summary_frame_type']
+        info.update(zip(_TIME_BASE_FIELDS, self[_N_TOP + 4:_N_TOP + 10]))
+        info['ed1'] = self.ed1._asdict()
+        info['ed2'] = self.ed2._asdict()
+        info['id1'] = self.id1._asdict()
+        info['id2'] = self.id2._asdict()
+        return info
+
+
+_N_TOP = WfmHeader._fields.index('ed1')
+_TOP_FIELDS = WfmHeader._fields[:_N_TOP]
+_TIME_BASE_FIELDS = WfmHeader._fields[_N_TOP + 4:_N_TOP + 10]
+
+
+def _fields(version):
+    """(group, name, struct code) of every field, in file order; group is '' or a dimension name."""
+    point_density = 'd' if version >= 3 else 'I'
+    explicit = [('dim_scale', 'd'), ('dim_offset', 'd'), ('dim_size', 'I'), ('units', '20s'),
+                ('dim_extent_min', 'd'), ('dim_extent_max', 'd'), ('dim_resolution', 'd'), ('dim_ref_point', 'd'),
+                ('format', '4b'), ('storage_type', '4b'), ('n_value', 'i'), ('over_range', 'i'),
+                ('under_range', 'i'), ('high_range', 'i'), ('low_range', 'i'), ('user_scale', 'd'),
+                ('user_units', '20s'), ('user_offset', 'd'), ('point_density', point_density),
+                ('href', 'd'), ('trig_delay', 'd')]
+    implicit = [('dim_scale', 'd'), ('dim_offset', 'd'), ('dim_size', 'I'), ('units', '20s'),
+                ('dim_extent_min', 'd'), ('dim_extent_max', 'd'), ('dim_resolution', 'd'), ('dim_ref_point', 'd'),
+                ('spacing', 'I'), ('user_scale', 'd'), ('user_units', '20s'), ('user_offset', 'd'),
+                ('point_density', point_density), ('href', 'd'), ('trig_delay', 'd')]
+    fields = [
+        # static file information (78 bytes)
+        ('byte_order_verification', 'H'), ('versioning_number', '8s'), ('num_digits_in_byte_count', 'B'),
+        ('num_bytes_to_EOF', 'i'), ('num_bytes_per_point', 'B'), ('byte_offset_to_beginning_of_curve_buffer', 'I'),
+        ('horizontal_zoom_scale_factor', 'i'), ('horizontal_zoom_position', 'f'),
+        ('vertical_zoom_scale_factor', 'd'), ('vertical_zoom_position', 'f'), ('waveform_label', '32s'),
+        ('N', 'I'), ('size_of_waveform_header', 'H'),
+        # waveform header
+        ('setType', '4b'), ('wfmCnt', 'I'), (None, '24x'), ('wfm_update_spec_count', 'I'),
+        ('imp_dim_ref_count', 'I'), ('exp_dim_ref_count', 'I'), ('data_type', '4b'), (None, '16x'),
+        ('curve_ref_count', 'I'), ('num_req_fast_frames', 'I'), ('num_acq_fast_frames', 'I'),
+    ]
+    if version >= 2:
+        fields.append(('summary_frame_type', 'H'))
+    fields += [('pixmap_display_format', '4b'), ('pixmap_max_value', 'Q')]
+    fields = [('', name, code) for name, code in fields]
+    for group, layout in (('ed1', explicit), ('ed2', explicit), ('id1', implicit), ('id2', implicit)):
+        fields += [(group, name, code) for name, code in layout]
+    for tb in ('tb1', 'tb2'):
+        fields += [('', f'{tb}_real_point_spacing', 'I'), ('', f'{tb}_sweep', '4b'), ('', f'{tb}_type_of_base', '4b')]
+    return fields
+
+
+class _Layout:
+    """Compiled header layout of one (endianness, version)."""
+    __slots__ = ('struct', 'special', 'bounds', 'has_summary')
+
+    def __init__(self, endian, version):
+        fields = _fields(version)
+        self.struct = struct.Struct(endian + ''.join(code for _, _, code in fields))
+        self.has_summary = version >= 2
+        # strings and multi-value fields, (first value, number of values, is a string), last first so
+        # collapsing one does not shift the position of the others
+        special = []
+        position = 0
+        groups = []
+        for group, _, code in fields:
+            if code.endswith('x'):
+                continue
+            count = 1 if code.endswith('s') else int(code[:-1] or 1)
+            if code.endswith('s') or count > 1:
+                special.append((position, count, code.endswith('s')))
+            groups.append(group)
+            position += count
+        self.special = tuple(reversed(special))
+        # [start, stop) of the top-level fields before the dimensions, of each dimension and of the time bases
+        # in the collapsed list of values (one value per field)
+        first = groups.index('ed1')
+        starts = [first] + [groups.index(name) for name in ('ed2', 'id1', 'id2')] + [len(groups) - 6]
+        self.bounds = (first, tuple(zip(starts[:-1], starts[1:])), starts[-1])
+
+    def decode(self, buf, endian, version):
+        values = list(self.struct.unpack_from(buf))
+        for position, count, is_string in self.special:
+            if is_string:
+                values[position] = _until_null(values[position])
+            else:
+                values[position:position + count] = [tuple(values[position:position + count])]
+        # the versioning number keeps its raw text (as wfm2readframe did)
+        values[1] = bytes(buf[2:10]).decode(errors='ignore')
+        first, dims, tb = self.bounds
+        top = values[:first]
+        if not self.has_summary:
+            # summary_frame_type (version >= 2) goes before the two pixmap fields
+            top.insert(first - 2, None)
+        (a, b), (c, d), (e, g), (h, i) = dims
+        return WfmHeader._make(top + [ExplicitDimension._make(values[a:b]), ExplicitDimension._make(values[c:d]),
+                                      ImplicitDimension._make(values[e:g]), ImplicitDimension._make(values[h:i])]
+                               + values[tb:] + [endian, version, self.struct.size])
+
+
+def _until_null(raw):
+    # string up to the first NUL byte
+    return raw.split(b'\x00', 1)[0].decode(errors='ignore')
+
+
+def dimension_offsets(version):
+    """
+    Byte range (start, stop) in the file of the ed1, ed2, id1 and id2 blocks of a file version,
+    as a dict name -> range (the same for both byte orders).
+    """
+    offsets = {}
+    position = 0
+    for group, _, code in _fields(min(max(version, 1), 3)):
+        size = struct.calcsize('<' + code)
+        if group:
+            start, _ = offsets.get(group, (position, None))
+            offsets[group] = (start, position + size)
+        position += size
+    return offsets
+
+
+# the layouts of versions 1, 2 and 3 (later versions are read with the version 3 layout)
+HEADER_LAYOUTS = {(endian, version): _Layout(endian, version) for endian in '<>' for version in (1, 2, 3)}
+MAX_HEADER_SIZE = max(layout.struct.size for layout in HEADER_LAYOUTS.values())
+
+
+def detect_format(buf):
+    """(endian, version) from the first 10 bytes (byte order mark and versioning number)."""
+    if len(buf) < 10:
+        raise WfmReadError("File too short for a .wfm header.")
+    endian = '<' if struct.unpack_from('<H', buf)[0] == BYTE_ORDER_MARK else '>'
+    versioning_number = bytes(buf[2:10]).decode(errors='ignore')
+    match = re.search(r':?WFM#\s*?(\d{1,3})', versioning_number)
+    if match:
+        version = int(match.group(1))
+    else:
+        digits = re.findall(r'\d+', versioning_number)
+        version = int(digits[-1]) if digits else 1
+    return endian, version
+
+
+def parse_header(buf):
+    """Decode a WfmHeader from a buffer that starts at the beginning of the file."""
+    endian, version = detect_format(buf)
+    if version > 3:
+        warnings.warn("WFM2read:HigherVersionNumber - wfm2read has only been tested with WFM file versions <= 3")
+    layout = HEADER_LAYOUTS[(endian, min(max(version, 1), 3))]
+    if len(buf) < layout.struct.size:
+        raise WfmReadError(f"Incomplete header: {layout.struct.size} bytes expected, {len(buf)} read.")
+    return layout.decode(buf, endian, version)
+
+
+def read_header(f):
+    """
+    Read and decode the header of an open .wfm file with a single read from the start of the file.
+    Leaves the file positioned at the first update spec (header.size).
+    """
+    f.seek(0)
+    header = parse_header(f.read(MAX_HEADER_SIZE))
+    f.seek(header.size)
+    return header
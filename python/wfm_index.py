@@ -0,0 +1,202 @@
+# wfm_index.py
+# Persistent sidecar index of a .wfm file (cycle_0000_ch1.wfm.idx): the frame table (byte offsets, trigger
+# timestamps) and per-frame summary statistics, built once in a streaming pass and validated against the
+# size and mtime of the .wfm file. Frame selections are answered from the index alone, and only the
+# matching frames are then read from the memory-mapped curve buffer.
+import os
+import json
+import tempfile
+import numpy as np
+import click
+from wfm2readframe import WfmFile, WfmReadError, DEFAULT_BLOCK_BYTES, _normalize_filename
+from features import compute_features, parse_window
+
+INDEX_VERSION = 2
+INDEX_SUFFIX = ".idx"
+# per-frame statistics stored in the index (features.compute_features names, in physical units)
+INDEX_STATS = ("min_voltage", "argmin", "max_voltage", "pedestal", "pedestal_rms")
+# frame table columns stored in the index: the trigger time is kept exact in GMT_sec and frac_sec,
+# timestamp (their float64 sum, ~0.2 µs resolution) is there for selections like timestamp=(t0, t1)
+INDEX_TABLE_COLUMNS = ("frame", "GMT_sec", "frac_sec", "timestamp", "tt_offset", "byte_offset")
+
+
+def index_path(filename):
+    """Sidecar index path of a .wfm file (cycle_0000_ch1.wfm -> cycle_0000_ch1.wfm.idx)."""
+    filename, _ = _normalize_filename(filename)
+    return filename + INDEX_SUFFIX
+
+
+class WfmIndex:
+    """
+    Index of one .wfm file: one row per frame with the INDEX_TABLE_COLUMNS of the frame table
+    and the INDEX_STATS, as NumPy arrays (index["min_voltage"], index["timestamp"], ...).
+
+    index = load_index("cycle_0000_ch1.wfm")             # built and saved the first time
+    frames = index.select(min_voltage=(None, -0.05))     # frame numbers with a pulse below -50 mV
+    y = index.read(frames)                               # only those frames are read
+    """
+    def __init__(self, filename, columns, meta):
+        self.filename = filename
+        self.columns = columns
+        self.meta = meta
+        self.nop = meta["nop"]
+        self.calibration = tuple(meta["calibration"])
+        self.pedestal_window = tuple(meta["pedestal_window"])
+
+    def __len__(self):
+        return len(self.columns["frame"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def is_current(self):
+        """True if the .wfm file has not changed since the index was built."""
+        st = os.stat(self.filename)
+        return (st.st_size, st.st_mtime_ns) == (self.meta["size"], self.meta["mtime_ns"])
+
+    def select(self, frames=None, **bounds):
+        """
+        Frame numbers (1-based) whose columns are within the given (low, high) bounds, inclusive;
+        None leaves a side open. E.g. select(min_voltage=(None, -0.05), timestamp=(t0, t1)).
+        frames restricts the selection to a subset of frame numbers.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if frames is not None:
+            mask &= np.isin(self.columns["frame"], np.asarray(frames))
+        for name, (low, high) in bounds.items():
+            if name not in self.columns:
+                raise KeyError(f"Unknown index column {name}, available: {sorted(self.columns)}")
+            values = self.columns[name]
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        return self.columns["frame"][mask]
+
+    def read(self, frames, raw=False):
+        """
+        Samples (len(frames), nop) of the given frame numbers, read from the memory-mapped file
+        (only the pages of those frames are touched). Calibrated float64, or native samples if raw=True.
+        """
+        if not self.is_current():
+            raise WfmReadError(f"{self.filename} changed after its index was built")
+        frames = np.asarray(frames, dtype=np.int64)
+        with WfmFile(self.filename) as wfm:
+            if frames.size == 0:
+                return np.empty((0, wfm.nop), dtype=wfm.dtype.newbyteorder('=') if raw else np.float64)
+            return wfm.read(frames, raw=raw)[0]
+
+    def save(self, path=None):
+        """Atomic write of the index (np.savez) next to the .wfm file."""
+        path = path or self.filename + INDEX_SUFFIX
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(prefix=".idx_", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, meta=np.array(json.dumps(self.meta)), **self.columns)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return path
+
+
+def build_index(filename, pedestal_window=(0, 100), max_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Build the index of a .wfm file: frame table from the header parse, statistics from one
+    streaming pass over the raw samples (bounded memory, reductions on the integers).
+    """
+    filename, _ = _normalize_filename(filename)
+    st = os.stat(filename)
+    with WfmFile(filename) as wfm:
+        table = wfm.frame_table
+        stats = {name: [] for name in INDEX_STATS}
+        for block, _ in wfm.iter_blocks(raw=True, max_bytes=max_bytes):
+            values = compute_features(block, wfm.time, INDEX_STATS, calibration=wfm.calibration,
+                                      pedestal_window=pedestal_window)
+            for name in INDEX_STATS:
+                stats[name].append(values[name])
+        columns = {name: np.ascontiguousarray(table[name]) for name in INDEX_TABLE_COLUMNS}
+        for name in INDEX_STATS:
+            columns[name] = np.concatenate(stats[name]) if stats[name] else np.empty(0)
+        meta = {
+            "version": INDEX_VERSION,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "n_frames": wfm.n_frames,
+            "nop": wfm.nop,
+            "dtype": wfm.dtype.newbyteorder('=').str,
+            "calibration": [float(v) for v in wfm.calibration],
+            "time_offset": float(wfm.info["id1"]["dim_offset"]),
+            "time_scale": float(wfm.info["id1"]["dim_scale"]),
+            "pedestal_window": [pedestal_window[0], pedestal_window[1]],
+        }
+    return WfmIndex(filename, columns, meta)
+
+
+def read_index(filename):
+    """
+    The saved index of a .wfm file, or None if there is none or it is stale
+    (the file size or mtime changed, or it was written by another index version).
+    """
+    filename, _ = _normalize_filename(filename)
+    path = index_path(filename)
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        columns = {name: data[name] for name in data.files if name != "meta"}
+    if meta.get("version") != INDEX_VERSION:
+        return None
+    index = WfmIndex(filename, columns, meta)
+    return index if index.is_current() else None
+
+
+def load_index(filename, pedestal_window=(0, 100), save=True):
+    """
+    The index of a .wfm file: the saved one if it is current (and was built with the same
+    pedestal window), otherwise it is built, and saved next to the file if save=True.
+    """
+    index = read_index(filename)
+    if index is not None and index.pedestal_window == tuple(pedestal_window):
+        return index
+    index = build_index(filename, pedestal_window)
+    if save:
+        index.save()
+    return index
+
+
+@click.command()
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--pedestal-window', default="0:100", help="Sample window start:stop for pedestal and pedestal_rms")
+@click.option('--select', 'selections', multiple=True,
+              help="Print the frames with column within low:high (either side may be empty), e.g. min_voltage::-0.05")
+def main(paths, pedestal_window, selections):
+    """
+    Build (or validate) the .wfm.idx index of the given .wfm files or of all the .wfm files in the
+    given folders, and optionally print the frames matching --select.
+    """
+    window = parse_window(pedestal_window)
+    bounds = {}
+    for selection in selections:
+        name, low, high = selection.split(":")
+        bounds[name] = (float(low) if low else None, float(high) if high else None)
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".wfm")]
+        else:
+            files.append(path)
+    for filename in files:
+        index = load_index(filename, window)
+        line = f"{filename}: {len(index)} frames"
+        if bounds:
+            frames = index.select(**bounds)
+            line += f", {len(frames)} selected: {frames.tolist()}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# wfm_to_corry.py
+# Single pass from the cycle_XXXX_chN.wfm files to the Corryvreckan hit file:
+# frames are streamed in blocks through pulse_analysis and the hit selection, without the
+# intermediate full-waveform ROOT file (which can still be written in the same pass with --waveforms)
+import os
+import re
+import numpy as np
+import click
+import ROOT
+import tqdm
+from wfm2readframe import WfmFile, WfmReadError, calibrate, DEFAULT_BLOCK_BYTES
+from pulse_analysis import PULSE_ENGINES, hit_mask
+from root_io import BlockWriter
+from features import DEFAULT_FEATURES, FEATURE_DTYPES, parse_features, parse_window
+from save_to_corry import TREE_COLUMNS, write_pulses
+from write_to_root import list_cycle_files, book_trees, fill_block, fill_calibration, sample_layout
+
+
+def iter_file_pulses(input_file, first_event, raw=False, max_bytes=DEFAULT_BLOCK_BYTES, engine="peaksignal"):
+    """
+    Stream the frames 1..N of one .wfm file (the events write_to_root stores) and analyse them
+    with the pulse_analysis engine `engine` ("peaksignal" or "vectorized").
+    Yields: event_numbers, pulse parameters, hit mask, waveforms block, time axis, calibration
+    With raw=True the block holds the native samples (calibrated only for the pulse analysis).
+    """
+    pulse_parameters = PULSE_ENGINES[engine]
+    with WfmFile(input_file) as wfm:
+        time_axis = wfm.time
+        event = first_event
+        for waveforms, _ in wfm.iter_blocks(slice(1, wfm.info["N"] + 1), max_bytes=max_bytes, raw=raw):
+            k = len(waveforms)
+            event_numbers = np.arange(event, event + k, dtype=np.int32)
+            voltages = calibrate(waveforms, wfm.calibration) if raw else waveforms
+            pulses = pulse_parameters(voltages, time_axis, polarity="negative")
+            yield event_numbers, pulses, hit_mask(pulses), waveforms, time_axis, wfm.calibration
+            event += k
+
+
+@click.command()
+@click.option('-i', 'input_folder', required=True, help="Folder containing .wfm files")
+@click.option('-o', 'output_folder', type=click.Path(), default=".", help="Output folder for signal_data.txt and the ROOT files")
+@click.option('-c', 'channel', type=int, default=1, help="Channel number to process")
+@click.option('--condor', is_flag=True, help="Run in batch mode, do not show progress bar")
+@click.option('--detector', 'detector_name', default="", help="Detector name written to the Detector column of signal_data.txt")
+@click.option('--engine', type=click.Choice(list(PULSE_ENGINES)), default="peaksignal", show_default=True,
+              help="Pulse parameters from signals.PeakSignal, or from the vectorized pulse_analysis (not validated yet)")
+@click.option('--waveforms', 'keep_waveforms', is_flag=True,
+              help="Also write the full-waveform more_waveforms_chN.root file of write_to_root in the same pass")
+@click.option('--layout', type=click.Choice(["voltage", "raw"]), default="voltage",
+              help="Layout of the optional full-waveform file (see write_to_root)")
+@click.option('--features', 'feature_names', default=",".join(DEFAULT_FEATURES),
+              help=f"Per-event features of the optional full-waveform file: {', '.join(FEATURE_DTYPES)}")
+@click.option('--pedestal-window', default="0:100", help="Sample window start:stop for pedestal and pedestal_rms")
+@click.option('--integral-window', default=None, help="Sample window start:stop for the integral (default: whole record)")
+@click.option('--threshold', type=float, default=None, help="Threshold (V) for threshold_crossing")
+@click.option('--polarity', type=click.Choice(["negative", "positive"]), default="negative",
+              help="Pulse polarity for threshold_crossing")
+@click.option('--max-bytes', type=int, default=DEFAULT_BLOCK_BYTES, show_default=True,
+              help="Memory budget of one block of frames")
+def main(input_folder, output_folder, channel, condor, detector_name, engine, keep_waveforms, layout, feature_names,
+         pedestal_window, integral_window, threshold, polarity, max_bytes):
+    """
+    Stream WFM frames through pulse analysis and hit selection and write, in output_folder:
+    - signal_data.txt: "Event_Number, Detector, Charge, ToA" for every hit (as save_to_corry)
+    - corry_ch{channel}.root: tree "tree" with one entry per event (event_number, hit, snr,
+      amplitude, toa, integral, rise_time), the same as the save_to_corry output
+    - more_waveforms_ch{channel}.root (only with --waveforms): the write_to_root output
+    Event numbers are the ones write_to_root assigns (frames 1..N of the sorted cycle files).
+    The feature options (--features, --pedestal-window, --integral-window, --threshold, --polarity)
+    are the ones of write_to_root and only apply to the full-waveform file.
+    """
+    channel = int(channel)
+    input_folder = os.fspath(input_folder)
+    output_folder = os.fspath(output_folder)
+    os.makedirs(output_folder, exist_ok=True)
+    print(f"Input folder: {input_folder}")
+    print(f"Output folder: {output_folder}")
+    print(f"Processing channel: {channel}")
+    run_number = None
+    match = re.search(r'run_(\d+)', input_folder)
+    if match:
+        run_number = int(match.group(1))
+        print(f"Detected run number: {run_number}")
+
+    files = list_cycle_files(input_folder, channel)
+    progress = (lambda x: x) if condor else tqdm.tqdm
+    raw = keep_waveforms and layout == "raw"
+
+    corry_file = ROOT.TFile(os.path.join(output_folder, f"corry_ch{channel}.root"), "RECREATE")
+    tree = ROOT.TTree("tree", "tree")
+    writer = BlockWriter(tree)
+    writer.add_scalar("event_number", np.int32)
+    writer.add_scalar("hit", np.bool_)
+    for branch in TREE_COLUMNS:
+        writer.add_scalar(branch, np.float32)
+
+    waveform_file, output = None, None
+    if keep_waveforms:
+        tree_options = {
+            "layout": layout,
+            "features": parse_features(feature_names),
+            "feature_options": {
+                "pedestal_window": parse_window(pedestal_window),
+                "integral_window": parse_window(integral_window),
+                "threshold": threshold,
+                "polarity": polarity,
+            },
+        }
+        if "threshold_crossing" in tree_options["features"] and threshold is None:
+            raise click.BadParameter("threshold_crossing needs --threshold")
+        if raw and files:
+            tree_options["nop"], tree_options["sample_dtype"] = sample_layout(files[0])
+        waveform_file = ROOT.TFile(os.path.join(output_folder, f"more_waveforms_ch{channel}.root"), "RECREATE")
+        waveform_file.SetCompressionLevel(1)
+        output = book_trees(channel, run_number, **tree_options)
+
+    global_event_counter = 0
+    n_hits = 0
+    with open(os.path.join(output_folder, "signal_data.txt"), "w") as f:
+        f.write("Event_Number, Detector, Charge, ToA\n")
+        for input_file in files:
+            print(f"Processing file: {input_file}")
+            first_event = global_event_counter
+            for event_numbers, pulses, hits, waveforms, time_axis, calibration in progress(
+                    iter_file_pulses(input_file, first_event, raw=raw, max_bytes=max_bytes, engine=engine)):
+                write_pulses(f, writer, event_numbers, pulses, hits, detector_name)
+                if output is not None:
+                    if raw and waveforms.shape[1] != output["nop"]:
+                        raise WfmReadError(f"{input_file} has {waveforms.shape[1]} samples per frame, "
+                                           f"the adc branch was booked with {output['nop']}")
+                    fill_block(output, waveforms, time_axis, int(event_numbers[0]), calibration)
+                global_event_counter += len(event_numbers)
+                n_hits += int(np.count_nonzero(hits))
+            if output is not None:
+                with WfmFile(input_file) as wfm:
+                    fill_calibration(output, input_file, wfm, first_event, global_event_counter - first_event)
+
+    corry_file.cd()
+    corry_file.Write()
+    corry_file.Close()
+    if waveform_file is not None:
+        waveform_file.cd()
+        waveform_file.Write()
+        waveform_file.Close()
+    print(f"{n_hits} hits in {global_event_counter} events written to {output_folder}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,320 +1,176 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import sys
-import struct as st
 import numpy as np
-import os 
+import time
 import ROOT
+from profiling import PROFILER
+from wfm_header import read_header
+from wfm2readframe import WfmFile, _read_frame_specs, _spec_dtypes
+
+
+class FrameSequence:
+    '''
+    Lazy sequence of the frames of a .wfm file over a read-only memory map of the curve buffer.
+    Nothing is read when it is built: frames[i] decodes one frame, frames[a:b] is again a lazy
+    FrameSequence and np.asarray(frames[a:b]) decodes that range into one (frames, samples) array,
+    so memory is proportional to what is accessed.
+    Frames are float64 (V = raw*scale + offset), or read-only views of the native samples if raw=True.
+    '''
+    def __init__(self, rows, calibration, raw=False):
+        self.rows = rows  # (n_frames, n_samples) WfmFile.raw view over the memory map
+        self.calibration = calibration
+        self.raw = raw
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return FrameSequence(self.rows[key], self.calibration, self.raw)
+        return self._decode(self.rows[key])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __array__(self, dtype=None, copy=None):
+        values = self._decode(self.rows)
+        return values if dtype is None else values.astype(dtype, copy=False)
+
+    def _decode(self, values):
+        # with the memory map the disk read happens here (page faults)
+        start = time.perf_counter()
+        if not self.raw:
+            scale, offset = self.calibration
+            values = values.astype(np.float64)
+            values *= scale
+            values += offset
+        PROFILER.add_time("decode", time.perf_counter() - start)
+        PROFILER.count("bytes_read", values.size * self.rows.dtype.itemsize)
+        PROFILER.count("frames", 1 if values.ndim == 1 else len(values))
+        return values
 
 
 class wfmread:
     '''
     Reads the .wfm binary structure for analysis without saving to large files
+    With raw=True the frames keep the native ADC dtype (int8/int16/...) and are not scaled;
+    use self.calibration = (scale, offset) to convert: V = raw*scale + offset
+    The curve buffer is memory-mapped: self.frames is a lazy FrameSequence (len, indexing, slicing,
+    np.asarray of a range), so building a wfmread does not read the samples
     '''
-    def __init__(self, name):
+    def __init__(self, name, raw=False):
         self.name = name
+        self.raw = raw
         self.__read_wfm(name)
 
     def __read_wfm(self, name):
+        start = time.perf_counter()
         with open(name, 'rb') as f:
-            # Struct format reference:
-            # H = unsigned short (2 bytes)
-            # Ns = char[N] (N bytes): N int
-            # l = long (4 bytes)
-            # b = signed char (1 byte)
-            # f = float (4 bytes)
-            # d = double (8 bytes)
-            # L = unsigned long (4 bytes)
-            # i = int (4 bytes)
-            # --- waveform static file information (#0) --- 78bytes
-            self.byte_order                    = st.unpack('H', f.read(2))[0]
-            self.version                       = st.unpack('8s', f.read(8))[0].decode('utf-8')
-            self.num_digits_in_byte_count      = st.unpack('1s', f.read(1))[0].decode('utf-8')
-            self.num_bytes_to_eof              = st.unpack('i', f.read(4))[0]
-            self.num_bytes_per_point           = st.unpack('b', f.read(1))[0]
-            self.byte_offset_to_curve_buffer   = st.unpack('i', f.read(4))[0]
-            self.hor_zoom_scale                = st.unpack('i', f.read(4))[0]
-            self.hor_zoom_pos                  = st.unpack('f', f.read(4))[0]
-            self.ver_zoom_scale                = st.unpack('d', f.read(8))[0]
-            self.ver_zoom_pos                  = st.unpack('f', f.read(4))[0]
-            self.waveform_label                = st.unpack('32s', f.read(32))[0].decode('utf-8')
-            self.n                             = st.unpack('I', f.read(4))[0]
-            self.header_size                   = st.unpack('H', f.read(2))[0]
+            # --- static file information, waveform header, dimensions and time bases ---
+            # one read, decoded in the byte order and with the layout of the file version (wfm_header)
+            header = read_header(f)
+            e = header.endian
+            self.byte_order                    = header.byte_order_verification
+            self.version                       = header.versioning_number
+            self.num_digits_in_byte_count      = header.num_digits_in_byte_count
+            self.num_bytes_to_eof              = header.num_bytes_to_EOF
+            self.num_bytes_per_point           = header.num_bytes_per_point
+            self.byte_offset_to_curve_buffer   = header.byte_offset_to_beginning_of_curve_buffer
+            self.hor_zoom_scale                = header.horizontal_zoom_scale_factor
+            self.hor_zoom_pos                  = header.horizontal_zoom_position
+            self.ver_zoom_scale                = header.vertical_zoom_scale_factor
+            self.ver_zoom_pos                  = header.vertical_zoom_position
+            self.waveform_label                = header.waveform_label
+            self.n                             = header.N
+            self.header_size                   = header.size_of_waveform_header
 
             # --- waveform header ---
-            self.set_type                      = st.unpack('i', f.read(4))[0] # 0 single waveform, 1 fast frame
+            self.set_type                      = header.setType[0] # 0 single waveform, 1 fast frame
             if self.set_type == 0:
                 self.isfast_frame             = False
             elif self.set_type == 1:
                 self.isfast_frame             = True
             else:
                 raise ValueError("Unknown set type: {}".format(self.set_type))
-            self.wfm_cnt                       = st.unpack('I', f.read(4))[0]
-            _ = f.read(36)  # skip these bytes
-            # Acquisition counter 8b, transaction counter 8b, slot ID 4b, Is static flag 4b
-            # wfm update specification count 4b, imp dim ref count 4b, exp dim ref count 4b
-            self.data_type                     = st.unpack('i', f.read(4))[0]  # (#122)
-            _ = f.read(16)  # skip these bytes
-            # gen purpose counter 8b, accumulated waveform count 4b, target target accumulation count 4b
-            self.curve_ref_count               = st.unpack('I', f.read(4))[0]  # (#142)
-            self.num_req_fastframe             = st.unpack('I', f.read(4))[0]
-            self.num_acq_fastframe             = st.unpack('I', f.read(4))[0]
-            _ = f.read(14)  # skip these bytes
-            # summary frame 2b, pix map display format 4b, pix map max value 8b
-            # --- explicit dimension 1 (voltage axis) ---
-            #  in the manual, theres no spacing between Ext dim X and the number
-            # V = wfmCurveData*Scale + Offset
-            self.exp_dim1_scale                = st.unpack('d', f.read(8))[0]
-            self.exp_dim1_offset               = st.unpack('d', f.read(8))[0]
-            self.exp_dim1_size                 = st.unpack('I', f.read(4))[0]
-            self.exp_dim1_units                = st.unpack('20s', f.read(20))[0].decode('utf-8')
-            f.read(16)  # Skip these bytes
-            # dim extent min 8b, dim extent max 8b,
-            self.exp_dim1_resolution           = st.unpack('d', f.read(8))[0]
-            self.exp_dim1_ref_point            = st.unpack('d', f.read(8))[0]
-            self.exp_dim1_format               = st.unpack('i', f.read(4))[0]
-            self.exp_dim1_storage_type         = st.unpack('i', f.read(4))[0]
-            f.read(20)  # Skip these bytes
-            # N value 4b, over range 4b, under range 4b, high range 4b, low range 4b
-            self.exp_dim1_user_scale           = st.unpack('d', f.read(8))[0]
-            self.exp_dim1_user_units           = st.unpack('20s', f.read(20))[0].decode('utf-8')
-            self.exp_dim1_user_offset          = st.unpack('d', f.read(8))[0]
-            if self.version == ':WFM#003':
-                self.exp_dim1_point_density    = st.unpack('d', f.read(8))[0]
-            else:
-                self.exp_dim1_point_density    = st.unpack('I', f.read(4))[0]
-            self.exp_dim1_href                 = st.unpack('d', f.read(8))[0]
-            self.exp_dim1_trig_delay           = st.unpack('d', f.read(8))[0]
+            self.wfm_cnt                       = header.wfmCnt
+            self.data_type                     = header.data_type[0]  # (#122)
+            self.curve_ref_count               = header.curve_ref_count  # (#142)
+            self.num_req_fastframe             = header.num_req_fast_frames
+            self.num_acq_fastframe             = header.num_acq_fast_frames
 
-            # --- explicit dimension 2 (voltage axis) ---
-            self.exp_dim2_scale                = st.unpack('d', f.read(8))[0]
-            self.exp_dim2_offset               = st.unpack('d', f.read(8))[0]
-            self.exp_dim2_size                 = st.unpack('I', f.read(4))[0]
-            self.exp_dim2_units                = st.unpack('20s', f.read(20))[0].decode('utf-8')
-            f.read(16)  # Skip these bytes
-            self.exp_dim2_resolution           = st.unpack('d', f.read(8))[0]
-            self.exp_dim2_ref_point            = st.unpack('d', f.read(8))[0]
-            self.exp_dim2_format               = st.unpack('i', f.read(4))[0]
-            self.exp_dim2_storage_type         = st.unpack('i', f.read(4))[0]
-            f.read(20)  # Skip these bytes
-            self.exp_dim2_user_scale           = st.unpack('d', f.read(8))[0]
-            self.exp_dim2_user_units           = st.unpack('20s', f.read(20))[0].decode('utf-8')
-            self.exp_dim2_user_offset          = st.unpack('d', f.read(8))[0]
-            if self.version == ':WFM#003':
-                self.exp_dim2_point_density    = st.unpack('d', f.read(8))[0]
-            else:
-                self.exp_dim2_point_density    = st.unpack('I', f.read(4))[0]
-            self.exp_dim2_href                 = st.unpack('d', f.read(8))[0]
-            self.exp_dim2_trig_delay           = st.unpack('d', f.read(8))[0]
-
-            # --- implicit dimension 1 (time axis) ---
-            self.imp_dim1_scale                = st.unpack('d', f.read(8))[0]
-            self.imp_dim1_offset               = st.unpack('d', f.read(8))[0]
-            self.imp_dim1_size                 = st.unpack('I', f.read(4))[0]
-            self.imp_dim1_units                = st.unpack('20s', f.read(20))[0].decode('utf-8')
-            f.read(36)  # Skip these bytes
-            self.imp_dim1_user_scale           = st.unpack('d', f.read(8))[0]
-            self.imp_dim1_user_units           = st.unpack('20s', f.read(20))[0].decode('utf-8')
-            self.imp_dim1_user_offset          = st.unpack('d', f.read(8))[0]
-            f.read(8)  # Skip these bytes
-            self.imp_dim1_href                 = st.unpack('d', f.read(8))[0]
-            self.imp_dim1_trig_delay           = st.unpack('d', f.read(8))[0]
-
-            # --- implicit dimension 2 (time axis) ---
-            self.imp_dim2_scale                = st.unpack('d', f.read(8))[0]
-            self.imp_dim2_offset               = st.unpack('d', f.read(8))[0]
-            self.imp_dim2_size                 = st.unpack('I', f.read(4))[0]
-            self.imp_dim2_units                = st.unpack('20s', f.read(20))[0].decode('utf-8')
-            f.read(36)  # Skip these bytes
-            self.imp_dim2_user_scale           = st.unpack('d', f.read(8))[0]
-            self.imp_dim2_user_units           = st.unpack('20s', f.read(20))[0].decode('utf-8')
-            self.imp_dim2_user_offset          = st.unpack('d', f.read(8))[0]
-            f.read(8)  # Skip these bytes
-            self.imp_dim2_href                 = st.unpack('d', f.read(8))[0]
-            self.imp_dim2_trig_delay           = st.unpack('d', f.read(8))[0]
+            # --- explicit dimensions 1 and 2 (voltage axis) ---
+            # V = wfmCurveData*Scale + Offset
+            # --- implicit dimensions 1 and 2 (time axis) ---
+            for prefix, dim in (('exp_dim1', header.ed1), ('exp_dim2', header.ed2),
+                                ('imp_dim1', header.id1), ('imp_dim2', header.id2)):
+                for field in ('scale', 'offset', 'size', 'units', 'resolution', 'ref_point'):
+                    setattr(self, f'{prefix}_{field}', getattr(dim, field if field == 'units' else 'dim_' + field))
+                for field in ('user_scale', 'user_units', 'user_offset', 'point_density', 'href', 'trig_delay'):
+                    setattr(self, f'{prefix}_{field}', getattr(dim, field))
+                if prefix.startswith('exp'):
+                    setattr(self, f'{prefix}_format', dim.format[0])
+                    setattr(self, f'{prefix}_storage_type', dim.storage_type[0])
 
             # --- time base 1 and 2 info ---
-            self.time_base1_real_point_spacing = st.unpack('I', f.read(4))[0]
-            self.time_base1_sweep              = st.unpack('i', f.read(4))[0]
-            self.time_base1_type_of_base       = st.unpack('i', f.read(4))[0]
-
-            self.time_base2_real_point_spacing = st.unpack('I', f.read(4))[0]
-            self.time_base2_sweep              = st.unpack('i', f.read(4))[0]
-            self.time_base2_type_of_base       = st.unpack('i', f.read(4))[0]
-
-            # --- WFM update specification ---
-            # read but we keep values for possible first-frame timestamp
-            real_point_offset_first            = st.unpack('I', f.read(4))[0]
-            tt_offset_first                    = st.unpack('d', f.read(8))[0]
-            frac_sec_first                     = st.unpack('d', f.read(8))[0]
-            gmt_sec_first                      = st.unpack('i', f.read(4))[0]
+            self.time_base1_real_point_spacing = header.tb1_real_point_spacing
+            self.time_base1_sweep              = header.tb1_sweep[0]
+            self.time_base1_type_of_base       = header.tb1_type_of_base[0]
+
+            self.time_base2_real_point_spacing = header.tb2_real_point_spacing
+            self.time_base2_sweep              = header.tb2_sweep[0]
+            self.time_base2_type_of_base       = header.tb2_type_of_base[0]
+
+            # --- WFM update specification and WFM curve information of the first frame ---
+            # decoded with the spec layouts of wfm2readframe (_spec_dtypes), right after the header
+            specs = {'N': self.n}
+            _read_frame_specs(f, specs, e, header.size, 1)
             # store first frame timestamp
-            try:
-                self.frame_timestamps.append(float(gmt_sec_first) + float(frac_sec_first))
-            except Exception:
-                pass
-            # --- WFM curve information --
-            f.read(10)  # Skip these bytes
-            self.precharge_start_offset        = st.unpack('I', f.read(4))[0]
-            self.data_start_offset             = st.unpack('I', f.read(4))[0]
-            self.postcharge_start_offset       = st.unpack('I', f.read(4))[0]
-            self.postcharge_stop_offset        = st.unpack('I', f.read(4))[0]
-            self.end_of_curve_buffer_offset    = st.unpack('I', f.read(4))[0]
-
-            # FastFrame Frames
-            if self.set_type == 1 and getattr(self, 'num_acq_fastframe', 0) > 1:
-                n_extra_frames = int(self.num_acq_fastframe) - 1
-
-                # Read N-1 WfmCurveSpec
-                self._fast_curves = []
-                for i in range(n_extra_frames):
-                    state_flags = st.unpack('I', f.read(4))[0]
-                    checksum_type = st.unpack('i', f.read(4))[0]
-                    checksum = st.unpack('H', f.read(2))[0]
-                    precharge_start = st.unpack('I', f.read(4))[0]
-                    data_start = st.unpack('I', f.read(4))[0]
-                    postcharge_start = st.unpack('I', f.read(4))[0]
-                    postcharge_stop = st.unpack('I', f.read(4))[0]
-                    end_of_curve = st.unpack('I', f.read(4))[0]
-
-
-                    self._fast_curves.append({
-                    'state_flags': state_flags,
-                    'checksum_type': checksum_type,
-                    'checksum': checksum,
-                    'precharge_start': precharge_start,
-                    'data_start': data_start,
-                    'postcharge_start': postcharge_start,
-                    'postcharge_stop': postcharge_stop,
-                    'end_of_curve': end_of_curve
-                    })
-
-                # --- Curve Buffer ---
-                # compute expected curve size for the main (first) curve
-                # note: data_start_offset and postcharge_stop_offset are offsets relative to the curve buffer
-                try:
-                    self.curve_size_in_bytes = int(self.postcharge_start_offset) - int(self.data_start_offset)
-                except Exception:
-                    self.curve_size_in_bytes = None
-                
-                # Move to curve buffer start
-                if getattr(self, 'byte_offset_to_curve_buffer', None) is None:
-                    # fallback: try to compute from current file position
-                    curve_buf_start = f.tell()
-                else:
-                    curve_buf_start = int(self.byte_offset_to_curve_buffer)
-                
-                # Read full curve buffer once to allow slicing for each frame
-                f.seek(curve_buf_start)
-                # If end_of_curve_buffer_offset is available, use it to determine buffer length
-                buffer_len = None
-                if getattr(self, 'end_of_curve_buffer_offset', None) is not None:
-                    try:
-                        buffer_len = int(self.end_of_curve_buffer_offset)
-                    except Exception:
-                        buffer_len = None
+            self.frame_timestamps = [float(specs['GMT_sec']) + float(specs['frac_sec'])]
+            self.precharge_start_offset        = specs['precharge_start_offset']
+            self.data_start_offset             = specs['data_start_offset']
+            self.postcharge_start_offset       = specs['postcharge_start_offset']
+            self.postcharge_stop_offset        = specs['postcharge_stop_offset']
+            self.end_of_curve_buffer_offset    = specs['end_of_curve_buffer_offset']
 
+            PROFILER.add_time("header_parse", time.perf_counter() - start)
+            PROFILER.count("header_parses")
 
-                # If we have N frames layout, we can't always rely on single curve_size_in_bytes for all
-                # Instead read until the next header/EOF (use num_bytes_to_eof to be safe)
-                try:
-                    # num_bytes_to_eof is bytes from early header to EOF
-                    # compute how many bytes remain from curve_buf_start to EOF
-                    f.seek(0, os.SEEK_END)
-                    file_size = f.tell()
-                    # bytes from curve buffer start to EOF
-                    remaining = file_size - curve_buf_start
-                    f.seek(curve_buf_start)
-                    full_curve_buf = f.read(remaining if buffer_len is None else min(remaining, buffer_len))
-                except Exception:
-                    full_curve_buf = b''
-
-                # Determine numpy dtype from exp_dim1_format
-                fmt = getattr(self, 'exp_dim1_format', 0)
-                dtype_map = {
-                    0: np.int16,
-                    1: np.int32,
-                    2: np.uint32,
-                    3: np.uint64,
-                    4: np.float32,
-                    5: np.float64,
-                    6: np.uint8,
-                    7: np.int8
-                }
-                if fmt not in dtype_map:
-                    # fallback to int16
-                    dtype = np.int16
-                else:
-                    dtype = dtype_map[fmt]
-
-
-                bpp = int(np.dtype(dtype).itemsize)
-                if self.num_bytes_per_point and abs(int(self.num_bytes_per_point)) != bpp:
-                    # if header num_bytes_per_point disagrees, prefer header but make sure slicing counts match
-                    bpp = abs(int(self.num_bytes_per_point))
-
-                # Helper to convert raw bytes slice -> numpy array in engineering units
-                def slice_to_array(raw_bytes):
-                    # ensure length multiple of bpp
-                    n_samples = len(raw_bytes) // bpp
-                    if n_samples <= 0:
-                        return np.array([])
-                    
-                    arr = np.frombuffer(raw_bytes[:n_samples * bpp], dtype=dtype, count=n_samples)
-                    # convert to float64 and apply exp_dim1 scale/offset
-                    scale = float(getattr(self, 'exp_dim1_scale', 1.0))
-                    offset = float(getattr(self, 'exp_dim1_offset', 0.0))
-                    return arr.astype(np.float64) * scale + offset
-                
-                # Build list of curve specs including first frame then extras
-                all_curve_specs = []
-                # first
-                all_curve_specs.append({
-                    'data_start': int(self.data_start_offset) if getattr(self, 'data_start_offset', None) is not None else None,
-                    'postcharge_stop': int(self.postcharge_stop_offset) if getattr(self, 'postcharge_stop_offset', None) is not None else None
-                })
-                # extras
-                if getattr(self, '_fast_curves', None):
-                    for cs in self._fast_curves:
-                        all_curve_specs.append({
-                            'data_start': cs.get('data_start'),
-                            'postcharge_stop': cs.get('postcharge_stop')
-                        })
+            # FastFrame Frames
+            # the N extra curve specs come after the first update + curve spec and the N extra update specs
+            update_spec, curve_spec = _spec_dtypes(e)
+            n_extra_frames = int(self.n)
+            f.seek(header.size + update_spec.itemsize + curve_spec.itemsize + n_extra_frames * update_spec.itemsize)
+            raw_specs = f.read(n_extra_frames * curve_spec.itemsize)
+            self._fast_curves = np.frombuffer(raw_specs, dtype=curve_spec,
+                                              count=len(raw_specs) // curve_spec.itemsize)
+
+        # --- Curve Buffer ---
+        # the frames come from the memory-mapped reader of wfm2readframe (same data format check,
+        # frame geometry and truncation warning): nothing is read until a frame is accessed
+        wfm = WfmFile(name)
+        self.calibration = wfm.calibration
+        self.curve_size_in_bytes = int(self.postcharge_start_offset) - int(self.data_start_offset)
+        self.frames = FrameSequence(wfm.raw, self.calibration, self.raw)
+
+        # time: implicit dimension 1, one point per sample of a frame (imp_dim1_size also counts pre/postcharge)
+        if len(self.frames) > 0 and wfm.nop > 0:
+            self.time = wfm.time
+        else:
+            self.time = np.array([])
+
+    # Backwards-compatible single-frame outputs: the first frame, decoded when accessed
+    @property
+    def curve_data(self):
+        if len(self.frames) == 0 or self.frames.rows.shape[1] == 0:
+            return np.array([])
+        return self.frames[0]
+
+    @property
+    def data(self):
+        return self.curve_data
 
-                # Extract frames from full_curve_buf using offsets relative to curve buffer start
-                self.frames = []
-                for cs in all_curve_specs:
-                    if cs['data_start'] is None or cs['postcharge_stop'] is None:
-                        self.frames.append(None)
-                        continue
-                    s = int(cs['data_start'])
-                    e = int(cs['postcharge_stop'])
-                    # bounds-check
-                    if s < 0 or e <= s or e > len(full_curve_buf):
-                    # try clamping to available buffer
-                        s = max(0, s)
-                        e = min(len(full_curve_buf), e)
-                    if e <= s:
-                        self.frames.append(None)
-                        continue
-                    raw = full_curve_buf[s:e]
-                    arr = slice_to_array(raw)
-                    self.frames.append(arr)
-                # Backwards-compatible single-frame outputs: fill self.data and self.time
-                if len(self.frames) >= 1 and self.frames[0] is not None and self.frames[0].size > 0:
-                    self.curve_data = np.array(self.frames[0], dtype=np.float64)
-                    self.data = np.array(self.curve_data)
-                    # time: implicit dimension 1
-                    try:
-                        pts = int(getattr(self, 'imp_dim1_size', self.curve_data.size))
-                        self.time = np.arange(0, pts) * float(getattr(self, 'imp_dim1_scale', 1.0)) + float(getattr(self, 'imp_dim1_offset', 0.0))
-                    except Exception:
-                        self.time = np.arange(0, self.curve_data.size)
-                else:
-                    self.curve_data = np.array([])
-                    self.data = np.array([])
-                    self.time = np.array([])
 ######################################################################  
     def write_to_npz(self):
         out_name = self.name.rstrip('.wfm')
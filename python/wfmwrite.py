@@ -0,0 +1,348 @@
+# wfmwrite.py
+# Writer for Tektronix .wfm files (versions 1-3, single waveform or FastFrame),
+# with the same layout that wfm2readframe parses:
+#   static file info (78 bytes) | waveform header | ed1 ed2 id1 id2 | time bases |
+#   frame 1 update spec + curve spec | N update specs | N curve specs | curve buffer | file checksum
+import struct
+import numpy as np
+from wfm2readframe import WfmFile
+from wfm_header import dimension_offsets
+
+
+# sample dtype -> ed1.format code
+FORMAT_CODES = {
+    np.dtype(np.int16): 0,
+    np.dtype(np.int32): 1,
+    np.dtype(np.uint32): 2,
+    np.dtype(np.uint64): 3,
+    np.dtype(np.float32): 4,
+    np.dtype(np.float64): 5,
+    np.dtype(np.uint8): 6,     # version 3 only
+    np.dtype(np.int8): 7,      # version 3 only
+}
+
+STATIC_INFO_BYTES = 78
+UPDATE_SPEC_BYTES = 24
+CURVE_SPEC_BYTES = 30
+# frames written per chunk, bounds the memory used to add pre/postcharge
+WRITE_CHUNK_FRAMES = 4096
+
+
+def _units(text):
+    return text.encode()[:20].ljust(20, b'\0')
+
+
+def _explicit_dim(e, version, scale, offset, size, units, fmt_code, dtype):
+    """Explicit dimension (ed1/ed2) block."""
+    if dtype.kind in 'iu':
+        info = np.iinfo(dtype)
+        low, high = int(max(info.min, -2**31)), int(min(info.max, 2**31 - 1))
+    else:
+        low, high = 0, 0
+    b = struct.pack(e + 'ddI', scale, offset, size) + _units(units)
+    b += struct.pack(e + 'dddd', offset + scale * low, offset + scale * high, scale, 0.0)
+    b += struct.pack(e + '4b4b', fmt_code, 0, 0, 0, 0, 0, 0, 0)   # format, storage_type (explicit sample)
+    b += struct.pack(e + 'iiiii', 0, high, low, high, low)        # n_value, over/under range, high/low range
+    b += struct.pack(e + 'd', 1.0) + _units("") + struct.pack(e + 'd', 0.0)   # user scale, units, offset
+    b += struct.pack(e + 'd', 1.0) if version >= 3 else struct.pack(e + 'I', 1)   # point density
+    return b + struct.pack(e + 'dd', 0.0, 0.0)   # href, trig_delay
+
+
+def _implicit_dim(e, version, scale, offset, size, units):
+    """Implicit dimension (id1/id2) block."""
+    b = struct.pack(e + 'ddI', scale, offset, size) + _units(units)
+    b += struct.pack(e + 'dddd', offset, offset + scale * max(size - 1, 0), scale, 0.0)
+    b += struct.pack(e + 'I', 1)   # spacing
+    b += struct.pack(e + 'd', 1.0) + _units("") + struct.pack(e + 'd', 0.0)
+    b += struct.pack(e + 'd', 1.0) if version >= 3 else struct.pack(e + 'I', 1)
+    return b + struct.pack(e + 'dd', 50.0, 0.0)
+
+
+def _copied_dimensions(e, version, dimensions, t_scale, t_offset, t_size):
+    """
+    The ed1, ed2, id1, id2 blocks of another file of the same version and byte order (raw bytes),
+    with only the id1 scale, offset and size replaced.
+    """
+    offsets = dimension_offsets(version)
+    start = offsets['ed1'][0]
+    b = bytearray(dimensions)
+    if len(b) != offsets['id2'][1] - start:
+        raise ValueError(f"Dimension blocks of {len(b)} bytes, version {version} needs {offsets['id2'][1] - start}")
+    struct.pack_into(e + 'ddI', b, offsets['id1'][0] - start, t_scale, t_offset, t_size)
+    return bytes(b)
+
+
+def _waveform_header(e, version, n_frames, dtype, y_scale, y_offset, y_units, t_scale, t_offset, t_size, t_units,
+                     dimensions=None):
+    """
+    Waveform header, dimensions and time bases (everything between the static info and the update specs).
+    dimensions: raw ed1..id2 blocks to copy instead of generating them (see _copied_dimensions)
+    """
+    fast_frame = 1 if n_frames > 1 else 0
+    b = struct.pack(e + '4bI', fast_frame, 0, 0, 0, 1)        # setType, wfmCnt
+    b += struct.pack(e + 'QQII', 0, 0, 0, 0)                  # acquisition/transaction counters, slot ID, static flag
+    b += struct.pack(e + 'III', n_frames, 1, 1)               # update spec count, imp/exp dim ref count
+    b += struct.pack(e + '4b', 2, 0, 0, 0)                    # data_type: vector
+    b += struct.pack(e + 'QII', 0, 0, 1)                      # general purpose counter, accumulated/target count
+    b += struct.pack(e + 'III', 1, n_frames, n_frames)        # curve ref count, requested/acquired fast frames
+    if version >= 2:
+        b += struct.pack(e + 'H', 0)                          # summary frame type
+    b += struct.pack(e + '4bQ', 0, 0, 0, 0, 0)                # pixmap display format, pixmap max value
+    if dimensions is not None:
+        b += _copied_dimensions(e, version, dimensions, t_scale, t_offset, t_size)
+    else:
+        fmt_code = FORMAT_CODES[dtype.newbyteorder('=')]
+        b += _explicit_dim(e, version, y_scale, y_offset, 0, y_units, fmt_code, dtype)
+        b += _explicit_dim(e, version, 1.0, 0.0, 0, "", 0, np.dtype(np.int16))
+        b += _implicit_dim(e, version, t_scale, t_offset, t_size, t_units)
+        b += _implicit_dim(e, version, 1.0, 0.0, 0, "")
+    for _ in range(2):                                       # time base 1 and 2
+        b += struct.pack(e + 'I4b4b', 1, 0, 0, 0, 0, 0, 0, 0, 0)
+    return b
+
+
+def _static_info(e, version, num_bytes_to_eof, bytes_per_point, curve_offset, label, n_extra, header_size):
+    b = b'\x0f\x0f' if e == '<' else b'\xf0\xf0'
+    b += f":WFM#{version:03d}".encode()
+    b += struct.pack(e + 'BiBI', len(str(num_bytes_to_eof)), num_bytes_to_eof, bytes_per_point, curve_offset)
+    b += struct.pack(e + 'ifdf', 1, 0.0, 1.0, 0.0)            # horizontal/vertical zoom
+    b += label.encode()[:31].ljust(32, b'\0')
+    b += struct.pack(e + 'IH', n_extra, header_size)
+    assert len(b) == STATIC_INFO_BYTES
+    return b
+
+
+def _frame_specs(e, n_frames, update_fields, curve_offsets):
+    """
+    Update spec and curve spec of frame 1, then the N extra update specs and the N extra curve specs.
+    update_fields: dict update spec field -> per frame values (missing fields are 0)
+    """
+    update_dtype = np.dtype([('real_point_offset', e + 'u4'), ('tt_offset', e + 'f8'),
+                             ('frac_sec', e + 'f8'), ('GMT_sec', e + 'i4')])
+    curve_dtype = np.dtype([('state_flags', e + 'u4'), ('type_of_checksum', 'i1', (4,)), ('checksum', e + 'i2'),
+                            ('precharge_start_offset', e + 'u4'), ('data_start_offset', e + 'u4'),
+                            ('postcharge_start_offset', e + 'u4'), ('postcharge_stop_offset', e + 'u4'),
+                            ('end_of_curve_buffer_offset', e + 'u4')])
+    update = np.zeros(n_frames, dtype=update_dtype)
+    for name, value in update_fields.items():
+        if value is not None:
+            update[name] = value
+    curve = np.zeros(n_frames, dtype=curve_dtype)
+    for name, value in zip(('precharge_start_offset', 'data_start_offset', 'postcharge_start_offset',
+                            'postcharge_stop_offset', 'end_of_curve_buffer_offset'), curve_offsets):
+        curve[name] = value
+    return update[:1].tobytes() + curve[:1].tobytes() + update[1:].tobytes() + curve[1:].tobytes()
+
+
+class _ChecksumWriter:
+    """File wrapper that keeps the running byte sum used as the file checksum."""
+    def __init__(self, f):
+        self.f = f
+        self.checksum = 0
+
+    def write(self, data):
+        self.checksum += int(np.frombuffer(data, dtype=np.uint8).sum(dtype=np.uint64))
+        self.f.write(data)
+
+
+def write_wfm(filename, samples, version=3, endian='<', y_scale=1.0, y_offset=0.0, y_units="V",
+              t_scale=1e-10, t_offset=0.0, t_units="s", precharge=0, postcharge=0,
+              timestamps=None, tt_offsets=None, real_point_offsets=None, update_specs=None, label="",
+              dimensions=None):
+    """
+    Write a .wfm file with one frame per row of samples.
+
+    samples: (n_frames, nop) array (or a 1-D single frame) in the native sample dtype, which selects
+             ed1.format (int16, int32, uint32, uint64, float32, float64; int8/uint8 need version 3).
+             It may be a memmap, a strided view or any object with shape, dtype and row slicing,
+             it is written in chunks of frames.
+    y_scale, y_offset: ed1 calibration, voltage = y_offset + y_scale * samples
+    t_scale, t_offset: id1, time of sample i = t_offset + t_scale * i (as in the readers)
+    precharge, postcharge: number of (zero) samples written before and after the data of each frame
+    timestamps: per frame trigger time in seconds since the epoch (GMT_sec + frac_sec), default 0;
+                as one float64 it resolves about 0.2 us, use update_specs for finer frac_sec values
+    tt_offsets, real_point_offsets: per frame update spec fields, default 0
+    update_specs: per frame update specs with fields GMT_sec, frac_sec, tt_offset and real_point_offset
+                  (e.g. rows of a frame table), used instead of timestamps/tt_offsets/real_point_offsets
+    dimensions: raw bytes of the ed1, ed2, id1 and id2 blocks of a file with the same version and byte order,
+                copied instead of generated (y_scale, y_offset, y_units and t_units are then ignored);
+                only the id1 scale, offset and size are set from t_scale, t_offset and the record length
+    Returns the number of bytes written.
+    """
+    if endian not in ('<', '>'):
+        raise ValueError(f"endian must be '<' or '>', not {endian!r}")
+    if version not in (1, 2, 3):
+        raise ValueError(f"Unsupported WFM version {version}")
+    if not hasattr(samples, 'shape'):
+        samples = np.asarray(samples)
+    if len(samples.shape) == 1:
+        samples = samples[np.newaxis, :]
+    native = samples.dtype.newbyteorder('=')
+    if native not in FORMAT_CODES:
+        raise ValueError(f"Unsupported sample dtype {samples.dtype}")
+    if FORMAT_CODES[native] in (6, 7) and version < 3:
+        raise ValueError(f"{native} samples need WFM version 3")
+    file_dtype = native.newbyteorder(endian)
+    n_frames, nop = samples.shape
+    if n_frames < 1:
+        raise ValueError("At least one frame is needed.")
+    bpp = file_dtype.itemsize
+    record = precharge + nop + postcharge
+    frame_bytes = record * bpp
+    curve_offsets = (0, precharge * bpp, (precharge + nop) * bpp, frame_bytes, frame_bytes)
+
+    header = _waveform_header(endian, version, n_frames, file_dtype, y_scale, y_offset, y_units,
+                              t_scale, t_offset, record, t_units, dimensions)
+    if update_specs is not None:
+        update_fields = {name: update_specs[name] for name in ('GMT_sec', 'frac_sec', 'tt_offset', 'real_point_offset')}
+    else:
+        update_fields = {'tt_offset': tt_offsets, 'real_point_offset': real_point_offsets}
+        if timestamps is not None:
+            timestamps = np.asarray(timestamps, dtype=np.float64)
+            update_fields['GMT_sec'] = np.floor(timestamps)
+            update_fields['frac_sec'] = timestamps - np.floor(timestamps)
+    specs = _frame_specs(endian, n_frames, update_fields, curve_offsets)
+    curve_offset = STATIC_INFO_BYTES + len(header) + len(specs)
+    total = curve_offset + n_frames * frame_bytes + 8   # + file checksum
+    static = _static_info(endian, version, total - 15, bpp, curve_offset, label, n_frames - 1, len(header))
+
+    with open(filename, 'wb') as raw_file:
+        f = _ChecksumWriter(raw_file)
+        f.write(static)
+        f.write(header)
+        f.write(specs)
+        chunk = np.zeros((min(n_frames, WRITE_CHUNK_FRAMES), record), dtype=file_dtype)
+        for first in range(0, n_frames, WRITE_CHUNK_FRAMES):
+            k = min(WRITE_CHUNK_FRAMES, n_frames - first)
+            chunk[:k, precharge:precharge + nop] = samples[first:first + k]
+            f.write(chunk[:k].tobytes())
+        raw_file.write(struct.pack(endian + 'Q', f.checksum & 0xFFFFFFFFFFFFFFFF))
+    return total
+
+
+def synthetic_frames(n_frames, nop, dtype=np.int16, seed=0, amplitude=0.2, noise=0.002, rise_time=3e-10,
+                     t_scale=1e-11, y_scale=None, y_offset=0.0):
+    """
+    Random negative pulses (gaussian rising edge, exponential tail) on a noisy baseline, as raw samples.
+    Returns: samples (n_frames, nop) of dtype, y_scale, y_offset
+    For integer dtypes y_scale defaults to the full pulse range over half the ADC range; float dtypes store volts.
+    """
+    dtype = np.dtype(dtype)
+    rng = np.random.default_rng(seed)
+    time = np.arange(nop) * t_scale
+    start = rng.uniform(0.3, 0.6, size=(n_frames, 1)) * nop * t_scale
+    height = amplitude * rng.uniform(0.2, 1.0, size=(n_frames, 1))
+    dt = time - start
+    pulse = np.where(dt < 0, np.exp(-0.5 * (dt / rise_time) ** 2), np.exp(-dt / (4 * rise_time)))
+    volts = -height * pulse + rng.normal(0.0, noise, size=(n_frames, nop))
+    if dtype.kind == 'f':
+        return volts.astype(dtype), 1.0, 0.0
+    info = np.iinfo(dtype)
+    if y_scale is None:
+        half_range = min(info.max // 2 if dtype.kind == 'u' else info.max, 2**15 - 1)
+        y_scale = 2 * amplitude / half_range
+    if dtype.kind == 'u' and y_offset == 0.0:
+        # unsigned samples: put the baseline at the middle of the ADC range
+        y_offset = -min(info.max // 2 + 1, 2**15) * y_scale
+    values = np.clip(np.rint((volts - y_offset) / y_scale), info.min, info.max)
+    return values.astype(dtype), y_scale, y_offset
+
+
+class _RowSelection:
+    """Lazy (rows, samples) selection of a raw view: only the chunks being written are copied."""
+    def __init__(self, raw, rows, columns):
+        self.raw = raw
+        self.rows = rows
+        self.columns = columns
+        self.dtype = raw.dtype
+        self.shape = (len(rows), len(range(*columns.indices(raw.shape[1]))))
+
+    def __getitem__(self, key):
+        return self.raw[self.rows[key]][:, self.columns]
+
+
+def subset_wfm(src, dst, frames=None, sample_window=None, time_window=None, stride=1):
+    """
+    Write a smaller valid .wfm file with a selection of the frames and samples of src.
+    The raw samples are copied in the file byte order without decoding; version, byte order, label,
+    per frame update specs (timestamps) and the ed1, ed2, id1 and id2 blocks (calibration, over/under
+    range, extents, ...) are kept byte for byte, except the id1 offset, scale and size, which are
+    adjusted to the sample window and stride.
+
+    frames: frame numbers as in read_frames (1-based; None, an integer, a slice or a list)
+    sample_window: (start, stop) 0-based sample range of each frame (stop None = end of the record)
+    time_window: (t0, t1) in seconds, alternative to sample_window (None = open end)
+    stride: keep one sample out of `stride` (decimation without filtering)
+    Returns (frames written, samples per frame).
+    """
+    if sample_window is not None and time_window is not None:
+        raise ValueError("Give either sample_window or time_window, not both.")
+    if stride < 1:
+        raise ValueError("stride must be a positive integer.")
+    with WfmFile(src) as wfm:
+        id1 = wfm.info['id1']
+        if time_window is not None:
+            sample_window = wfm.sample_window(time_window)
+        start, stop = sample_window if sample_window is not None else (0, None)
+        columns = slice(start, stop, stride)
+        first, _, _ = columns.indices(wfm.nop)
+
+        rows = wfm._frame_rows(frames)
+        rows = np.arange(wfm.n_frames)[rows] if isinstance(rows, slice) else np.atleast_1d(rows)
+        selection = _RowSelection(wfm.raw, rows, columns)
+        if selection.shape[0] == 0 or selection.shape[1] == 0:
+            raise ValueError("The selection is empty.")
+
+        # the dimension blocks are copied byte for byte (ranges, extents, ed2/id2, ...), only the
+        # id1 time axis and record length are rewritten
+        offsets = dimension_offsets(wfm.version)
+        with open(wfm.filename, 'rb') as f:
+            f.seek(offsets['ed1'][0])
+            dimensions = f.read(offsets['id2'][1] - offsets['ed1'][0])
+        ed1 = wfm.info['ed1']
+        write_wfm(dst, selection, version=wfm.version, endian=wfm.endian,
+                  y_scale=ed1['dim_scale'], y_offset=ed1['dim_offset'], y_units=ed1['units'],
+                  t_scale=id1['dim_scale'] * stride, t_offset=id1['dim_offset'] + first * id1['dim_scale'],
+                  t_units=id1['units'], update_specs=wfm.frame_table[rows],
+                  label=wfm.info.get('waveform_label', ""), dimensions=dimensions)
+        return selection.shape
+
+
+def _parse_frames(text):
+    """"a:b" (frame numbers, stop exclusive, as a Python slice), "a:b:step" or "1,5,7"."""
+    if text is None:
+        return None
+    if ":" in text:
+        parts = [int(p) if p else None for p in text.split(":")]
+        return slice(*parts)
+    return [int(p) for p in text.split(",") if p.strip()]
+
+
+def _parse_range(text, cast):
+    if text is None:
+        return None
+    start, _, stop = text.partition(":")
+    return (cast(start) if start else None), (cast(stop) if stop else None)
+
+
+if __name__ == "__main__":
+    import click
+
+    @click.command()
+    @click.option('-i', '--input_file', type=click.Path(exists=True), required=True, help="Source .wfm file")
+    @click.option('-o', '--output_file', type=click.Path(), required=True, help="Output .wfm file")
+    @click.option('--frames', default=None, help="Frame numbers: start:stop[:step] (1-based, stop exclusive) or 1,5,7")
+    @click.option('--samples', default=None, help="Sample window start:stop (0-based, stop exclusive)")
+    @click.option('--time-window', default=None, help="Time window t0:t1 in seconds")
+    @click.option('--stride', type=int, default=1, show_default=True, help="Keep one sample out of STRIDE")
+    def subset(input_file, output_file, frames, samples, time_window, stride):
+        """Write a smaller valid .wfm file with a subset of the frames/samples, copying the raw bytes."""
+        sample_window = _parse_range(samples, int)
+        if sample_window is not None:
+            sample_window = (sample_window[0] or 0, sample_window[1])
+        n_frames, nop = subset_wfm(input_file, output_file, frames=_parse_frames(frames),
+                                   sample_window=sample_window, time_window=_parse_range(time_window, float),
+                                   stride=stride)
+        print(f"Wrote {n_frames} frames of {nop} samples to {output_file}")
+
+    subset()
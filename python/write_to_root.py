@@ -5,11 +5,23 @@
 #  - use array('i') for event_number (matches "event_number/I")
 #  - attempt to reserve vector capacity when possible
 #  - reduce noisy prints for performance (kept essential prints)
+#  - optional --jobs N: cycle files are converted in worker processes and merged in cycle order
+#  - events are written in blocks through root_io.BlockWriter (no per-event list/vector conversions)
+#  - optional --profile: per-stage time breakdown (header parse, disk read, decode, features, tree fill/write)
+#  - processed-files manifest next to the output; --resume converts only new cycle files
 import os
 import re
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from array import array
 import numpy as np
-from wfm2readframe import wfm2readframe
+from wfm2readframe import WfmFile, WfmReadError
+from features import DEFAULT_FEATURES, FEATURE_DTYPES, compute_features, parse_features, parse_window
+from root_io import BlockWriter, bind_branch
+from profiling import PROFILER, report_profile
+from manifest import Manifest, manifest_path
 import click
 import ROOT
 import tqdm
@@ -18,17 +30,343 @@ import tqdm
 def iter_waveforms(input_file):
     """
     Generator that yields (time, waveform) for each frame in a WFM file.
-    This reads frames on demand (no full-file storage).
+    Frames are streamed in memory-bounded blocks with iter_frame_blocks
+    (one header parse per file, no per-frame Python overhead).
     """
-    # Read first frame to get number of events and the time axis
-    first_waveform, time, info, _, _ = wfm2readframe(input_file, 1)
-    Events_Found = info["N"]
-    # yield the first waveform (wfm2readframe returned it already)
-    yield time, np.asarray(first_waveform, dtype=float)
-    # remaining frames
-    for idx in range(2, Events_Found + 1):
-        waveform, _, _, _, _ = wfm2readframe(input_file, idx)
-        yield time, np.asarray(waveform, dtype=float)
+    with WfmFile(input_file) as wfm:
+        time = wfm.time
+        # frames 1..N (info["N"]), as with the per-frame reader
+        for waveforms, _ in wfm.iter_blocks(slice(1, wfm.info["N"] + 1)):
+            for waveform in waveforms:
+                yield time, waveform
+
+
+def count_events(input_file):
+    """
+    Number of events iter_waveforms will yield for a file, from the header only.
+    """
+    with WfmFile(input_file) as wfm:
+        return min(int(wfm.info["N"]), wfm.n_frames)
+
+
+def list_cycle_files(input_folder, channel):
+    """
+    Sorted list of the cycle_XXXX_ch{channel}.wfm files in input_folder.
+    """
+    pattern = re.compile(rf'cycle_(\d+)_ch{channel}\.wfm$')  # escaped .wfm
+    files = sorted(os.listdir(input_folder))
+    return [os.path.join(input_folder, filename) for filename in files if pattern.search(filename)]
+
+
+def book_trees(channel, run_number, layout="voltage", nop=None, sample_dtype=None,
+               features=DEFAULT_FEATURES, feature_options=None, existing=False):
+    """
+    Create the "waveforms", "metadata" and "calibration" trees in the current ROOT directory
+    (with existing=True, read them back from it and bind the buffers, to append entries).
+    layout:
+      - "voltage": calibrated samples in a vector<double> branch "voltage"
+      - "raw": native ADC samples in a fixed-size array branch "adc[nop]" of sample_dtype
+        (calibrate with the "calibration" tree: voltage = y_offset + y_scale * adc)
+    features: per-event scalar branches computed by features.compute_features,
+    with feature_options passed as keyword arguments (pedestal_window, threshold, ...)
+    Returns a dict with the trees, the BlockWriter of the waveforms tree and the branch buffers.
+    """
+    if layout not in ("voltage", "raw"):
+        raise ValueError(f"Unknown layout: {layout}")
+    if existing:
+        tree_waveforms = ROOT.gDirectory.Get("waveforms")
+        tree_metadata = ROOT.gDirectory.Get("metadata")
+        tree_calibration = ROOT.gDirectory.Get("calibration")
+        if not (tree_waveforms and tree_metadata and tree_calibration):
+            raise KeyError(f"Missing waveforms, metadata or calibration tree in {ROOT.gDirectory.GetName()}")
+    else:
+        tree_waveforms = ROOT.TTree("waveforms", "Waveform Data")
+        tree_metadata = ROOT.TTree("metadata", "Metadata")
+        tree_calibration = ROOT.TTree("calibration", "Per source file calibration")
+    # Split the file in smaller ones of 10GB
+    tree_waveforms.SetMaxTreeSize(10*1024**3)
+    tree_waveforms.SetAutoFlush(500_000_000)
+
+    # Whole blocks of events are handed to the tree in one call
+    writer = BlockWriter(tree_waveforms)
+    writer.add_scalar("event_number", np.int32)
+    if layout == "raw":
+        writer.add_array("adc", sample_dtype, nop)
+    else:
+        writer.add_vector("voltage")
+    for name in features:
+        writer.add_scalar(name, FEATURE_DTYPES[name])
+
+    # C-compatible 32-bit int for scalar branch
+    buffers = {
+        "time": ROOT.VecOps.RVec('double')(),
+        "channel": array('i', [channel]),
+        "run_number": array('i', [run_number if run_number is not None else -1]),
+        "file": np.zeros(256, dtype=np.uint8),
+        "first_event": np.zeros(1, dtype=np.int32),
+        "n_events": np.zeros(1, dtype=np.int32),
+        "y_scale": np.zeros(1, dtype=np.float64),
+        "y_offset": np.zeros(1, dtype=np.float64),
+        "t_scale": np.zeros(1, dtype=np.float64),
+        "t_offset": np.zeros(1, dtype=np.float64),
+    }
+    bind_branch(tree_metadata, "channel", buffers["channel"], "channel/I")
+    bind_branch(tree_metadata, "time", buffers["time"])
+    bind_branch(tree_metadata, "run_number", buffers["run_number"], "run_number/I")
+
+    # one entry per source file: ed1/id1 dim_scale and dim_offset for events [first_event, first_event + n_events)
+    bind_branch(tree_calibration, "file", buffers["file"], "file/C")
+    bind_branch(tree_calibration, "first_event", buffers["first_event"], "first_event/I")
+    bind_branch(tree_calibration, "n_events", buffers["n_events"], "n_events/I")
+    bind_branch(tree_calibration, "y_scale", buffers["y_scale"], "y_scale/D")
+    bind_branch(tree_calibration, "y_offset", buffers["y_offset"], "y_offset/D")
+    bind_branch(tree_calibration, "t_scale", buffers["t_scale"], "t_scale/D")
+    bind_branch(tree_calibration, "t_offset", buffers["t_offset"], "t_offset/D")
+
+    return {
+        "layout": layout,
+        "nop": nop,
+        "features": tuple(features),
+        "feature_options": dict(feature_options or {}),
+        "waveforms": tree_waveforms,
+        "metadata": tree_metadata,
+        "calibration": tree_calibration,
+        "writer": writer,
+        "buffers": buffers,
+    }
+
+
+def fill_calibration(output, input_file, wfm, first_event, n_events):
+    """
+    Add the calibration entry of one source file.
+    """
+    buffers = output["buffers"]
+    name = os.path.basename(input_file).encode()[:buffers["file"].size - 1]
+    buffers["file"][:] = 0
+    buffers["file"][:len(name)] = np.frombuffer(name, dtype=np.uint8)
+    buffers["first_event"][0] = first_event
+    buffers["n_events"][0] = n_events
+    buffers["y_scale"][0] = wfm.info["ed1"]["dim_scale"]
+    buffers["y_offset"][0] = wfm.info["ed1"]["dim_offset"]
+    buffers["t_scale"][0] = wfm.info["id1"]["dim_scale"]
+    buffers["t_offset"][0] = wfm.info["id1"]["dim_offset"]
+    output["calibration"].Fill()
+
+
+def fill_block(output, waveforms, time_axis, first_event, calibration=None):
+    """
+    Fill the waveforms tree with one block of frames, event numbers starting at first_event.
+    waveforms are calibrated voltages, or raw samples for the raw layout (then calibration is the
+    (scale, offset) pair of their file, used by the feature stage).
+    The metadata tree is filled with the time axis when event number 0 is reached.
+    Returns the number of events in the block.
+    """
+    k = len(waveforms)
+    if first_event == 0 and k > 0:
+        time_vec = output["buffers"]["time"]
+        tmpt = ROOT.std.vector('double')(time_axis.astype(np.float64).tolist())
+        # Fill the time vector only once (assumed constant across events)
+        time_vec.clear()
+        time_vec.insert(time_vec.end(), tmpt.begin(), tmpt.end())
+        output["metadata"].Fill()
+    if waveforms.shape[1] == 0:
+        return k
+
+    # all the features of the block in one pass (on the integers for the raw layout)
+    raw = output["layout"] == "raw"
+    with PROFILER.timer("features"):
+        columns = compute_features(waveforms, time_axis, output["features"],
+                                   calibration=calibration if raw else None,
+                                   **output["feature_options"])
+    columns["event_number"] = np.arange(first_event, first_event + k, dtype=np.int32)
+    columns["adc" if raw else "voltage"] = waveforms
+    with PROFILER.timer("tree_fill"):
+        nbytes = output["writer"].fill(columns)
+    PROFILER.count("events", k)
+    PROFILER.count("tree_fill_bytes", int(nbytes))
+    return k
+
+
+def convert_file(input_file, output, first_event, progress=tqdm.tqdm):
+    """
+    Fill the trees with all the events of one .wfm file, one block of frames at a time.
+    Event numbers start at first_event.
+    Returns the number of event numbers consumed.
+    """
+    raw = output["layout"] == "raw"
+
+    global_event_counter = first_event
+    with WfmFile(input_file) as wfm:
+        if raw and wfm.nop != output["nop"]:
+            raise WfmReadError(f"{input_file} has {wfm.nop} samples per frame, the adc branch was booked with {output['nop']}")
+        time_axis = wfm.time
+        # frames 1..N (info["N"]), as with the per-frame reader
+        for waveforms, _ in progress(wfm.iter_blocks(slice(1, wfm.info["N"] + 1), raw=raw)):
+            global_event_counter += fill_block(output, waveforms, time_axis, global_event_counter, wfm.calibration)
+        fill_calibration(output, input_file, wfm, first_event, global_event_counter - first_event)
+    return global_event_counter - first_event
+
+
+def sample_layout(input_file):
+    """
+    (samples per frame, native sample dtype) of a file, used to book the raw adc branch.
+    """
+    with WfmFile(input_file) as wfm:
+        return wfm.nop, wfm.dtype.newbyteorder('=').str
+
+
+def checkpoint(output):
+    """
+    Flush the trees and save their headers in the file (replacing the previous ones),
+    so the file is readable up to the last completed cycle file if the job dies.
+    """
+    with PROFILER.timer("tree_write"):
+        for name in ("waveforms", "metadata", "calibration"):
+            output[name].AutoSave("SaveSelf")
+
+
+def write_and_close(root_file):
+    """Write the trees (flushing the last baskets) and close the file."""
+    with PROFILER.timer("tree_write"):
+        # overwrite: keep one key per tree also after checkpoints and appends
+        root_file.Write("", ROOT.TObject.kOverwrite)
+        root_file.Close()
+
+
+def stored_events(out_path):
+    """Number of entries of the waveforms tree in an existing output file."""
+    root_file = ROOT.TFile.Open(out_path)
+    if not root_file or root_file.IsZombie():
+        raise OSError(f"Could not open file {out_path}")
+    tree = root_file.Get("waveforms")
+    n_entries = int(tree.GetEntries()) if tree else 0
+    root_file.Close()
+    return n_entries
+
+
+def record_file(manifest, input_file, first_event, n_events):
+    """Add a converted file to the manifest and save it."""
+    with WfmFile(input_file) as wfm:
+        n_frames = wfm.n_frames
+    manifest.add(input_file, n_frames, first_event, n_events)
+    manifest.save()
+
+
+def process_pool(jobs, **kwargs):
+    """
+    ProcessPoolExecutor with `jobs` worker processes for the converters (kwargs go to ProcessPoolExecutor).
+    The workers are spawned, not forked: forking a process that already has ROOT initialised is not safe.
+    """
+    return ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"), **kwargs)
+
+
+def resume_manifest(out_path, settings, input_files):
+    """
+    Manifest of the existing output out_path, to append the input_files it does not list yet.
+    Returns None if there is nothing to continue: no output, or a conversion interrupted before its
+    first file was recorded (the output has nothing to keep, maybe not even its trees).
+    Raises click.ClickException if the output cannot be continued: no manifest, different settings
+    (options it was booked with), an event count that does not match the manifest, or a converted
+    file that changed since (its old events cannot be removed from the output).
+    """
+    if not os.path.exists(out_path):
+        print(f"No previous output {out_path}, converting everything")
+        return None
+    manifest = Manifest.load(manifest_path(out_path))
+    if manifest is None:
+        raise click.ClickException(f"No manifest for {out_path}, cannot resume (convert again without --resume)")
+    if not manifest.entries:
+        print(f"No converted file in the manifest of {out_path}, converting everything")
+        return None
+    try:
+        manifest.check_settings(settings)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    n_stored = stored_events(out_path)
+    if n_stored != manifest.n_events:
+        raise click.ClickException(f"{out_path} has {n_stored} events but its manifest lists {manifest.n_events} "
+                                   f"(interrupted checkpoint?), convert again without --resume")
+    changed = manifest.changed_files(input_files)
+    if changed:
+        names = ", ".join(os.path.basename(input_file) for input_file in changed)
+        raise click.ClickException(f"{len(changed)} converted files changed since they were written to {out_path} "
+                                   f"({names}), convert again without --resume")
+    return manifest
+
+
+def convert_partial(input_file, part_path, channel, run_number, first_event, tree_options, profile=False):
+    """
+    Worker for --jobs: convert one cycle file into its own partial ROOT file,
+    with event numbers starting at first_event.
+    tree_options are the keyword arguments of book_trees.
+    Returns (part_path, number of events, profiler snapshot or None).
+    """
+    if profile:
+        PROFILER.enable()
+    root_file = ROOT.TFile(part_path, "RECREATE")
+    root_file.SetCompressionLevel(1)
+    output = book_trees(channel, run_number, **tree_options)
+    n_events = convert_file(input_file, output, first_event, progress=lambda x: x)
+    write_and_close(root_file)
+    return part_path, n_events, PROFILER.snapshot() if profile else None
+
+
+def append_partial(output, part_path):
+    """
+    Append the entries of the trees of a partial ROOT file (convert_partial) to the output trees,
+    copying the compressed baskets without decoding them.
+    """
+    part_file = ROOT.TFile.Open(part_path)
+    if not part_file or part_file.IsZombie():
+        raise OSError(f"Could not open file {part_path}")
+    try:
+        for name in ("waveforms", "metadata", "calibration"):
+            output[name].CopyEntries(part_file.Get(name), -1, "fast")
+    finally:
+        part_file.Close()
+
+
+def convert_parallel(files, output, output_folder, channel, run_number, jobs, is_condor, tree_options,
+                     profile=False, first_event=0):
+    """
+    Convert the cycle files on `jobs` worker processes into partial ROOT files and append them to
+    the output trees in sorted cycle order as they complete.
+    Event number offsets are computed from the headers up front (starting at first_event), so every
+    partial file already has its final event numbers and appending is a plain copy of its entries.
+    The trees are checkpointed after every file before it is yielded, so the caller can record it in
+    the manifest and an interrupted conversion keeps (and can resume after) every file appended so far.
+    With profile=True the worker timers are added to PROFILER (summed over workers).
+    Yields: input_file, first event number, number of events (in cycle order)
+    """
+    counts = [count_events(input_file) for input_file in files]
+    offsets = first_event + np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(int) if counts else []
+    part_dir = tempfile.mkdtemp(prefix="partial_", dir=output_folder)
+    try:
+        part_paths = [os.path.join(part_dir, f"part_{i:06d}.root") for i in range(len(files))]
+        with process_pool(jobs) as pool:
+            futures = [pool.submit(convert_partial, input_file, part_path, channel, run_number, int(offset),
+                                   tree_options, profile)
+                       for input_file, part_path, offset in zip(files, part_paths, offsets)]
+            try:
+                ordered = zip(files, offsets, futures)
+                if not is_condor:
+                    ordered = tqdm.tqdm(ordered, total=len(futures))
+                for input_file, offset, future in ordered:
+                    part_path, n_events, snapshot = future.result()
+                    if snapshot is not None:
+                        PROFILER.merge(snapshot)
+                    with PROFILER.timer("merge"):
+                        append_partial(output, part_path)
+                    os.remove(part_path)
+                    checkpoint(output)
+                    yield input_file, int(offset), n_events
+            except BaseException:
+                # do not start the remaining files after a failure or an interruption
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
 
 
 @click.command()
@@ -36,25 +374,63 @@ def iter_waveforms(input_file):
 @click.option('-o', 'output_folder', type=click.Path(), default=".", help="Output folder for ROOT file")
 @click.option('-c', 'channel', type=int, default=1, help="Channel number to process")
 @click.option('--condor', is_flag=True, help="Run in batch mode, do not show progress bar")
-def main(input_folder, output_folder, channel, condor):
+@click.option('-j', '--jobs', type=int, default=1, help="Number of worker processes (one cycle file per task)")
+@click.option('--layout', type=click.Choice(["voltage", "raw"]), default="voltage",
+              help="voltage: vector<double> of volts; raw: native ADC integers in a fixed-size array + calibration tree")
+@click.option('--features', 'feature_names', default=",".join(DEFAULT_FEATURES),
+              help=f"Comma separated per-event features to store ('all' for every one): {', '.join(FEATURE_DTYPES)}")
+@click.option('--pedestal-window', default="0:100", help="Sample window start:stop for pedestal and pedestal_rms")
+@click.option('--integral-window', default=None, help="Sample window start:stop for the integral (default: whole record)")
+@click.option('--threshold', type=float, default=None, help="Threshold (V) for threshold_crossing")
+@click.option('--polarity', type=click.Choice(["negative", "positive"]), default="negative",
+              help="Pulse polarity for threshold_crossing")
+@click.option('--profile', is_flag=True, help="Print a per-stage time breakdown at the end")
+@click.option('--profile-json', type=click.Path(), default=None, help="Also dump the profile as JSON to this file")
+@click.option('--resume', '--incremental', 'resume', is_flag=True,
+              help="Append only the new cycle files (per the manifest) to an existing output")
+def main(input_folder, output_folder, channel, condor, jobs, layout, feature_names, pedestal_window,
+         integral_window, threshold, polarity, profile, profile_json, resume):
     """
-    Stream WFM frames from files and write them as entries in 2 ROOT TTree.
+    Stream WFM frames from files and write them as entries in 3 ROOT TTrees.
 
-    The output ROOT file contains two TTrees:
+    The output ROOT file contains three TTrees:
     1) "waveforms": contains the waveform data. Each entry has:
        - event_number: integer event index
        - voltage: vector of voltage samples
        - min_voltage: minimum voltage in the waveform
        - min_time: time at which minimum voltage occurs
+       - any other feature selected with --features (max_voltage, argmin, pedestal,
+         pedestal_rms, integral, threshold_crossing, ...), computed per block of events
     2) "metadata": contains metadata such as channel number and run number and time axis
+    3) "calibration": one entry per source file with ed1/id1 dim_scale and dim_offset
+       (y_scale, y_offset, t_scale, t_offset) and the event range of that file
+    Next to the ROOT file, more_waveforms_ch{channel}.root.manifest.json lists every converted
+    cycle file (size, mtime, frame count, event range) and the options of the conversion.
+    With --layout raw the "voltage" branch is replaced by "adc[N]", the native integer
+    samples; voltage = y_offset + y_scale * adc using the calibration entry of the event.
     Parameters:
     - input_folder: folder containing .wfm files
     - output_folder: folder to store the output ROOT file
     - channel: channel number to process
     - condor: if set, run in batch mode without progress bar
+    - jobs: if > 1, convert each cycle file in a worker process into a partial ROOT file
+      (in a partial_* folder next to the output) and append the partial files to the output
+      in sorted cycle order as they complete (same event numbers as serial)
+    - layout: "voltage" (default) or "raw"
+    - feature_names, pedestal_window, integral_window, threshold, polarity: feature stage configuration
+    - profile, profile_json: print / dump timers and counters of every stage (header parse,
+      disk read, decode, features, tree fill, tree write, merge)
+    - resume (--incremental): convert only the cycle files that are not in the manifest, and append
+      them with continuous event numbers. The output and the manifest are checkpointed after every
+      file (also with --jobs), so an interrupted conversion can be resumed; if it was interrupted
+      before the first file was recorded, it starts again from scratch. Resuming is refused if a converted file
+      changed (size or mtime) since, as its old events cannot be removed from the output.
 
     """
     channel = int(channel)
+    profile = profile or profile_json is not None
+    if profile:
+        PROFILER.enable()
     print(f"Input folder: {input_folder}")
     print(f"Output folder: {output_folder}")
     print(f"Processing channel: {channel}")
@@ -73,78 +449,75 @@ def main(input_folder, output_folder, channel, condor):
     os.makedirs(output_folder, exist_ok=True)
 
     out_path = os.path.join(output_folder, f"more_waveforms_ch{channel}.root")
-    root_file = ROOT.TFile(out_path, "RECREATE")
-    tree_waveforms = ROOT.TTree("waveforms", "Waveform Data")
-    tree_metadata = ROOT.TTree("metadata", "Metadata")
+    files = list_cycle_files(input_folder, channel)
+    tree_options = {
+        "layout": layout,
+        "features": parse_features(feature_names),
+        "feature_options": {
+            "pedestal_window": parse_window(pedestal_window),
+            "integral_window": parse_window(integral_window),
+            "threshold": threshold,
+            "polarity": polarity,
+        },
+    }
+    if "threshold_crossing" in tree_options["features"] and threshold is None:
+        raise click.BadParameter("threshold_crossing needs --threshold")
+    print(f"Features: {', '.join(tree_options['features'])}")
+    if layout == "raw" and files:
+        # the fixed-size adc branch is booked from the first file
+        tree_options["nop"], tree_options["sample_dtype"] = sample_layout(files[0])
+        print(f"Raw layout: {tree_options['nop']} samples of {tree_options['sample_dtype']} per event")
+
+    # the output can only be appended to with the options it was booked with
+    settings = dict(tree_options, channel=channel, run_number=run_number)
+    manifest = resume_manifest(out_path, settings, files) if resume else None
+    append = manifest is not None
+    if append:
+        skipped = len(files)
+        files = [input_file for input_file in files if not manifest.is_recorded(input_file)]
+        print(f"Resuming: {skipped - len(files)} files already converted, {len(files)} new")
+        if not files:
+            print(f"Nothing to do, {manifest.n_events} events in {out_path}")
+            return
+    else:
+        manifest = Manifest(manifest_path(out_path), settings)
+        manifest.save()
+    first_event = manifest.n_events
+
+    root_file = ROOT.TFile(out_path, "UPDATE" if append else "RECREATE")
     if is_condor:
         # Remove tqdm for non-local mode
         tqdm.tqdm = lambda x: x
-    # Split the file in smaller ones of 10GB
-    tree_waveforms.SetMaxTreeSize(10*1024**3)
-    tree_waveforms.SetAutoFlush(500_000_000)
     root_file.SetCompressionLevel(1)
+    output = book_trees(channel, run_number, existing=append, **tree_options)
 
+    global_event_counter = first_event
+    if jobs > 1 and files:
+        # every partial file is in the output and checkpointed when it is yielded
+        for input_file, file_first_event, n_events in convert_parallel(
+                files, output, output_folder, channel, run_number, jobs, is_condor, tree_options, profile,
+                first_event=first_event):
+            record_file(manifest, input_file, file_first_event, n_events)
+            global_event_counter += n_events
+    else:
+        printed_files = 0
+        for input_file in files:
+            printed_files += 1
+            print(f"Processing file: {input_file}")
+            n_events = convert_file(input_file, output, global_event_counter, progress=tqdm.tqdm)
+            # trees first: a manifest entry is only written for events that are safely in the file
+            checkpoint(output)
+            record_file(manifest, input_file, global_event_counter, n_events)
+            global_event_counter += n_events
 
-    # C-compatible 32-bit int for scalar branch
-    event_number = array('i', [0])
-    time_vec = ROOT.VecOps.RVec('double')()
-    voltage_vec = ROOT.VecOps.RVec('double')()
-    min_voltage = array('f', [0.0])
-    min_time = array('f', [0.0])
-
-    tree_waveforms.Branch("event_number", event_number, "event_number/I")
-    tree_waveforms.Branch("voltage", voltage_vec)
-    tree_waveforms.Branch("min_voltage", min_voltage, "min_voltage/F")
-    tree_waveforms.Branch("min_time", min_time, "min_time/F")
-
-    channel_vec = array('i', [channel])
-    run_number_vec = array('i', [run_number])
-    tree_metadata.Branch("channel", channel_vec, "channel/I")
-    tree_metadata.Branch("time", time_vec)
-    tree_metadata.Branch("run_number", run_number_vec, "run_number/I")
-
-    pattern = re.compile(rf'cycle_(\d+)_ch{channel}\.wfm$')  # escaped .wfm
-    files = sorted(os.listdir(input_folder))
-
-    global_event_counter = 0
-    printed_files = 0
-    for filename in files:
-        match = pattern.search(filename)
-        if not match:
-            continue
-        printed_files += 1
-        input_file = os.path.join(input_folder, filename)
-        print(f"Processing file: {input_file}")
-        # Stream frames from the file to avoid allocating large arrays
-        for time_axis, waveform in tqdm.tqdm(iter_waveforms(input_file)):
-            # prepare vectors; clear previous contents
-            if global_event_counter == 0:
-                tmpt = ROOT.std.vector('double')(time_axis.astype(np.float64).tolist())
-                # Fill the time vector only once (assumed constant across events)
-                time_vec.clear()
-                time_vec.insert(time_vec.end(), tmpt.begin(), tmpt.end())
-                tree_metadata.Fill()
-            if len(waveform) == 0:
-                global_event_counter += 1
-                continue
-            tmpv = ROOT.std.vector('double')(waveform.astype(np.float64).tolist())
-            voltage_vec.clear()
-            voltage_vec.insert(voltage_vec.end(), tmpv.begin(), tmpv.end())
-
-            event_number[0] = int(global_event_counter)
-            min_voltage[0] = float(np.min(waveform))
-            min_time[0] = float(time_axis[np.argmin(waveform)])
-            tree_waveforms.Fill()
-            global_event_counter += 1
-
-        # small progress info per file (keeps stdout readable)
-        if printed_files % 10 == 0:
-            print(f"Processed {printed_files} files, {global_event_counter} events so far...")
+            # small progress info per file (keeps stdout readable)
+            if printed_files % 10 == 0:
+                print(f"Processed {printed_files} files, {global_event_counter} events so far...")
 
     # final write
-    root_file.Write()
-    root_file.Close()
-    print(f"Wrote {global_event_counter} events to {out_path}")
+    write_and_close(root_file)
+    print(f"Wrote {global_event_counter - first_event} events to {out_path} ({global_event_counter} in total)")
+    report_profile(profile_json)
 
 
 if __name__ == "__main__":